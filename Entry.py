@@ -1,18 +1,57 @@
-from typing import List
-import re  # added import
+import re
+import sys
+from typing import Tuple
+
+# Entries are shared between users and caches, so the model is compact and treated as
+# immutable: __slots__ instead of per-instance dicts, tuples instead of lists and
+# interned strings for values that repeat across entries (parts of speech, labels).
+
+TAG_PATTERN = re.compile(r'<[^>\x00]+>')
+FIELD_SEPARATOR = "\x00"
+
+# Field presence bits; the first four match enums.Toggle
+FIELD_FLAGS = {
+    "examples": 1,
+    "synonyms": 2,
+    "antonyms": 4,
+    "collocations": 8,
+    "definition": 16,
+    "labels": 32,
+}
+
+def json_field_mask(data: dict) -> int:
+    # Fields present in a sense JSON and all of its subsenses, without building objects
+    mask = 0
+    for field, flag in FIELD_FLAGS.items():
+        if data.get(field):
+            mask |= flag
+    for subsense in data.get("subsenses") or ():
+        mask |= json_field_mask(subsense)
+    return mask
 
 def clean_unsupported_tags(text: str) -> str:
-    return re.sub(r'<[^>]+>', '', text)  # replaced removal logic to remove all tags
+    return TAG_PATTERN.sub('', text) if '<' in text else text
+
+def clean_tags_single_pass(texts: list) -> list:
+    # Strips tags from all texts of a sense with one regex pass over their joined form
+    joined = FIELD_SEPARATOR.join(texts)
+    if '<' not in joined:
+        return texts
+    cleaned = TAG_PATTERN.sub('', joined).split(FIELD_SEPARATOR)
+    if len(cleaned) != len(texts):
+        # A text contained the separator itself
+        return [clean_unsupported_tags(text) for text in texts]
+    return cleaned
 
 class Etymology:
-    def __init__(self):
-        self.lexemes: List[Lexeme] = []
+    __slots__ = ("lexemes",)
+
+    def __init__(self, lexemes: Tuple['Lexeme', ...] = ()):
+        self.lexemes = lexemes
 
     @classmethod
     def from_json(cls, data: dict) -> 'Etymology':
-        inst = cls()
-        inst.lexemes = [Lexeme.from_json(item) for item in data.get("lexemes", [])]
-        return inst
+        return cls(tuple([Lexeme.from_json(item) for item in data.get("lexemes", ())]))
 
     # Changed __repr__ for tree-like structure using two spaces instead of tabs
     def __repr__(self):
@@ -20,33 +59,36 @@ class Etymology:
         return f"Etymology:\n  lexemes:\n{lexemes_repr}"
 
 class Lexeme:
-    def __init__(self):
-        self.lemma: str = ""
-        self.part_of_speech: str = ""
-        self.senses: List[Sense] = []
+    __slots__ = ("lemma", "part_of_speech", "senses", "field_masks")
+
+    def __init__(self, lemma: str = "", part_of_speech: str = "", senses: Tuple['Sense', ...] = ()):
+        self.lemma = lemma
+        self.part_of_speech = part_of_speech
+        self.senses = senses
+        # field_masks[i] has the fields present anywhere in the first i + 1 senses
+        masks = []
+        mask = 0
+        for sense in senses:
+            mask |= sense.field_mask
+            masks.append(mask)
+        self.field_masks = tuple(masks)
 
     @classmethod
     def from_json(cls, data: dict) -> 'Lexeme':
-        inst = cls()
-        inst.lemma = data.get("lemma") or ""
-        inst.part_of_speech = data.get("part_of_speech") or ""
-        inst.senses = [Sense.from_json(s) for s in data.get("senses", [])]
-        return inst
-    
+        return cls(
+            sys.intern(data.get("lemma") or ""),
+            sys.intern(data.get("part_of_speech") or ""),
+            tuple([Sense.from_json(s) for s in data.get("senses", ())]),
+        )
+
+    def field_mask(self, senses_to_check: int) -> int:
+        if not self.field_masks or senses_to_check < 1:
+            return 0
+        return self.field_masks[min(senses_to_check, len(self.field_masks)) - 1]
+
     def has_fields(self, senses_to_check) -> dict[str, bool]:
-        fields = {}
-        def check_senses_recursively(senses):
-            for sense in senses[:senses_to_check]:
-                fields["definition"] = fields.get("definition", False) or bool(sense.definition)
-                fields["labels"] = fields.get("labels", False) or bool(sense.labels)
-                fields["examples"] = fields.get("examples", False) or bool(sense.examples)
-                fields["synonyms"] = fields.get("synonyms", False) or bool(sense.synonyms)
-                fields["antonyms"] = fields.get("antonyms", False) or bool(sense.antonyms)
-                fields["collocations"] = fields.get("collocations", False) or bool(sense.collocations)
-                if sense.subsenses:
-                    check_senses_recursively(sense.subsenses)
-        check_senses_recursively(self.senses)
-        return fields
+        mask = self.field_mask(senses_to_check)
+        return {field: bool(mask & flag) for field, flag in FIELD_FLAGS.items()}
 
     # Changed __repr__ for tree-like structure using two spaces instead of tabs
     def __repr__(self):
@@ -54,30 +96,73 @@ class Lexeme:
         return (f"Lexeme:\n  lemma: {self.lemma}\n  part_of_speech: {self.part_of_speech}\n  senses:\n{senses_repr}")
 
 class Sense:
-    def __init__(self):
-        self.definition: str = ""
-        self.labels: List[str] = []
-        self.examples: List[str] = []
-        self.synonyms: List[str] = []
-        self.antonyms: List[str] = []
-        self.collocations: List[str] = []
-        self.subsenses: List[Sense] = []
+    __slots__ = ("definition", "labels", "examples", "synonyms", "antonyms", "collocations", "field_mask", "_subsenses", "_subsenses_json")
+
+    def __init__(
+        self,
+        definition: str = "",
+        labels: Tuple[str, ...] = (),
+        examples: Tuple[str, ...] = (),
+        synonyms: Tuple[str, ...] = (),
+        antonyms: Tuple[str, ...] = (),
+        collocations: Tuple[str, ...] = (),
+        subsenses: Tuple['Sense', ...] = (),
+        subsenses_json: list = None,
+        field_mask: int = None,
+    ):
+        self.definition = definition
+        self.labels = labels
+        self.examples = examples
+        self.synonyms = synonyms
+        self.antonyms = antonyms
+        self.collocations = collocations
+        # Subsenses given as JSON are only parsed when something descends into them
+        self._subsenses = subsenses if not subsenses_json else None
+        self._subsenses_json = subsenses_json or None
+        if field_mask is None:
+            field_mask = 0
+            for field, flag in FIELD_FLAGS.items():
+                if getattr(self, field):
+                    field_mask |= flag
+            for subsense in subsenses:
+                field_mask |= subsense.field_mask
+        self.field_mask = field_mask
+
+    @property
+    def subsenses(self) -> Tuple['Sense', ...]:
+        if self._subsenses is None:
+            self._subsenses = tuple([Sense.from_json(sub) for sub in self._subsenses_json])
+            self._subsenses_json = None
+        return self._subsenses
 
     @classmethod
     def from_json(cls, data: dict) -> 'Sense':
-        inst = cls()
-        inst.definition = clean_unsupported_tags(data.get("definition") or "")
-        inst.labels = [clean_unsupported_tags(label) for label in data.get("labels", [])]
-        inst.examples = [clean_unsupported_tags(example) for example in data.get("examples", [])]
-        inst.synonyms = [clean_unsupported_tags(synonym) for synonym in data.get("synonyms", [])]
-        inst.antonyms = [clean_unsupported_tags(antonym) for antonym in data.get("antonyms", [])]
-        inst.collocations = [clean_unsupported_tags(collocation) for collocation in data.get("collocations", [])]
-        inst.subsenses = [cls.from_json(sub) for sub in data.get("subsenses", [])]
-        return inst
-    
+        labels = data.get("labels") or ()
+        examples = data.get("examples") or ()
+        synonyms = data.get("synonyms") or ()
+        antonyms = data.get("antonyms") or ()
+        collocations = data.get("collocations") or ()
+        subsenses = data.get("subsenses")
+        texts = clean_tags_single_pass([data.get("definition") or "", *labels, *examples, *synonyms, *antonyms, *collocations])
+
+        examples_start = 1 + len(labels)
+        synonyms_start = examples_start + len(examples)
+        antonyms_start = synonyms_start + len(synonyms)
+        collocations_start = antonyms_start + len(antonyms)
+        return cls(
+            texts[0],
+            tuple([sys.intern(label) for label in texts[1:examples_start]]),
+            tuple(texts[examples_start:synonyms_start]),
+            tuple(texts[synonyms_start:antonyms_start]),
+            tuple(texts[antonyms_start:collocations_start]),
+            tuple(texts[collocations_start:]),
+            subsenses_json=subsenses,
+            field_mask=json_field_mask(data),
+        )
+
     def get_definition_with_labels(self) -> str:
         return f"{self.definition} ({', '.join(self.labels)})" if self.labels else self.definition
-    
+
     # Changed __repr__ for tree-like structure using two spaces instead of tabs
     def __repr__(self):
         subsenses_repr = "\n".join("  " + repr(sub).replace("\n", "\n  ") for sub in self.subsenses) if self.subsenses else "  None"
@@ -86,29 +171,32 @@ class Sense:
                 f"subsenses:\n{subsenses_repr}")
 
 class Entry:
-    def __init__(self):
-        self.redirected_from: str = ""
-        self.entry: str = ""
-        self.etymologies: List[Etymology] = []
-        
+    # __weakref__ lets per-entry render caches be dropped together with the entry
+    __slots__ = ("redirected_from", "entry", "etymologies", "__weakref__")
+
+    def __init__(self, redirected_from: str = "", entry: str = "", etymologies: Tuple[Etymology, ...] = ()):
+        self.redirected_from = redirected_from
+        self.entry = entry
+        self.etymologies = etymologies
+
     @classmethod
     def from_json(cls, data: dict) -> 'Entry':
-        inst = cls()
-        inst.redirected_from = data.get("redirected_from") or ""
-        inst.entry = data.get("entry") or ""
-        inst.etymologies = [Etymology.from_json(ety) for ety in data.get("etymologies", [])]
-        return inst
-    
+        return cls(
+            data.get("redirected_from") or "",
+            data.get("entry") or "",
+            tuple([Etymology.from_json(ety) for ety in data.get("etymologies", ())]),
+        )
+
     def lexeme_amount(self) -> int:
         return sum(len(etymology.lexemes) for etymology in self.etymologies)
-    
+
     def get_lexeme_by_index(self, index: int) -> Lexeme:
         for etymology in self.etymologies:
             if index < len(etymology.lexemes):
                 return etymology.lexemes[index]
             index -= len(etymology.lexemes)
         return None
-        
+
     # Changed __repr__ for tree-like structure using two spaces instead of tabs
     def __repr__(self):
         etymologies_repr = "\n".join("  " + repr(ety).replace("\n", "\n  ") for ety in self.etymologies) if self.etymologies else "  None"
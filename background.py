@@ -0,0 +1,44 @@
+import asyncio
+import logging
+import os
+from typing import Coroutine
+
+# Fire-and-forget work off a handler's critical path (typing indicator, removing the
+# previous keyboard). Every task has a time limit, its errors are logged instead of
+# reaching the handler, and when too many are pending new ones are skipped: they are
+# cosmetic, so losing one under load is better than piling them up.
+
+class BackgroundTasks:
+    def __init__(self, timeout: float = None, limit: int = None):
+        self.timeout = timeout or float(os.getenv("BACKGROUND_TASK_TIMEOUT", 5))
+        self.limit = limit or int(os.getenv("BACKGROUND_TASK_LIMIT", 500))
+        self.tasks: set[asyncio.Task] = set()
+        self.stats = {"started": 0, "skipped": 0, "timed_out": 0, "failed": 0}
+
+    def spawn(self, coroutine: Coroutine, name: str) -> asyncio.Task:
+        if len(self.tasks) >= self.limit:
+            self.stats["skipped"] += 1
+            coroutine.close()
+            return None
+        self.stats["started"] += 1
+        task = asyncio.create_task(self._run(coroutine, name), name=name)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _run(self, coroutine: Coroutine, name: str) -> None:
+        try:
+            await asyncio.wait_for(coroutine, self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            logging.warning(f"Background task '{name}' timed out after {self.timeout}s")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            logging.warning(f"Background task '{name}' failed: {e}")
+
+    async def shutdown(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
@@ -0,0 +1,110 @@
+import asyncio
+import html
+import os
+import re
+from typing import Awaitable, Callable, Optional
+from Entry import Entry
+from entry_cache import normalize_key
+from resilience import UpstreamError
+
+# Lookups of a whole list of words in one message ("apple, pear, quince" or one word
+# per line). The words are split off, de-duplicated and resolved concurrently with a
+# bounded fan-out, so the batch takes about as long as its slowest word. Each word
+# gets a one-line summary (part of speech and first sense); the lines are packed into
+# as few messages as fit Telegram's limit, each with buttons to open the full entries.
+# Only commas, semicolons and line breaks separate words, since a space can be part of
+# a headword ("ice cream").
+
+MESSAGE_LIMIT = 4096
+SEPARATORS = re.compile(r"[,;，；\n]+")
+LIST_MARKER = re.compile(r"^\s*(?:[-*•·]|\d+[.)])\s+")
+TAG = re.compile(r"<[^>]+>")
+
+BATCH_MAX_WORDS = int(os.getenv("BATCH_MAX_WORDS", 30))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 16))
+BATCH_SUMMARY_LENGTH = int(os.getenv("BATCH_SUMMARY_LENGTH", 160))
+
+def split_words(text: str) -> list[str]:
+    # The distinct words of a message in order; a single word for an ordinary lookup
+    words, seen = [], set()
+    for part in SEPARATORS.split(text):
+        word = normalize_key(LIST_MARKER.sub("", part))
+        if word and word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+class BatchResult:
+    __slots__ = ("word", "entry_key", "entry", "failed")
+
+    def __init__(self, word: str, entry_key: str = None, entry: Entry = None, failed: bool = False):
+        self.word = word
+        self.entry_key = entry_key or word
+        self.entry = entry
+        self.failed = failed
+
+    @property
+    def found(self) -> bool:
+        return self.entry is not None and bool(self.entry.entry)
+
+async def resolve_batch(words: list[str], resolve: Callable[[str], Awaitable[tuple[str, Entry]]],
+                        concurrency: int = None) -> list[BatchResult]:
+    # Results in the order of the words; a failed lookup fails only its own word
+    semaphore = asyncio.Semaphore(concurrency or BATCH_CONCURRENCY)
+
+    async def lookup(word: str) -> BatchResult:
+        async with semaphore:
+            try:
+                entry_key, entry = await resolve(word)
+            except UpstreamError:
+                return BatchResult(word, failed=True)
+        return BatchResult(word, entry_key, entry)
+
+    return await asyncio.gather(*(lookup(word) for word in words))
+
+def plain_text(fragment: str) -> str:
+    return html.unescape(TAG.sub("", fragment)).strip()
+
+def first_sense(entry: Entry) -> tuple[str, str]:
+    # Part of speech and definition of the first sense with a definition
+    lexeme = entry.get_lexeme_by_index(0)
+    for sense in lexeme.senses:
+        for candidate in (sense, *sense.subsenses[:1]):
+            if candidate.definition:
+                return lexeme.part_of_speech, candidate.get_definition_with_labels()
+    return lexeme.part_of_speech, ""
+
+def summary_line(result: BatchResult, not_found: str, unavailable: str, length: int = None) -> str:
+    # HTML for one word; the definition is cut as plain text, so no tag or entity is split
+    word = f"<b>{html.escape(result.entry_key)}</b>"
+    if result.failed:
+        return f"{word} — <i>{html.escape(unavailable)}</i>"
+    if not result.found:
+        return f"{word} — <i>{html.escape(not_found)}</i>"
+    part_of_speech, definition = first_sense(result.entry)
+    definition = plain_text(definition)
+    length = length or BATCH_SUMMARY_LENGTH
+    if len(definition) > length:
+        definition = definition[:length - 1].rstrip() + "…"
+    line = f"{word} <i>{html.escape(part_of_speech)}</i>"
+    return f"{line} — {html.escape(definition)}" if definition else line
+
+def pack_lines(lines: list[str], limit: int = MESSAGE_LIMIT) -> list[list[int]]:
+    # Indices of the lines going into each message, in order, every message within the limit
+    messages, current, size = [], [], 0
+    for index, line in enumerate(lines):
+        added = len(line) + (1 if current else 0)
+        if current and size + added > limit:
+            messages.append(current)
+            current, size = [], 0
+            added = len(line)
+        current.append(index)
+        size += added
+    if current:
+        messages.append(current)
+    return messages
+
+def truncated_words(words: list[str], limit: int = None) -> tuple[list[str], Optional[int]]:
+    # The words to look up and, when the list was cut, how many were
+    limit = limit or BATCH_MAX_WORDS
+    return (words[:limit], limit) if len(words) > limit else (words, None)
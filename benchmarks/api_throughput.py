@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+import json
+import time
+import requests
+from stub_api import start_stub_in_thread
+from wikked_api import WikkedAPI
+
+# Compares the old blocking lookup path (requests.get, one at a time) with the pooled
+# async client (concurrent lookups) against the local stub.
+# Usage: python -m benchmarks.api_throughput --lookups 200 --latency 0.05
+
+def blocking_lookups(base_url: str, words: list[str]) -> float:
+    start = time.perf_counter()
+    for word in words:
+        json.loads(requests.get(f"http://{base_url}/entries/{word}").text)
+    return time.perf_counter() - start
+
+async def async_lookups(base_url: str, words: list[str], concurrency: int) -> float:
+    wikked_api = WikkedAPI(base_url=base_url, scheme="http", max_concurrency=concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*(wikked_api.fetch(word) for word in words))
+    elapsed = time.perf_counter() - start
+    await wikked_api.close()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    _, port = start_stub_in_thread(latency=args.latency)
+    base_url = f"127.0.0.1:{port}"
+    words = [f"word{i}" for i in range(args.lookups)]
+
+    blocking = blocking_lookups(base_url, words)
+    pooled = asyncio.run(async_lookups(base_url, words, args.concurrency))
+    print(f"blocking requests: {args.lookups / blocking:8.1f} lookups/s ({blocking:.2f}s)")
+    print(f"async pooled:      {args.lookups / pooled:8.1f} lookups/s ({pooled:.2f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import itertools
+import time
+from benchmarks.fake_telegram import FakeTelegramRequest, FakeTelegramState
+from benchmarks.load import TOKEN, callback_update, message_update, start_backends
+from benchmarks.report import latency_summary
+
+# A learner's word list, sent once as one message and once word by word, through the
+# real Application with the dictionary stub answering after --api-latency. Reports how
+# long each took, the Bot API calls it cost and how many messages the batch reply
+# needed, then presses one of the batch's word buttons, which must open that entry in
+# a new message and leave the batch's keyboard alone.
+# Usage: python -m benchmarks.batch --words 25 --api-latency 0.1
+
+async def run(words: int = 25, api_latency: float = 0.1, rounds: int = 5) -> dict[str, float]:
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+    import bot
+    from send_scheduler import SendScheduler
+
+    telegram = FakeTelegramState()
+    application = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .request(FakeTelegramRequest(telegram))
+        .get_updates_request(FakeTelegramRequest(telegram))
+        .rate_limiter(SendScheduler(global_rate=1e9, chat_rate=1e9, chat_burst=1e9, group_rate=1e9, group_burst=1e9))
+        .build()
+    )
+    bot.add_handlers(application)
+    await application.initialize()
+    update_ids = itertools.count(1)
+
+    async def process(data: dict) -> float:
+        start = time.perf_counter()
+        await application.process_update(Update.de_json(data, application.bot))
+        return time.perf_counter() - start
+
+    batch, one_by_one, replies = [], [], []
+    bot_calls_batch = bot_calls_single = 0
+    for round_number in range(rounds):
+        # Fresh words every round, so every lookup goes upstream; some don't exist
+        word_list = [f"b{round_number}w{i}" if i % 7 else f"zzb{round_number}w{i}" for i in range(words)]
+        chat_id = 60_000 + round_number
+        calls = sum(telegram.calls.values())
+        batch.append(await process(message_update(next(update_ids), chat_id, ",\n".join(word_list))))
+        await bot.background_tasks.shutdown()
+        bot_calls_batch += sum(telegram.calls.values()) - calls
+        replies.append(sum(1 for endpoint, _, _ in telegram.history[chat_id] if endpoint == "sendMessage"))
+
+        calls = sum(telegram.calls.values())
+        start = time.perf_counter()
+        for word in word_list:
+            await process(message_update(next(update_ids), chat_id + 1000, word.replace("b", "s", 1)))
+        one_by_one.append(time.perf_counter() - start)
+        await bot.background_tasks.shutdown()
+        bot_calls_single += sum(telegram.calls.values()) - calls
+
+    # Drill-down from the last batch
+    message_id, buttons = telegram.last_keyboard(chat_id)
+    sent_before = len(telegram.history[chat_id])
+    await process(callback_update(next(update_ids), chat_id, message_id, buttons[0]))
+    await bot.background_tasks.shutdown()
+    opened = telegram.history[chat_id][sent_before:]
+    keyboard_kept = not any(endpoint == "editMessageReplyMarkup" and sent_id == message_id for endpoint, sent_id, _ in opened)
+
+    await application.shutdown()
+    await bot.wikked_api.close()
+
+    results = {}
+    results.update(latency_summary("batch.batch", batch))
+    results.update(latency_summary("batch.one_by_one", one_by_one))
+    results["batch.bot_api_calls.batch"] = bot_calls_batch / rounds
+    results["batch.bot_api_calls.one_by_one"] = bot_calls_single / rounds
+    results["batch.reply_messages"] = sum(replies) / rounds
+    results["batch.drill_down_opened"] = sum(1 for endpoint, _, _ in opened if endpoint == "sendMessage")
+    results["batch.drill_down_keyboard_kept"] = int(keyboard_kept)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=int, default=25)
+    parser.add_argument("--api-latency", type=float, default=0.1)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    start_backends(args.api_latency)
+    for metric, value in asyncio.run(run(args.words, args.api_latency, args.rounds)).items():
+        print(f"{metric:<40} {value:10.2f}")
+
+if __name__ == "__main__":
+    main()
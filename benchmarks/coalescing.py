@@ -0,0 +1,36 @@
+import argparse
+import asyncio
+import time
+from stub_api import start_stub_in_thread
+from wikked_api import WikkedAPI
+
+# Load test for request coalescing: N concurrent lookups of the same word against the
+# local stub must reach it as exactly one upstream request (one per flight when the
+# lookups exceed the per-key waiter limit).
+# Usage: python -m benchmarks.coalescing --lookups 500 --latency 0.1
+
+async def identical_lookups(base_url: str, word: str, lookups: int) -> tuple[float, WikkedAPI, set[int]]:
+    wikked_api = WikkedAPI(base_url=base_url, scheme="http")
+    start = time.perf_counter()
+    entries = await asyncio.gather(*(wikked_api.fetch(word) for _ in range(lookups)))
+    elapsed = time.perf_counter() - start
+    await wikked_api.close()
+    return elapsed, wikked_api, {id(entry) for entry in entries}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--word", default="trending")
+    args = parser.parse_args()
+
+    state, port = start_stub_in_thread(latency=args.latency)
+    elapsed, wikked_api, entries = asyncio.run(identical_lookups(f"127.0.0.1:{port}", args.word, args.lookups))
+    print(f"{args.lookups} concurrent lookups in {elapsed:.3f}s")
+    print(f"upstream requests: {state.requests}, parsed entries: {len(entries)}, flight stats: {wikked_api.flights.stats}")
+    expected = -(-args.lookups // wikked_api.flights.max_waiters)
+    if state.requests != expected or len(entries) != expected:
+        raise SystemExit(f"expected {expected} upstream request(s), each parsed into one shared Entry")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import asyncio
+import itertools
+import time
+from benchmarks.fake_telegram import FakeTelegramRequest, FakeTelegramState
+from benchmarks.load import TOKEN, callback_update, message_update, start_backends
+from benchmarks.report import latency_summary
+
+# Throughput of the update processor at different concurrency caps, and a check that
+# per-chat ordering holds. Every chat sends a burst of lookups followed by a burst of
+# identical presses of one button, all queued at once through Application.update_queue
+# like a webhook delivering a backlog. Afterwards, per chat:
+#   - replies must come in the order the words were sent,
+#   - the keyboard of every reply but the last must have been removed, each once, and
+#     user_data must point at the last reply (lost updates of LAST_MESSAGE_ID show up here),
+#   - the button burst must have edited the message exactly once (chats whose last
+#     reply has no keyboard are counted in pressed_chats and not pressed).
+# "plain" is PTB's SimpleUpdateProcessor with the largest cap, for comparison.
+# Usage: python -m benchmarks.concurrency --chats 50 --api-latency 0.05
+
+async def run_once(label: str, processor, chats: int, lookups: int, presses: int, latency: float, run_id: str) -> dict[str, float]:
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+    import bot
+    from send_scheduler import SendScheduler
+
+    telegram = FakeTelegramState(latency)
+    application = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .request(FakeTelegramRequest(telegram))
+        .get_updates_request(FakeTelegramRequest(telegram))
+        .rate_limiter(SendScheduler(global_rate=1e9, chat_rate=1e9, chat_burst=1e9, group_rate=1e9, group_burst=1e9))
+        .concurrent_updates(processor)
+        .build()
+    )
+    bot.add_handlers(application)
+    await application.initialize()
+    await application.start()
+
+    update_ids = itertools.count(1)
+    chat_ids = range(50_000, 50_000 + chats)
+    words = {chat_id: [f"{run_id}w{chat_id}n{i}" for i in range(lookups)] for chat_id in chat_ids}
+    finished = asyncio.Event()
+    latencies = []
+    expected = chats * lookups
+    handled = 0
+
+    original = application.process_update
+    async def timed_process_update(update) -> None:
+        nonlocal handled
+        start = time.perf_counter()
+        await original(update)
+        latencies.append(time.perf_counter() - start)
+        handled += 1
+        if handled == expected:
+            finished.set()
+    application.process_update = timed_process_update
+
+    start = time.perf_counter()
+    for i in range(lookups):
+        for chat_id in chat_ids:
+            await application.update_queue.put(Update.de_json(message_update(next(update_ids), chat_id, words[chat_id][i]), application.bot))
+    await finished.wait()
+    elapsed = time.perf_counter() - start
+    while bot.background_tasks.tasks:
+        await asyncio.sleep(0.01)
+
+    # Button bursts: only the first press of each chat should do anything. A stub entry
+    # with one short sense gets no keyboard, so its chat has nothing to press.
+    pressed = {}
+    for chat_id in chat_ids:
+        message_id, buttons = telegram.last_keyboard(chat_id)
+        if buttons:
+            pressed[chat_id] = (message_id, buttons[0])
+    # Merged presses never reach process_update; the rest settle during the sleep below
+    expected += len(pressed)
+    finished.clear()
+    for chat_id, (message_id, button) in pressed.items():
+        for _ in range(presses):
+            await application.update_queue.put(Update.de_json(callback_update(next(update_ids), chat_id, message_id, button), application.bot))
+    if pressed:
+        await finished.wait()
+    await asyncio.sleep(0.05)
+    await application.stop()
+    await application.shutdown()
+
+    misordered = lost = duplicated_edits = 0
+    for chat_id in chat_ids:
+        history = telegram.history.get(chat_id, [])
+        replies = [(message_id, text) for endpoint, message_id, text in history if endpoint == "sendMessage"]
+        if [text.split(":", 1)[0].strip('"') for _, text in replies] != words[chat_id]:
+            misordered += 1
+        removed = [message_id for endpoint, message_id, text in history if endpoint == "editMessageReplyMarkup"]
+        reply_ids = [message_id for message_id, _ in replies]
+        if sorted(removed) != sorted(reply_ids[:-1]) or application.user_data[chat_id].get(bot.UserData.LAST_MESSAGE_ID) != reply_ids[-1]:
+            lost += 1
+        edits = sum(1 for endpoint, *_ in history if endpoint == "editMessageText")
+        duplicated_edits += max(0, edits - 1) if chat_id in pressed else edits
+
+    results = {
+        f"concurrency.{label}.updates_per_s": chats * lookups / elapsed,
+        f"concurrency.{label}.misordered_chats": misordered,
+        f"concurrency.{label}.lost_state_chats": lost,
+        f"concurrency.{label}.duplicated_edits": duplicated_edits,
+        f"concurrency.{label}.pressed_chats": len(pressed),
+    }
+    results.update(latency_summary(f"concurrency.{label}.update", latencies))
+    return results
+
+async def run(chats: int = 50, lookups: int = 4, presses: int = 3, latency: float = 0.02, caps: tuple = (1, 4, 16, 64)) -> dict[str, float]:
+    from telegram.ext import SimpleUpdateProcessor
+    from update_processor import ChatOrderedUpdateProcessor
+
+    results = {}
+    for cap in caps:
+        results.update(await run_once(f"cap{cap}", ChatOrderedUpdateProcessor(max_running=cap), chats, lookups, presses, latency, f"c{cap}"))
+    results.update(await run_once("plain", SimpleUpdateProcessor(max(caps)), chats, lookups, presses, latency, "plain"))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--lookups", type=int, default=4, help="messages per chat, sent at once")
+    parser.add_argument("--presses", type=int, default=3, help="identical button presses per chat, sent at once")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated Bot API round-trip, seconds")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="simulated dictionary API latency, seconds")
+    parser.add_argument("--caps", default="1,4,16,64")
+    args = parser.parse_args()
+
+    start_backends(args.api_latency)
+    caps = tuple(int(cap) for cap in args.caps.split(","))
+    results = asyncio.run(run(args.chats, args.lookups, args.presses, args.latency, caps))
+    for metric, value in results.items():
+        print(f"{metric:<44} {value:10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import gc
+import time
+import tracemalloc
+from Entry import Entry
+from benchmarks.fixtures import corpus_entry_jsons
+
+# Parse time and retained memory of the Entry model over the fixture corpus.
+# Usage: python -m benchmarks.entry_model --size 500
+
+def parse_time(corpus: list[dict], rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for entry_json in corpus:
+            Entry.from_json(entry_json)
+    return (time.perf_counter() - start) / (rounds * len(corpus))
+
+def bytes_per_entry(corpus: list[dict]) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    entries = [Entry.from_json(entry_json) for entry_json in corpus]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del entries
+    return retained / len(corpus)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = corpus_entry_jsons(args.size)
+    print(f"entries: {len(corpus)}")
+    print(f"parse time: {parse_time(corpus, args.rounds) * 1e6:.1f} us/entry")
+    print(f"memory: {bytes_per_entry(corpus):.0f} bytes/entry")
+
+if __name__ == "__main__":
+    main()
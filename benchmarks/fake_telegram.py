@@ -0,0 +1,73 @@
+import asyncio
+import itertools
+import json
+import time
+from typing import Optional
+from telegram.request import BaseRequest, RequestData
+
+# In-process stand-in for the Bot API: a BaseRequest that answers every call locally,
+# so a real Application and its ExtBot can run without network access. Sent and
+# edited messages are kept per chat, so a load generator can press the buttons of
+# the last keyboard the bot showed. An optional latency simulates the round-trip.
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+
+class FakeTelegramState:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: dict[str, int] = {}
+        self.message_ids = itertools.count(1000)
+        # chat_id -> (message_id, reply_markup) of the last message with a keyboard
+        self.keyboards: dict[int, tuple[int, Optional[dict]]] = {}
+        # chat_id -> (endpoint, message_id, text) of every message sent or edited, in order
+        self.history: dict[int, list[tuple[str, int, str]]] = {}
+
+    def last_keyboard(self, chat_id: int) -> tuple[int, list[str]]:
+        message_id, markup = self.keyboards.get(chat_id, (0, None))
+        buttons = [button["callback_data"] for row in (markup or {}).get("inline_keyboard", ()) for button in row]
+        return message_id, buttons
+
+class FakeTelegramRequest(BaseRequest):
+    def __init__(self, state: FakeTelegramState):
+        self.state = state
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData = None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None) -> tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        self.state.calls[endpoint] = self.state.calls.get(endpoint, 0) + 1
+        if self.state.latency:
+            await asyncio.sleep(self.state.latency)
+        parameters = request_data.parameters if request_data else {}
+        result = self.respond(endpoint, parameters)
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+    def respond(self, endpoint: str, parameters: dict):
+        if endpoint == "getMe":
+            return BOT_USER
+        if endpoint in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            chat_id = int(parameters.get("chat_id", 0))
+            message_id = parameters.get("message_id") or next(self.state.message_ids)
+            markup = parameters.get("reply_markup")
+            if isinstance(markup, str):
+                markup = json.loads(markup)
+            if markup or self.state.keyboards.get(chat_id, (None,))[0] == message_id:
+                self.state.keyboards[chat_id] = (message_id, markup)
+            self.state.history.setdefault(chat_id, []).append((endpoint, message_id, parameters.get("text", "")))
+            message = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": parameters.get("text", ""),
+            }
+            if markup:
+                message["reply_markup"] = markup
+            return message
+        # sendChatAction, answerCallbackQuery, setMyCommands, deleteWebhook...
+        return True
@@ -0,0 +1,49 @@
+from stub_api import make_entry_json
+
+# Synthetic entries shaped like the biggest Wiktionary pages (many etymologies,
+# lexemes and nested senses), generated with the stub's deterministic generator.
+LARGE_ENTRY_SHAPES = {
+    "set": {"etymologies": 3, "lexemes": 4, "senses": 60},
+    "run": {"etymologies": 2, "lexemes": 4, "senses": 45},
+    "go": {"etymologies": 3, "lexemes": 3, "senses": 35},
+}
+
+def large_entry_jsons() -> dict[str, dict]:
+    return {word: make_entry_json(word, **shape) for word, shape in LARGE_ENTRY_SHAPES.items()}
+
+def corpus_entry_jsons(size: int = 500) -> list[dict]:
+    # A mixed corpus: mostly ordinary entries plus the large ones
+    return [make_entry_json(f"word{i}") for i in range(size)] + list(large_entry_jsons().values())
+
+def nested_sense_json(word: str, depth: int) -> dict:
+    sense = {"definition": f"Level {depth} sense of {word}.", "examples": [f"{word} at level {depth}"]}
+    if depth:
+        sense["subsenses"] = [nested_sense_json(word, depth - 1) for _ in range(2)]
+    return sense
+
+def pathological_entry_jsons() -> dict[str, dict]:
+    # Entries that stress one code path each: nesting past SUBSENSE_MAX_DEPTH, markup
+    # heavy text, more etymologies than roman_numerals covers with dozens of lexeme
+    # buttons, and very long synonym lists
+    tag_soup = "".join(f"<span class='c{i}'><i>part {i}</i></span> " for i in range(200))
+    return {
+        "deep": {"entry": "deep", "etymologies": [{"lexemes": [
+            {"lemma": "deep", "part_of_speech": "adjective", "senses": [nested_sense_json("deep", 8) for _ in range(3)]},
+        ]}]},
+        "tags": {"entry": "tags", "etymologies": [{"lexemes": [
+            {"lemma": "tags", "part_of_speech": "noun", "senses": [
+                {"definition": tag_soup, "examples": [tag_soup] * 5, "synonyms": ["<b>label</b>"] * 20} for _ in range(10)
+            ]},
+        ]}]},
+        "wide": {"entry": "wide", "etymologies": [
+            {"lexemes": [{"lemma": "wide", "part_of_speech": pos, "senses": [{"definition": f"Sense {i} of wide."}]} for i, pos in enumerate(("noun", "verb", "adjective"))]}
+            for _ in range(12)
+        ]},
+        "lists": {"entry": "lists", "etymologies": [{"lexemes": [
+            {"lemma": "lists", "part_of_speech": "noun", "senses": [
+                {"definition": "A sense with long lists.", "synonyms": [f"synonym{i}" for i in range(300)],
+                 "antonyms": [f"antonym{i}" for i in range(300)], "collocations": [f"collocation {i}" for i in range(100)]}
+                for _ in range(8)
+            ]},
+        ]}]},
+    }
@@ -0,0 +1,66 @@
+import argparse
+import random
+import time
+import tracemalloc
+from prefix_index import PrefixIndex
+from benchmarks.report import latency_summary
+
+# Build time, memory footprint and query rate of the inline prefix index. Words are
+# random lowercase strings with every 20th one capitalized; queries are prefixes of
+# 1-6 characters of existing words, with a popularity-skewed set of looked-up words.
+# Usage: python -m benchmarks.inline_index --words 1000000
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+def generate_words(count: int, rng: random.Random) -> list[str]:
+    words = set()
+    while len(words) < count:
+        word = "".join(rng.choices(LETTERS, k=rng.randint(3, 12)))
+        words.add(word.capitalize() if len(words) % 20 == 0 else word)
+    return list(words)
+
+def run(words: int = 1_000_000, queries: int = 100_000, seed: int = 1) -> dict[str, float]:
+    rng = random.Random(seed)
+    headwords = generate_words(words, rng)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = PrefixIndex()
+    index.build(headwords)
+    build_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    popular = rng.sample(headwords, min(5000, words))
+    for rank, word in enumerate(popular):
+        for _ in range(len(popular) // (rank + 1)):
+            index.record(word)
+
+    prefixes = [word[:rng.randint(1, 6)] for word in rng.choices(headwords, k=queries)]
+    latencies = []
+    start = time.perf_counter()
+    for prefix in prefixes:
+        query_start = time.perf_counter()
+        index.search(prefix)
+        latencies.append(time.perf_counter() - query_start)
+    elapsed = time.perf_counter() - start
+
+    results = {
+        "inline_index.build_s": build_seconds,
+        "inline_index.build_peak_mb": peak / 2**20,
+        "inline_index.memory_mb": index.memory_bytes() / 2**20,
+        "inline_index.queries_per_s": queries / elapsed,
+    }
+    results.update(latency_summary("inline_index.query", latencies))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=100_000)
+    args = parser.parse_args()
+    for metric, value in run(args.words, args.queries).items():
+        print(f"{metric:<36} {value:12.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from key_pool import ApiKey, KeyPool, RequestPriority
+from resilience import UpstreamError
+from stub_api import start_stub_in_thread
+from wikked_api import WikkedAPI
+from benchmarks.report import latency_summary
+
+# Runs WikkedAPI with a key pool against the stub enforcing per-key limits:
+#   spread     three keys of 10 requests/s each, the pool keeping 10% headroom;
+#              lookups should go through at about 27/s without a 429
+#   throttled  the pool is told 20/s per key while the stub allows 10: keys get
+#              benched on 429 and every lookup still succeeds
+#   priority   a /random refill flood of background requests is running while users
+#              look words up; their latency should stay near the key rate, not the flood
+#   quota      small quotas: background requests stop at the reserve, users get the
+#              rest, then fail fast; a restarted pool knows without asking upstream
+# Usage: python -m benchmarks.key_pool [--lookups 150]
+
+KEYS = ["key-a", "key-b", "key-c"]
+
+def pool(rate: float, state_path: str = "", keys: list[str] = KEYS, port: int = 0) -> KeyPool:
+    return KeyPool([ApiKey(key, f"127.0.0.1:{port}", rate, rate) for key in keys], state_path=state_path)
+
+def client(port: int, rate: float, state_path: str = "", keys: list[str] = KEYS) -> WikkedAPI:
+    return WikkedAPI(base_url=f"127.0.0.1:{port}", scheme="http", keys=pool(rate, state_path, keys, port))
+
+async def lookups(api: WikkedAPI, words: list[str], priority: int = RequestPriority.INTERACTIVE,
+                  concurrency: int = 16) -> tuple[list[float], int]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def lookup(word: str) -> None:
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                if priority == RequestPriority.INTERACTIVE:
+                    await api.fetch(word)
+                else:
+                    await api.fetch_random(priority)
+            except UpstreamError:
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(lookup(word) for word in words))
+    return latencies, failures
+
+def report(name: str, api: WikkedAPI, state, latencies: list[float], failures: int, elapsed: float = None) -> dict[str, float]:
+    results = latency_summary(f"key_pool.{name}", latencies)
+    results[f"key_pool.{name}.failed"] = failures
+    results[f"key_pool.{name}.stub_429s"] = state.faults["throttled"] + state.faults["over_quota"]
+    if elapsed:
+        results[f"key_pool.{name}.lookups_per_second"] = len(latencies) / elapsed
+    for key in api.keys.keys:
+        results[f"key_pool.{name}.requests.{key.id}"] = key.stats["requests"]
+    return results
+
+async def run(count: int = 150) -> dict[str, float]:
+    logging.getLogger("tornado.access").setLevel(logging.CRITICAL)
+    results = {}
+
+    state, port = start_stub_in_thread(latency=0.01, keys=KEYS, key_rate=10)
+    api = client(port, rate=9)
+    start = time.perf_counter()
+    latencies, failures = await lookups(api, [f"spread{i}" for i in range(count)])
+    results.update(report("spread", api, state, latencies, failures, time.perf_counter() - start))
+    await api.close()
+
+    state, port = start_stub_in_thread(latency=0.01, keys=KEYS, key_rate=10)
+    api = client(port, rate=20)
+    start = time.perf_counter()
+    latencies, failures = await lookups(api, [f"throttled{i}" for i in range(count)])
+    results.update(report("throttled", api, state, latencies, failures, time.perf_counter() - start))
+    await api.close()
+
+    for background in (False, True):
+        name = "priority_flood" if background else "priority_idle"
+        state, port = start_stub_in_thread(latency=0.01, keys=KEYS, key_rate=10)
+        api = client(port, rate=9)
+        flood = asyncio.create_task(lookups(api, [""] * count * 2, RequestPriority.BACKGROUND, concurrency=32)) if background else None
+        await asyncio.sleep(0.2)
+        # Users arrive one every 100ms, well within the keys' combined rate
+        latencies, failures = [], 0
+        for i in range(count // 5):
+            user_latencies, user_failures = await lookups(api, [f"{name}{i}"])
+            latencies += user_latencies
+            failures += user_failures
+            await asyncio.sleep(0.1)
+        results.update(report(name, api, state, latencies, failures))
+        if flood is not None:
+            flood.cancel()
+            await asyncio.gather(flood, return_exceptions=True)
+        await api.close()
+
+    state_path = os.path.join(tempfile.mkdtemp(prefix="key-pool-"), "api_keys.json")
+    state, port = start_stub_in_thread(latency=0.01, keys=KEYS[:2], quota=count // 3)
+    api = client(port, rate=100, state_path=state_path, keys=KEYS[:2])
+    latencies, failures = await lookups(api, [""] * count, RequestPriority.BACKGROUND)
+    results.update(report("quota_background", api, state, latencies, failures))
+    latencies, failures = await lookups(api, [f"quota{i}" for i in range(count)])
+    results.update(report("quota_interactive", api, state, latencies, failures))
+    await api.close()
+    requests_before = state.requests
+    api = client(port, rate=100, state_path=state_path, keys=KEYS[:2])
+    latencies, failures = await lookups(api, [f"restarted{i}" for i in range(10)])
+    results["key_pool.quota_restarted.failed"] = failures
+    results["key_pool.quota_restarted.upstream_requests"] = state.requests - requests_before
+    await api.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=150)
+    args = parser.parse_args()
+    for metric, value in asyncio.run(run(args.lookups)).items():
+        print(f"{metric:<48} {value:10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import argparse
+import time
+import inline_keyboard
+from Entry import Entry
+from callback_data import CallbackCodec
+from inline_keyboard import InlineKeyboard, details_layout
+from localization import Localization
+from view_state import ViewState
+from benchmarks.fixtures import large_entry_jsons
+from benchmarks.render import button_states
+
+# Measures generate_details_buttons as clicks per second over the button states of
+# large entries: uncached rebuilds layout, labels and markup on every click, cached
+# is what repeated presses on a shown entry cost.
+# Usage: python -m benchmarks.keyboard --rounds 200
+
+def run(entry: Entry, views: list[ViewState], localization: Localization, codec: CallbackCodec, rounds: int, cold: bool) -> float:
+    entry_ref = codec.entry_ref(entry.entry)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for view in views:
+            if cold:
+                inline_keyboard.markup_cache.clear()
+                inline_keyboard.label_tables.clear()
+                details_layout.cache_clear()
+            InlineKeyboard.generate_details_buttons(view, entry, localization, codec, entry_ref)
+    return rounds * len(views) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--locale", default="en")
+    args = parser.parse_args()
+
+    localization = Localization(args.locale)
+    codec = CallbackCodec(b"benchmark")
+    for word, entry_json in large_entry_jsons().items():
+        entry = Entry.from_json(entry_json)
+        views = [ViewState(word, lexeme, definitions, int(toggles)) for lexeme, definitions, toggles in button_states(entry)]
+        cold = run(entry, views, localization, codec, args.rounds, cold=True)
+        warm = run(entry, views, localization, codec, args.rounds, cold=False)
+        print(f"{word:>4}: uncached {cold:10.0f} clicks/s, cached {warm:10.0f} clicks/s ({warm / cold:.0f}x)")
+
+if __name__ == "__main__":
+    main()
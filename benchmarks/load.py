@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import time
+from stub_api import start_stub_in_thread
+from benchmarks.fake_telegram import FakeTelegramRequest, FakeTelegramState
+from benchmarks.report import latency_summary, peak_rss_mb
+
+# End-to-end load generator: synthetic Updates go through the real Application and
+# the handlers registered by bot.add_handlers, with the Bot API answered in-process by
+# FakeTelegramRequest and the dictionary served by the local stub. Every virtual user
+# looks a word up (popular words are picked more often, like real traffic) and then
+# presses buttons of the keyboard it got back. Reports updates/s, p50/p95/p99 per
+# update kind and peak memory.
+# Every user starts at once against a cold cache, so lookup latency is mostly queueing,
+# even with a zero-latency stub: the first lookups of ~160 distinct words (and their
+# case variants) all miss, and each miss takes a few milliseconds of the one event
+# loop, mostly the httpx round trip to the in-process stub plus the SQLite write, so a
+# lookup waits behind the misses admitted before it. Buttons and repeated words are
+# served from the cache in about a millisecond; --concurrency 1 shows a lookup's own cost.
+# Usage: python -m benchmarks.load --users 200 --presses 5 --latency 0.02
+
+TOKEN = "123456:benchmark"
+WORDS = [f"word{i}" for i in range(300)]
+
+def configure_environment(stub_port: int, cache_path: str) -> None:
+    # Must run before bot is imported: its module-level clients read these
+    os.environ["API_BASE_URL"] = f"127.0.0.1:{stub_port}"
+    os.environ["API_SCHEME"] = "http"
+    os.environ["ENTRY_CACHE_PATH"] = cache_path
+    os.environ.setdefault("CALLBACK_SECRET", "benchmark")
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "language_code": "en"}
+    return {
+        "update_id": update_id,
+        "message": {"message_id": update_id, "date": int(time.time()), "chat": {"id": user_id, "type": "private"}, "from": user, "text": text},
+    }
+
+def callback_update(update_id: int, user_id: int, message_id: int, data: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "language_code": "en"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {"message_id": message_id, "date": int(time.time()), "chat": {"id": user_id, "type": "private"}, "from": user, "text": "..."},
+        },
+    }
+
+async def run(users: int = 200, presses: int = 5, concurrency: int = 50, latency: float = 0.0, api_latency: float = 0.0, seed: int = 1) -> dict[str, float]:
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+    import bot
+    from send_scheduler import SendScheduler
+
+    telegram = FakeTelegramState(latency)
+    application = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .request(FakeTelegramRequest(telegram))
+        .get_updates_request(FakeTelegramRequest(telegram))
+        # Telegram's per-chat limits would only measure the limiter itself
+        .rate_limiter(SendScheduler(global_rate=1e9, chat_rate=1e9, chat_burst=1e9, group_rate=1e9, group_burst=1e9))
+        .build()
+    )
+    bot.add_handlers(application)
+    await application.initialize()
+
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(WORDS))]
+    update_ids = itertools.count(1)
+    latencies = {"lookup": [], "button": []}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(kind: str, data: dict) -> None:
+        update = Update.de_json(data, application.bot)
+        async with semaphore:
+            start = time.perf_counter()
+            await application.process_update(update)
+            latencies[kind].append(time.perf_counter() - start)
+
+    async def virtual_user(user_id: int, word: str, choices: list[float]) -> None:
+        await process("lookup", message_update(next(update_ids), user_id, word))
+        for choice in choices:
+            message_id, buttons = telegram.last_keyboard(user_id)
+            if not buttons:
+                break
+            await process("button", callback_update(next(update_ids), user_id, message_id, buttons[int(choice * len(buttons))]))
+
+    plans = [(10_000 + i, rng.choices(WORDS, weights)[0], [rng.random() for _ in range(presses)]) for i in range(users)]
+    start = time.perf_counter()
+    await asyncio.gather(*(virtual_user(*plan) for plan in plans))
+    elapsed = time.perf_counter() - start
+
+    await bot.background_tasks.shutdown()
+    await application.shutdown()
+    await bot.wikked_api.close()
+
+    updates = sum(len(values) for values in latencies.values())
+    results = {"load.updates_per_s": updates / elapsed}
+    for kind, values in latencies.items():
+        results.update(latency_summary(f"load.{kind}", values))
+    results["load.peak_rss_mb"] = peak_rss_mb()
+    return results
+
+def start_backends(api_latency: float) -> tuple:
+    state, port = start_stub_in_thread(latency=api_latency)
+    cache_dir = tempfile.mkdtemp(prefix="bot-load-")
+    configure_environment(port, os.path.join(cache_dir, "entry_cache.sqlite3"))
+    return state, cache_dir
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--presses", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated Bot API round-trip, seconds")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated dictionary API latency, seconds")
+    args = parser.parse_args()
+
+    stub, _ = start_backends(args.api_latency)
+    results = asyncio.run(run(args.users, args.presses, args.concurrency, args.latency, args.api_latency))
+    for metric, value in results.items():
+        print(f"{metric:<24} {value:10.2f}")
+    print(f"upstream requests: {stub.requests}")
+
+if __name__ == "__main__":
+    main()
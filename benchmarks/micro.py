@@ -0,0 +1,93 @@
+import argparse
+import gc
+import statistics
+import time
+from Entry import Entry
+from callback_data import CallbackCodec
+from inline_keyboard import InlineKeyboard, details_layout, label_tables, markup_cache
+from localization import Localization
+from message_renderer import render_caches, render_entry_page
+from view_state import ViewState
+from benchmarks.fixtures import corpus_entry_jsons, large_entry_jsons, pathological_entry_jsons
+from benchmarks.render import button_states
+from benchmarks.report import REFERENCE_METRIC, reference_us, time_reference
+
+# Microbenchmarks for the three CPU-bound steps of a lookup over the fixture corpus
+# and the pathological entries: Entry.from_json, build_message_text's renderer (the
+# first page of a view) and generate_details_buttons. Render and keyboard are measured
+# cold (caches cleared before every call), which is the cost of a new entry or an
+# unseen view. Calls are timed against the reference work of benchmarks.report, so
+# results of runs on different machines, or at different moments of a busy one, compare.
+# Usage: python -m benchmarks.micro --size 300
+
+def time_per_call(calls: list, rounds: int) -> float:
+    # In multiples of the reference work's time, which is taken around every round: a
+    # shared machine's speed drifts by more than the suite's tolerance within seconds.
+    # Every call keeps its median over the rounds, and those are averaged. The garbage
+    # collector is off while timing, like timeit does, so a collection doesn't land on
+    # a random call
+    ratios = [[] for _ in calls]
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            times = []
+            reference = time_reference()
+            for call in calls:
+                start = time.perf_counter()
+                call()
+                times.append(time.perf_counter() - start)
+            reference = min(reference, time_reference())
+            for call_ratios, elapsed in zip(ratios, times):
+                call_ratios.append(elapsed / reference)
+    finally:
+        if collecting:
+            gc.enable()
+    return sum(statistics.median(call_ratios) for call_ratios in ratios) / len(calls)
+
+def clear_caches() -> None:
+    render_caches.clear()
+    markup_cache.clear()
+    label_tables.clear()
+    details_layout.cache_clear()
+
+def run(size: int = 300, rounds: int = 5) -> dict[str, float]:
+    localization = Localization("en")
+    codec = CallbackCodec(b"benchmark")
+    corpus = corpus_entry_jsons(size)
+    heavy = {**large_entry_jsons(), **pathological_entry_jsons()}
+    results = {}
+
+    results["parse.corpus_us"] = time_per_call([lambda data=data: Entry.from_json(data) for data in corpus], rounds)
+    for word, data in heavy.items():
+        results[f"parse.{word}_us"] = time_per_call([lambda: Entry.from_json(data)], rounds * 10)
+
+    for word, data in heavy.items():
+        entry = Entry.from_json(data)
+        states = button_states(entry)
+
+        def render(state):
+            render_caches.clear()
+            render_entry_page(entry, *state)
+
+        def keyboard(state):
+            clear_caches()
+            lexeme, definitions, toggles = state
+            InlineKeyboard.generate_details_buttons(ViewState(word, lexeme, definitions, int(toggles)), entry, localization, codec, word)
+
+        results[f"render.{word}_us"] = time_per_call([lambda state=state: render(state) for state in states], rounds)
+        results[f"keyboard.{word}_us"] = time_per_call([lambda state=state: keyboard(state) for state in states], rounds)
+    # Stated in microseconds at the run's best reference time
+    reference = reference_us()
+    return {REFERENCE_METRIC: reference, **{metric: value * reference for metric, value in results.items()}}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    for metric, value in run(args.size, args.rounds).items():
+        print(f"{metric:<24} {value:10.1f}")
+
+if __name__ == "__main__":
+    main()
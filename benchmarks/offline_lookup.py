@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from offline_store import DictionaryStore, LocalWikkedAPI, import_jsonl
+from benchmarks.report import latency_summary, peak_rss_mb
+
+# Import speed and lookup latency of the offline store on a generated multi-million
+# entry dump. Entries are small Wiktionary-shaped JSONs; every 20th one is a proper
+# noun and every 10th one carries a redirect, so all index kinds are exercised.
+# Usage: python -m benchmarks.offline_lookup --entries 2000000 [--keep DIR]
+
+POS = ("noun", "verb", "adjective", "adverb")
+
+def headword(i: int) -> str:
+    word = f"lemma{i:07d}"
+    return word.capitalize() if i % 20 == 0 else word
+
+def generate_dump(path: str, entries: int) -> None:
+    rng = random.Random(7)
+    with open(path, "w", encoding="utf-8") as dump:
+        for i in range(entries):
+            word = headword(i)
+            entry = {
+                "entry": word,
+                "etymologies": [{"lexemes": [{
+                    "lemma": word,
+                    "part_of_speech": POS[i % 4],
+                    "senses": [
+                        {"definition": f"Sense {n} of <i>{word}</i>.", "examples": [f"An example with {word}."], "synonyms": [f"syn{rng.randrange(entries)}"]}
+                        for n in range(1 + i % 3)
+                    ],
+                }]}],
+            }
+            if i % 10 == 5:
+                entry["redirected_from"] = f"{word}s"
+            dump.write(json.dumps(entry) + "\n")
+
+def measure_lookups(store: DictionaryStore, words: list[str]) -> list[float]:
+    latencies = []
+    for word in words:
+        start = time.perf_counter()
+        store.get_json(word)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=2_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--keep", help="directory to keep the dump and the store in")
+    args = parser.parse_args()
+
+    directory = args.keep or tempfile.mkdtemp(prefix="offline-store-")
+    os.makedirs(directory, exist_ok=True)
+    dump_path = os.path.join(directory, "dump.jsonl")
+    store_path = os.path.join(directory, "store")
+    if not os.path.exists(dump_path):
+        start = time.perf_counter()
+        generate_dump(dump_path, args.entries)
+        print(f"generated {args.entries} entries in {time.perf_counter() - start:.1f}s ({os.path.getsize(dump_path) / 2**20:.0f} MiB)")
+
+    result = import_jsonl(dump_path, store_path)
+    size = sum(os.path.getsize(os.path.join(store_path, name)) for name in os.listdir(store_path))
+    print(f"import: {result['entries'] / result['seconds']:.0f} entries/s, {result['keys']} keys, store {size / 2**20:.0f} MiB")
+
+    store = DictionaryStore(store_path)
+    rng = random.Random(1)
+    samples = [rng.randrange(args.entries) for _ in range(args.lookups)]
+    cases = {
+        "headword": [headword(i) for i in samples],
+        "variant": [headword(i).swapcase()[0] + headword(i)[1:] for i in samples],
+        "redirect": [f"{headword(i - i % 10 + 5)}s" for i in samples if i - i % 10 + 5 < args.entries],
+        "miss": [f"missing{i}" for i in samples],
+    }
+    for case, words in cases.items():
+        summary = latency_summary(case, measure_lookups(store, words))
+        print(f"{case:>8}: " + ", ".join(f"{name.split('.')[1].removesuffix('_ms')} {value * 1000:.1f}us" for name, value in summary.items()))
+
+    # Through the backend, repeated words come from the parsed-entry LRU
+    async def backend_lookups() -> float:
+        local = LocalWikkedAPI(store, remote=None)
+        start = time.perf_counter()
+        for word in cases["headword"][:20_000]:
+            await local.fetch(word)
+        return (time.perf_counter() - start) / min(20_000, len(cases["headword"]))
+    print(f"LocalWikkedAPI.fetch (lookup + parse): {asyncio.run(backend_lookups()) * 1e6:.1f} us")
+    print(f"peak RSS: {peak_rss_mb():.0f} MiB")
+    store.close()
+
+if __name__ == "__main__":
+    main()
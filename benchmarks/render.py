@@ -0,0 +1,59 @@
+import argparse
+import itertools
+import time
+from Entry import Entry
+from enums import Toggle
+from message_renderer import render_caches, render_entry_page
+from benchmarks.fixtures import large_entry_jsons
+
+# Measures build_message_text rendering for large entries: a cold render of a view's
+# first page builds its fragments, a warm one (button presses on an already shown
+# entry) is a lookup. The heaviest state (every sense and toggle of the first lexeme)
+# is also paged through: a cold first page should cost about a page's worth of
+# rendering, not the whole entry's.
+# Usage: python -m benchmarks.render --rounds 200
+
+def button_states(entry: Entry) -> list[tuple[int, int, int]]:
+    toggles = [0, Toggle.EXAMPLES, Toggle.EXAMPLES | Toggle.SYNONYMS, Toggle.EXAMPLES | Toggle.SYNONYMS | Toggle.COLLOCATIONS]
+    lexemes = [0, 1, entry.lexeme_amount()]
+    return list(itertools.product(lexemes, [1, 3, 10], toggles))
+
+def run(entry: Entry, states: list, rounds: int, cold: bool) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for chosen_lexeme, definitions, toggles in states:
+            if cold:
+                render_caches.clear()
+            render_entry_page(entry, chosen_lexeme, definitions, toggles)
+    return (time.perf_counter() - start) / (rounds * len(states))
+
+def page_text(entry: Entry, state: tuple[int, int, int], page: int) -> str:
+    return render_entry_page(entry, *state, page)[0]
+
+def page_count(entry: Entry, state: tuple[int, int, int]) -> int:
+    return 1 + sum(1 for _ in itertools.takewhile(lambda page: render_entry_page(entry, *state, page)[2], itertools.count()))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=100)
+    args = parser.parse_args()
+
+    for word, entry_json in large_entry_jsons().items():
+        entry = Entry.from_json(entry_json)
+        states = button_states(entry)
+        cold = run(entry, states, args.rounds, cold=True)
+        warm = run(entry, states, args.rounds, cold=False)
+        print(f"{word:>4}: first page {cold * 1e6:8.1f} us, cached {warm * 1e6:6.2f} us ({cold / warm:.0f}x)")
+
+        heaviest = (1, 1000, int(Toggle.EXAMPLES | Toggle.SYNONYMS | Toggle.ANTONYMS | Toggle.COLLOCATIONS))
+        first_page = run(entry, [heaviest], args.rounds, cold=True)
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            render_caches.clear()
+            sizes = [len(page_text(entry, heaviest, page)) for page in range(page_count(entry, heaviest))]
+        every_page = (time.perf_counter() - start) / args.rounds
+        print(f"      heaviest view: {len(sizes)} pages, {sum(sizes)} chars in {every_page * 1e6:8.1f} us, "
+              f"first ({sizes[0]} chars) in {first_page * 1e6:8.1f} us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import gc
+import json
+import os
+import resource
+import sys
+import time
+
+# Shared reporting for the benchmark suite: latency percentiles, peak memory and the
+# comparison of a run against a stored baseline. Results are flat dicts of
+# "<benchmark>.<metric>": value; metrics ending in "_per_s" are better when higher,
+# all others (times, memory) when lower.
+# Absolute times only mean something on the machine they were taken on, so every run
+# also times a fixed reference workload (REFERENCE_METRIC). Times and rates are
+# compared after scaling the baseline by how much slower or faster the reference ran,
+# which leaves what the code itself got slower. End-to-end load metrics are dominated
+# by queueing and vary by a fifth or more between runs on one machine, so they are
+# allowed LOAD_TOLERANCE_FACTOR times the tolerance.
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+REFERENCE_METRIC = "reference_us"
+LOAD_TOLERANCE_FACTOR = 2
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def latency_summary(prefix: str, seconds: list[float]) -> dict[str, float]:
+    values = sorted(seconds)
+    return {
+        f"{prefix}.p50_ms": percentile(values, 0.50) * 1000,
+        f"{prefix}.p95_ms": percentile(values, 0.95) * 1000,
+        f"{prefix}.p99_ms": percentile(values, 0.99) * 1000,
+    }
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+REFERENCE_ITEMS = [json.dumps({"word": f"word{i}", "senses": [f"sense {j} of word{i}" for j in range(8)]}) for i in range(50)]
+
+def reference_work() -> None:
+    # Fixed interpreter work like the benchmarks': building dicts and strings, JSON and sorting
+    for item in REFERENCE_ITEMS:
+        sorted(json.loads(item)["senses"], key=len)
+
+def time_reference() -> float:
+    start = time.perf_counter()
+    reference_work()
+    return time.perf_counter() - start
+
+def reference_us(rounds: int = 25) -> float:
+    # The best of a few rounds, with the garbage collector off like timeit does
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        return min(time_reference() for _ in range(rounds)) * 1e6
+    finally:
+        if collecting:
+            gc.enable()
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith("_per_s")
+
+def is_timing(metric: str) -> bool:
+    return metric.endswith(("_us", "_ms"))
+
+def relative(metric: str, value: float, reference: float) -> float:
+    # Times in multiples of the reference time and rates per reference time; memory and
+    # counts don't depend on the machine's speed
+    if is_timing(metric):
+        return value / reference
+    if higher_is_better(metric):
+        return value * reference
+    return value
+
+def compare(results: dict[str, float], baseline: dict[str, float], tolerance: float) -> tuple[list[str], list[str]]:
+    # Returns report lines and the metrics that regressed by more than the tolerance
+    lines, regressions = [], []
+    scale = 1.0
+    if results.get(REFERENCE_METRIC) and baseline.get(REFERENCE_METRIC):
+        scale = results[REFERENCE_METRIC] / baseline[REFERENCE_METRIC]
+        lines.append(f"{REFERENCE_METRIC:<36} {results[REFERENCE_METRIC]:12.3f}  baseline {baseline[REFERENCE_METRIC]:12.3f}  "
+                     f"this machine is {scale:.2f}x the baseline's time")
+    for metric, value in results.items():
+        old = baseline.get(metric)
+        if metric == REFERENCE_METRIC:
+            continue
+        if not old:
+            lines.append(f"{metric:<36} {value:12.3f}")
+            continue
+        if is_timing(metric):
+            expected = old * scale
+        elif higher_is_better(metric):
+            expected = old / scale
+        else:
+            expected = old
+        change = (value - expected) / expected
+        worse = -change if higher_is_better(metric) else change
+        limit = tolerance * LOAD_TOLERANCE_FACTOR if metric.startswith("load.") else tolerance
+        flag = ""
+        if worse > limit:
+            flag = "  REGRESSION"
+            regressions.append(metric)
+        elif worse < -limit:
+            flag = "  improved"
+        lines.append(f"{metric:<36} {value:12.3f}  baseline {expected:12.3f}  {change:+7.1%}{flag}")
+    return lines, regressions
+
+def load_baseline(path: str = BASELINE_PATH) -> dict[str, float]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def save_baseline(results: dict[str, float], path: str = BASELINE_PATH) -> None:
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write("\n")
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import httpx
+from entry_cache import EntryCache
+from resilience import CircuitBreaker, UpstreamError
+from stub_api import start_stub_in_thread
+from wikked_api import WikkedAPI
+from benchmarks.report import latency_summary
+
+# Runs WikkedAPI against the local stub with injected faults, one scenario at a time:
+#   errors   a share of responses are 503 pages; retries should hide nearly all of them
+#   tail     a few responses are very slow; compare p99 without and with hedging
+#   hangs    some requests never get an answer; timeouts and retries bound the wait
+#   outage   upstream goes down: stale entries are served, other lookups fail fast
+#            once the breaker opens, and lookups succeed again after it resets
+# Usage: python -m benchmarks.resilience [--lookups 300]
+
+def client(port: int, cache: EntryCache = None, read_timeout: float = 5.0, hedging: bool = False) -> WikkedAPI:
+    api = WikkedAPI(base_url=f"127.0.0.1:{port}", scheme="http", cache=cache)
+    api.timeout = httpx.Timeout(read_timeout, connect=1.0)
+    api.hedging = hedging
+    api.backoff.base, api.backoff.cap = 0.02, 0.2
+    return api
+
+async def lookups(api: WikkedAPI, words: list[str], concurrency: int = 16) -> tuple[list[float], int]:
+    # Latencies of all lookups and how many of them failed
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def lookup(word: str) -> None:
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await api.fetch(word)
+            except UpstreamError:
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(lookup(word) for word in words))
+    return latencies, failures
+
+def report(name: str, api: WikkedAPI, latencies: list[float], failures: int) -> dict[str, float]:
+    results = latency_summary(f"resilience.{name}", latencies)
+    results[f"resilience.{name}.failed"] = failures
+    for event, count in api.stats.items():
+        if count:
+            results[f"resilience.{name}.{event}"] = count
+    return results
+
+async def run(count: int = 300) -> dict[str, float]:
+    # The stub's injected 503s would be logged one by one
+    logging.getLogger("tornado.access").setLevel(logging.CRITICAL)
+    results = {}
+
+    state, port = start_stub_in_thread(latency=0.01, error_rate=0.3)
+    api = client(port)
+    results.update(report("errors", api, *await lookups(api, [f"errors{i}" for i in range(count)])))
+    await api.close()
+
+    for hedging in (False, True):
+        name = "tail_hedged" if hedging else "tail"
+        state, port = start_stub_in_thread(latency=0.02, slow_rate=0.05, slow_latency=0.5)
+        api = client(port, hedging=hedging)
+        # Warms up the latency window the hedge delay is taken from
+        await lookups(api, [f"warmup{i}" for i in range(50)])
+        api.stats = dict.fromkeys(api.stats, 0)
+        results.update(report(name, api, *await lookups(api, [f"{name}{i}" for i in range(count)])))
+        await api.close()
+
+    state, port = start_stub_in_thread(latency=0.01, hang_rate=0.1, hang_seconds=30)
+    api = client(port, read_timeout=0.3)
+    results.update(report("hangs", api, *await lookups(api, [f"hangs{i}" for i in range(count)])))
+    await api.close()
+
+    state, port = start_stub_in_thread(latency=0.01)
+    cache = EntryCache(os.path.join(tempfile.mkdtemp(prefix="resilience-"), "cache.sqlite3"), ttl=0.001, disk_ttl=0.001)
+    api = client(port, cache)
+    api.breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0.5)
+    cached = [f"outage{i}" for i in range(count // 2)]
+    await lookups(api, cached)
+    await asyncio.sleep(0.05)
+    state.down = True
+    results.update(report("outage_stale", api, *await lookups(api, cached)))
+    api.stats = dict.fromkeys(api.stats, 0)
+    results.update(report("outage_uncached", api, *await lookups(api, [f"uncached{i}" for i in range(count // 2)])))
+    results["resilience.outage_uncached.rejected_by_breaker"] = api.breaker.stats["rejected"]
+    state.down = False
+    await asyncio.sleep(0.6)
+    api.stats = dict.fromkeys(api.stats, 0)
+    results.update(report("recovered", api, *await lookups(api, [f"recovered{i}" for i in range(count // 2)])))
+    await api.close()
+    cache.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=300)
+    args = parser.parse_args()
+    for metric, value in asyncio.run(run(args.lookups)).items():
+        print(f"{metric:<48} {value:10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import random
+import time
+from suggestions import SuggestionIndex
+from benchmarks.inline_index import LETTERS, generate_words
+from benchmarks.report import latency_summary, peak_rss_mb
+
+# Build time, memory and "did you mean" latency of the suggestion index. Queries are
+# known words with one random typo (deletion, insertion, substitution or adjacent
+# transposition) and words that aren't close to anything.
+# Usage: python -m benchmarks.suggestions --words 1000000
+
+def misspell(word: str, rng: random.Random) -> str:
+    position = rng.randrange(len(word))
+    kind = rng.randrange(4)
+    if kind == 0:
+        return word[:position] + word[position + 1:]
+    if kind == 1:
+        return word[:position] + rng.choice(LETTERS) + word[position:]
+    if kind == 2:
+        return word[:position] + rng.choice(LETTERS) + word[position + 1:]
+    position = min(position, len(word) - 2)
+    return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+
+def run(words: int = 1_000_000, queries: int = 20_000, seed: int = 1) -> dict[str, float]:
+    rng = random.Random(seed)
+    headwords = generate_words(words, rng)
+
+    start = time.perf_counter()
+    index = SuggestionIndex()
+    index.build(headwords)
+    build_seconds = time.perf_counter() - start
+
+    results = {
+        "suggestions.build_s": build_seconds,
+        "suggestions.memory_mb": index.memory_bytes() / 2**20,
+    }
+    cases = {
+        "typo": [misspell(word, rng) for word in rng.choices(headwords, k=queries)],
+        "unknown": ["".join(rng.choices("0123456789", k=8)) for _ in range(queries)],
+    }
+    for case, words_queried in cases.items():
+        latencies, found = [], 0
+        for word in words_queried:
+            start = time.perf_counter()
+            found += bool(index.suggest(word))
+            latencies.append(time.perf_counter() - start)
+        results.update(latency_summary(f"suggestions.{case}", latencies))
+        results[f"suggestions.{case}_found_ratio"] = found / len(words_queried)
+
+    start = time.perf_counter()
+    for i in range(10_000):
+        index.add(f"added{i}")
+    results["suggestions.inserts_per_s"] = 10_000 / (time.perf_counter() - start)
+    results["suggestions.peak_rss_mb"] = peak_rss_mb()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    args = parser.parse_args()
+    for metric, value in run(args.words, args.queries).items():
+        print(f"{metric:<36} {value:12.3f}")
+
+if __name__ == "__main__":
+    main()
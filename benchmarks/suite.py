@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import json
+import statistics
+from benchmarks import load, micro
+from benchmarks.report import BASELINE_PATH, REFERENCE_METRIC, compare, load_baseline, reference_us, relative, save_baseline
+
+# Runs the microbenchmarks and the end-to-end load test and compares the results with
+# the stored baseline (benchmarks/baseline.json). Exits with status 1 when a metric
+# regressed by more than the tolerance. The stored baseline was recorded on one
+# particular machine; timings are compared relative to the reference workload timed
+# in the same run (see report.py), which makes it usable elsewhere, but a baseline
+# recorded on the machine running the comparison is still the more precise one.
+# After an intended change in performance, record a new baseline with --save-baseline.
+# Usage: python -m benchmarks.suite [--save-baseline] [--tolerance 0.35] [--json results.json]
+
+async def run_load(args) -> tuple[dict[str, float], float]:
+    # The load test and the median of reference timings sampled on the loop while it runs
+    samples = []
+
+    async def sample_reference() -> None:
+        while True:
+            samples.append(reference_us(rounds=3))
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.create_task(sample_reference())
+    try:
+        results = await load.run(args.users, args.presses, args.concurrency)
+    finally:
+        sampler.cancel()
+    return results, statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=300, help="fixture corpus size for the microbenchmarks")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--presses", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3, help="microbenchmark runs, the median of which is kept")
+    parser.add_argument("--tolerance", type=float, default=0.35)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    load.start_backends(api_latency=0.0)
+    # Every result is first taken relative to the reference timed alongside it: the
+    # microbenchmarks interleave it themselves, the load test samples it while it runs.
+    # The microbenchmarks are run a few times and keep their median. All results are
+    # then stated at the best reference time of the run
+    runs, references = [], []
+    for _ in range(args.repeat):
+        run = micro.run(args.size)
+        references.append(run.pop(REFERENCE_METRIC))
+        runs.append({metric: relative(metric, value, references[-1]) for metric, value in run.items()})
+    relative_results = {metric: statistics.median(run[metric] for run in runs) for metric in runs[0]}
+    run, reference = asyncio.run(run_load(args))
+    references.append(reference)
+    relative_results.update({metric: relative(metric, value, reference) for metric, value in run.items()})
+    results = {REFERENCE_METRIC: min(references)}
+    results.update({metric: relative(metric, value, 1 / results[REFERENCE_METRIC]) for metric, value in relative_results.items()})
+
+    lines, regressions = compare(results, load_baseline(args.baseline), args.tolerance)
+    print("\n".join(lines))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+    elif regressions:
+        raise SystemExit(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,275 +1,480 @@
-import os
-import logging
-from dotenv import load_dotenv
-from telegram import Update, BotCommand
-from telegram.constants import ParseMode, ChatAction
-from telegram.ext import (
-    Application,
-    ApplicationBuilder,
-    CommandHandler,
-    MessageHandler,
-    ContextTypes,
-    ConversationHandler,
-    CallbackQueryHandler,
-    InlineQueryHandler,
-    filters
-)
-from inline_keyboard import Button, InlineKeyboard
-from localization import Localization, select_localization
-from localization_keys import Phrases
-from enums import UserData
-from wikked_api import WikkedAPI
-from Entry import Entry
-import commands
-
-# logging.basicConfig(level=logging.WARNING, format='%(message)s')
-wikked_api = WikkedAPI()
-
-async def plain_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    word = update.message.text.strip()
-    await close_previous_markup(update, context)
-    await fetch_requested_entry(word, update, context)
-
-async def close_previous_markup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if UserData.LAST_MESSAGE_ID in context.user_data:
-        try:
-            await context.bot.edit_message_reply_markup(
-                chat_id=update.effective_chat.id,
-                message_id=context.user_data[UserData.LAST_MESSAGE_ID],
-                reply_markup=None
-            )
-        except Exception as e:
-            logging.warning(f"Failed to edit previous message: {e}")
-
-async def fetch_requested_entry(requested_entry: str, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await context.bot.send_chat_action(chat_id=update.message.chat_id, action=ChatAction.TYPING)
-    entry = wikked_api.fetch(requested_entry)
-    
-    # If entry is not found, try to invert the case of the first letter
-    invertcase_entry = requested_entry[0].swapcase() + requested_entry[1:]
-    if not entry.entry:
-        entry = wikked_api.fetch(invertcase_entry)
-    await provide_word_information(entry, update, context)
-
-async def provide_word_information(entry: Entry, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    context.user_data[UserData.USED_BUTTONS] = []
-    context.user_data[UserData.ENTRY] = entry
-    context.user_data[UserData.DEFINITIONS_REQUESTED] = 1
-
-    sent_message = await refresh_message(update, context, new=True)
-    context.user_data[UserData.LAST_MESSAGE_ID] = sent_message.message_id
-
-
-roman_numerals = {
-    1: "I",
-    2: "II",
-    3: "III",
-    4: "IV",
-    5: "V",
-    6: "VI",
-    7: "VII",
-    8: "VIII",
-    9: "IX",
-    10: "X",
-}
-
-def build_message_text(context: ContextTypes.DEFAULT_TYPE, entry: Entry, chosen_lexeme_id, localization: Localization) -> tuple[str, int]:
-    SUBSENSE_MAX_DEPTH = 5  # Adjustable max recursion depth
-    def render_sense(sense, level, example_requested, synonyms_requested, antonyms_requested, collocations_requested, indent_base="       ", recursive=True):
-        indent = indent_base * level
-        # Format sense definition (including labels if any)
-        definition = f"({', '.join(sense.labels)}) {sense.definition}" if sense.labels else sense.definition
-        result = definition + "\n"
-        if example_requested and sense.examples:
-            for example in sense.examples:
-                result += f"{indent}{indent_base}<i>{example}</i>\n"
-        if synonyms_requested and sense.synonyms:
-            result += f"{indent}{indent_base}<i><b>≈</b> {', '.join(sense.synonyms)}</i>\n"
-        if antonyms_requested and sense.antonyms:
-            result += f"{indent}{indent_base}<i><b>≠</b> {', '.join(sense.antonyms)}</i>\n"
-        if collocations_requested and sense.collocations:
-            result += f"{indent}{indent_base}<i>Collocations: {', '.join(sense.collocations)}</i>\n"
-        if recursive and level < SUBSENSE_MAX_DEPTH:
-            for idx, subsense in enumerate(sense.subsenses, start=1):
-                result += f"{indent}{indent_base}<b>{idx}.</b> " + render_sense(subsense, level + 1, example_requested, synonyms_requested, antonyms_requested, collocations_requested, indent_base)
-        return result
-
-    message_parts = []
-    lexeme_number = 0
-    buttons_used = context.user_data.get(UserData.USED_BUTTONS, [])
-    definitions_requested = context.user_data.get(UserData.DEFINITIONS_REQUESTED, 1)
-    example_requested = Button.EXAMPLES in buttons_used
-    synonyms_requested = Button.SYNONYMS in buttons_used
-    antonyms_requested = Button.ANTONYMS in buttons_used
-    collocations_requested = Button.COLLOCATIONS in buttons_used
-
-    lexeme_amount = entry.lexeme_amount()
-    single_lexeme = lexeme_amount == 1
-    word = entry.etymologies[0].lexemes[0].lemma
-
-    message_parts.append(f"Redirected from <b>{entry.redirected_from}</b>\n\n" if entry.redirected_from else "")
-    message_parts.append(f"\"{word}\":\n\n")
-
-    for etymology_idx, etymology in enumerate(entry.etymologies, start=1):
-        etymology_header = f"<b><u>Etymology {roman_numerals.get(etymology_idx, etymology_idx)}</u></b>\n" if not chosen_lexeme_id and len(entry.etymologies) > 1 else ""
-        if chosen_lexeme_id:
-            chosen_lexeme = entry.get_lexeme_by_index(chosen_lexeme_id - 1)
-            etymology_header += f"<b>{chosen_lexeme.part_of_speech.title()}</b>\n"
-
-        etymology_content = []
-        for lexeme in etymology.lexemes:
-            lexeme_number += 1
-            if chosen_lexeme_id and lexeme_number != chosen_lexeme_id:
-                continue
-
-            part_of_speech = f"{lexeme.part_of_speech.title()}"
-            lexeme_text = ""
-
-            if not chosen_lexeme_id and not single_lexeme:
-                definition = f"({', '.join(lexeme.senses[0].labels)}) {lexeme.senses[0].definition}" if lexeme.senses[0].labels else lexeme.senses[0].definition
-                lexeme_text += f"<b>{lexeme_number}. </b><b>{part_of_speech}</b>\n{definition}\n"
-                if not lexeme.senses[0].definition:
-                    # Add only the first subsense of each sense
-                    lexeme_text += render_sense(lexeme.senses[0].subsenses[0], 0, example_requested, synonyms_requested, antonyms_requested, collocations_requested, recursive=False) + "\n"
-            else:
-                for sense_number, sense in enumerate(lexeme.senses[:definitions_requested], start=1):
-                    lexeme_text += f"<b>{sense_number}.</b> " + render_sense(sense, 0, example_requested, synonyms_requested, antonyms_requested, collocations_requested) + "\n"
-            etymology_content.append(lexeme_text + "\n")
-
-        if etymology_content:
-            message_parts.append(etymology_header + "".join(etymology_content))
-
-    complete_message = "".join(message_parts) or localization.get(Phrases.WORD_NOT_FOUND)
-    return complete_message, lexeme_amount
-
-async def refresh_message(update:  Update, context: ContextTypes.DEFAULT_TYPE, new: bool = False) -> None:
-    localization = select_localization(update, context)
-    used_buttons = context.user_data.get(UserData.USED_BUTTONS, [])
-    entry: Entry = context.user_data.get(UserData.ENTRY, Entry())
-
-    if not entry.entry:
-        return await update.message.reply_text(localization.get(Phrases.WORD_NOT_FOUND))
-
-    chosen_lexeme = None
-    for button in used_buttons:
-        if Button.is_lexeme(button):
-            chosen_lexeme = int(button.split('-')[1])
-            break
-
-    message_text, lexeme_amount = build_message_text(context, entry, chosen_lexeme, localization)
-    inline_keyboard = InlineKeyboard.generate_details_buttons(context.user_data, localization, lexeme_amount)
-
-    if new:
-        return await update.message.reply_text(message_text, reply_markup=inline_keyboard, parse_mode=ParseMode.HTML)
-    else:
-        return await update.callback_query.edit_message_text(message_text, reply_markup=inline_keyboard, parse_mode=ParseMode.HTML)
-
-async def more_definitions_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    context.user_data[UserData.DEFINITIONS_REQUESTED] += 1
-    
-    await refresh_message(update, context)
-
-async def less_definitions_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if context.user_data[UserData.DEFINITIONS_REQUESTED] > 1:
-        context.user_data[UserData.DEFINITIONS_REQUESTED] -= 1
-
-    await refresh_message(update, context)
-
-async def back_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    context.user_data[UserData.USED_BUTTONS] = []
-    context.user_data[UserData.DEFINITIONS_REQUESTED] = 1
-
-    await refresh_message(update, context)
-
-async def close_markup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    context.user_data[UserData.USED_BUTTONS] = []
-    await update.callback_query.edit_message_reply_markup(reply_markup=None)
-
-async def definitions_border_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    pass
-
-async def random_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    entry = wikked_api.fetch_random()
-    if not entry:
-        return
-    await provide_word_information(entry, update, context)
-
-SPECIAL_BUTTON_CALLBACKS = {
-    Button.MORE_DEFINITIONS: more_definitions_callback,
-    Button.LESS_DEFINITIONS: less_definitions_callback,
-    Button.BACK: back_callback,
-    Button.CLOSE: close_markup,
-    Button.DEFINITIONS_BORDER: definitions_border_callback,
-}
-
-async def callback_dispatcher(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    query = update.callback_query
-    button = query.data
-
-    await query.answer()
-    if button in SPECIAL_BUTTON_CALLBACKS:
-        await SPECIAL_BUTTON_CALLBACKS[button](update, context)
-    else:
-        context.user_data[UserData.USED_BUTTONS].append(button)
-        await refresh_message(update, context)
-
-def get_localized_commands(localization: Localization) -> list:
-    return [
-        BotCommand("random", localization.get(Phrases.COMMAND_RANDOM)),
-        BotCommand("lang_en", localization.get(Phrases.COMMAND_LANG_EN)),
-        BotCommand("lang_ru", localization.get(Phrases.COMMAND_LANG_RU)),
-        BotCommand("help", localization.get(Phrases.COMMAND_HELP)),
-    ]
-
-async def post_init(application: Application) -> None:
-    bot = application.bot
-    for locale in Localization.locales:
-        localization = Localization(locale)
-        commands = get_localized_commands(localization)
-        await bot.set_my_commands(commands=commands, language_code=locale)
-
-def main() -> None:
-    Localization.validate_localizations()
-    load_dotenv()
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not token:
-        raise ValueError("Bot token not found. Please set TELEGRAM_BOT_TOKEN in your environment variables.")
-
-    PORT = int(os.environ.get("PORT", 8000))
-    HEROKU_APP_NAME = os.getenv("HEROKU_APP_NAME", "your-heroku-app-name")
-    WEBHOOK_URL = f"https://{HEROKU_APP_NAME}.herokuapp.com/{token}"
-    debug = os.getenv("DEBUG", False)
-    if not token: raise ValueError("Bot token not found. Please set TELEGRAM_BOT_TOKEN.")
-
-    application = (
-        ApplicationBuilder()
-        .token(token)
-        .post_init(post_init)
-        .build()
-    )
-
-    application.add_handler(CommandHandler("start", commands.start_command))
-    application.add_handler(CommandHandler("help", commands.help_command))
-    application.add_handler(CommandHandler("cancel", commands.cancel_command))
-    application.add_handler(CommandHandler("lang_en", commands.lang_en_command))
-    application.add_handler(CommandHandler("lang_ru", commands.lang_ru_command))
-    application.add_handler(CommandHandler("random", random_command))
-
-    application.add_handler(CallbackQueryHandler(callback_dispatcher))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, plain_message_handler), group=1)
-
-    if debug:
-        print("Running in polling mode")
-        application.run_polling()
-    else:
-        print(f"Webhook URL: {WEBHOOK_URL}")
-        application.run_webhook(
-            listen="0.0.0.0",
-            port=PORT,
-            url_path=token,
-            webhook_url=WEBHOOK_URL
-        )
-
-
-if __name__ == "__main__":
+import os
+import asyncio
+import html
+import logging
+from dotenv import load_dotenv
+from telegram import Update, BotCommand, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
+from telegram.constants import ParseMode, ChatAction
+from telegram.ext import (
+    Application,
+    ApplicationBuilder,
+    CommandHandler,
+    MessageHandler,
+    ContextTypes,
+    ConversationHandler,
+    CallbackQueryHandler,
+    InlineQueryHandler,
+    ChosenInlineResultHandler,
+    filters
+)
+from inline_keyboard import InlineKeyboard
+from localization import Localization, select_localization
+from localization_keys import Phrases
+from enums import UserData
+from wikked_api import WikkedAPI
+from entry_cache import EntryCache
+from variant_resolver import VariantResolver
+from Entry import Entry
+from message_renderer import render_entry_page
+from view_state import ViewState
+from callback_data import Action, CallbackCodec
+from persistence import SharedPersistence, SQLiteStateBackend
+from send_scheduler import SendScheduler, Priority, PRIORITY_NAMES
+from background import BackgroundTasks
+from timings import stage, timed_handler, summary as timings_summary
+from metrics import REGISTRY
+from webhook_server import run_webhook
+from offline_store import DictionaryStore, LocalWikkedAPI
+from prefix_index import PrefixIndex, Debouncer
+from suggestions import SuggestionIndex
+from update_processor import ChatOrderedUpdateProcessor
+from resilience import UpstreamError
+from random_pool import RandomPool
+from batch_lookup import split_words, truncated_words, resolve_batch, summary_line, pack_lines
+from popularity import PopularityTracker
+from refresh_ahead import RefreshAhead
+import commands
+
+# logging.basicConfig(level=logging.WARNING, format='%(message)s')
+load_dotenv()
+entry_cache = EntryCache(os.getenv("ENTRY_CACHE_PATH", "entry_cache.sqlite3"))
+upstream_api = wikked_api = WikkedAPI(cache=entry_cache)
+if os.getenv("OFFLINE_STORE_PATH"):
+    # Lookups are served from the imported dump, the remote API only gets its misses
+    wikked_api = LocalWikkedAPI(DictionaryStore(os.getenv("OFFLINE_STORE_PATH")), wikked_api)
+    REGISTRY.gauge("offline_store_events", "Lookups served locally or passed on to the remote API", lambda: {(name,): value for name, value in wikked_api.stats.items()}, ("event",))
+variant_resolver = VariantResolver(wikked_api.fetch)
+# /random is served from entries fetched ahead by a background worker
+random_pool = RandomPool(wikked_api.fetch_random)
+callback_codec = CallbackCodec.from_env()
+# Button presses are answered once handled, or after this delay when handling is slow
+CALLBACK_ANSWER_DELAY = float(os.getenv("CALLBACK_ANSWER_DELAY", 1.0))
+# Ids of presses answered early; a failure among them is reported with a message
+answered_early: set[str] = set()
+# Every Bot API call goes through it: flood limits, priorities, stale chat actions dropped
+send_scheduler = SendScheduler()
+background_tasks = BackgroundTasks()
+# Chats are processed in parallel, the updates of one chat in order
+update_processor = ChatOrderedUpdateProcessor()
+# Inline autocomplete is answered from memory, only the chosen word is fetched
+prefix_index = PrefixIndex()
+inline_debouncer = Debouncer()
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", 300))
+# Misses are answered with the nearest known words instead of a bare "not found"
+suggestion_index = SuggestionIndex()
+# Both indexes are filled from the cache and offline store in the background after startup
+word_indexes_task: asyncio.Task = None
+# Hot words are refreshed before their cached entries expire, and warmed after a restart.
+# Refreshes go to upstream_api even with an offline store: only the remote API's entries
+# expire in the entry cache, and LocalWikkedAPI has no refresh of its own
+popularity = PopularityTracker()
+refresh_ahead = RefreshAhead(popularity, entry_cache, upstream_api.refresh)
+
+REGISTRY.gauge("entry_cache_hit_ratio", "Entry cache hits over lookups", entry_cache.hit_ratio)
+REGISTRY.gauge("entry_cache_events", "Entry cache hits, misses, evictions and expirations", lambda: {(name,): value for name, value in entry_cache.stats.items()}, ("event",))
+REGISTRY.gauge("upstream_events", "Dictionary API errors, timeouts, retries, hedged requests and stale entries served", lambda: {(name,): value for name, value in upstream_api.stats.items()}, ("event",))
+REGISTRY.gauge("upstream_circuit_open", "1 while the circuit breaker keeps requests from the dictionary API", lambda: int(upstream_api.breaker.state != upstream_api.breaker.CLOSED))
+REGISTRY.gauge("upstream_circuit_events", "Times the circuit breaker opened and requests it rejected", lambda: {(name,): value for name, value in upstream_api.breaker.stats.items()}, ("event",))
+REGISTRY.gauge("api_key_quota_remaining", "Requests left in each API key's quota, as last reported upstream", upstream_api.keys.quota_remaining, ("key",))
+REGISTRY.gauge("api_key_events", "Requests sent with each API key and 429s it got", upstream_api.keys.events, ("key", "event"))
+REGISTRY.gauge("api_key_pool_events", "Requests that waited for a key and ones refused for lack of quota", lambda: {(name,): value for name, value in upstream_api.keys.stats.items()}, ("event",))
+REGISTRY.gauge("upstream_lookups_in_flight", "Distinct words being fetched from the dictionary API", lambda: wikked_api.flights.in_flight())
+REGISTRY.gauge("upstream_lookups_coalesced", "Lookups served by a fetch already in flight", lambda: wikked_api.flights.saved_calls)
+REGISTRY.gauge("telegram_send_queue_depth", "Bot API calls waiting in the send queue", lambda: {(PRIORITY_NAMES[priority],): depth for priority, depth in send_scheduler.queue_depth().items()}, ("priority",))
+REGISTRY.gauge("telegram_send_events", "Bot API calls sent, merged, dropped or hit by flood control", lambda: {(name,): send_scheduler.stats[name] for name in ("sent", "merged", "dropped", "retry_after")}, ("event",))
+REGISTRY.gauge("background_tasks_in_flight", "Cosmetic background tasks running", lambda: len(background_tasks.tasks))
+REGISTRY.gauge("updates_running", "Updates being processed right now", lambda: update_processor.active)
+REGISTRY.gauge("update_lanes", "Chats with updates running or waiting for their turn", lambda: len(update_processor.lanes))
+REGISTRY.gauge("update_processor_events", "Updates processed, queued behind their chat or merged as duplicate presses", lambda: {(name,): value for name, value in update_processor.stats.items()}, ("event",))
+REGISTRY.gauge("random_pool_size", "Random entries ready to be served", lambda: len(random_pool.entries))
+REGISTRY.gauge("random_pool_events", "/random served from the pool or fetched directly, and refill fetches", lambda: {(name,): value for name, value in random_pool.stats.items()}, ("event",))
+REGISTRY.gauge("popular_words", "Words tracked as popular", lambda: len(popularity.top))
+REGISTRY.gauge("refresh_ahead_events", "Hot words checked, refreshed ahead of expiry, failed or left for lack of budget", lambda: {(name,): value for name, value in refresh_ahead.stats.items()}, ("event",))
+REGISTRY.gauge("inline_index_words", "Headwords in the inline prefix index", lambda: len(prefix_index))
+REGISTRY.gauge("suggestion_index_words", "Headwords in the did-you-mean index", lambda: len(suggestion_index))
+REGISTRY.gauge("inline_query_events", "Inline queries answered or superseded by a newer keystroke", lambda: {(name,): value for name, value in inline_debouncer.stats.items()}, ("event",))
+
+@timed_handler("plain_message_handler")
+async def plain_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    words = split_words(update.message.text)
+    if not words:
+        return
+    # Only the fetch is on the critical path; the typing indicator and removing the
+    # previous keyboard run alongside it
+    close_previous_markup(update, context)
+    if len(words) > 1:
+        await fetch_batch(words, update, context)
+    else:
+        await fetch_requested_entry(words[0], update, context)
+
+def close_previous_markup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # The id is read now, before the new reply replaces it
+    last_message_id = context.user_data.get(UserData.LAST_MESSAGE_ID)
+    if last_message_id is not None:
+        background_tasks.spawn(
+            remove_markup(context, update.effective_chat.id, last_message_id),
+            name=f"close-markup-{last_message_id}",
+        )
+
+async def remove_markup(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int) -> None:
+    try:
+        await context.bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=None,
+                                                    rate_limit_args=Priority.COSMETIC)
+    except Exception as e:
+        logging.warning(f"Failed to edit previous message: {e}")
+
+async def fetch_requested_entry(requested_entry: str, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    background_tasks.spawn(
+        context.bot.send_chat_action(chat_id=update.message.chat_id, action=ChatAction.TYPING),
+        name=f"typing-{update.message.chat_id}",
+    )
+    # The word as typed and its case-inverted form are fetched at once, the typed form wins
+    with stage("fetch"):
+        entry_key, entry = await variant_resolver.resolve(requested_entry)
+    if entry.entry:
+        remember_headword(entry_key)
+    await provide_word_information(entry_key, entry, update, context)
+
+async def fetch_batch(words: list[str], update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    background_tasks.spawn(
+        context.bot.send_chat_action(chat_id=update.message.chat_id, action=ChatAction.TYPING),
+        name=f"typing-{update.message.chat_id}",
+    )
+    localization = select_localization(update, context)
+    words, truncated_at = truncated_words(words)
+    with stage("fetch"):
+        results = await resolve_batch(words, variant_resolver.resolve)
+    with stage("render"):
+        lines = [summary_line(result, localization.get(Phrases.BATCH_NOT_FOUND), localization.get(Phrases.BATCH_UNAVAILABLE))
+                 for result in results]
+        if truncated_at is not None:
+            lines.append("\n" + html.escape(localization.get(Phrases.BATCH_TRUNCATED, count=truncated_at)))
+    for result in results:
+        if result.found:
+            remember_headword(result.entry_key)
+
+    for indices in pack_lines(lines):
+        found = [results[index].entry_key for index in indices if index < len(results) and results[index].found]
+        entry_refs = [await remember_entry_ref(entry_key) for entry_key in found]
+        inline_keyboard = InlineKeyboard.generate_batch_buttons(found, callback_codec, entry_refs) if found else None
+        with stage("send"):
+            await update.message.reply_text("\n".join(lines[index] for index in indices), reply_markup=inline_keyboard, parse_mode=ParseMode.HTML)
+    # The batch keeps its buttons when the next word is looked up or opened from it
+    context.user_data.pop(UserData.LAST_MESSAGE_ID, None)
+
+async def provide_word_information(entry_key: str, entry: Entry, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    sent_message = await refresh_message(update, context, ViewState(entry_key), new=True, entry=entry)
+    context.user_data[UserData.LAST_MESSAGE_ID] = sent_message.message_id
+
+
+def build_message_text(entry: Entry, view: ViewState, localization: Localization) -> tuple[str, bool]:
+    # Only the page being shown is rendered; the view's page is clamped to the last one
+    message_text, view.page, next_page = render_entry_page(entry, view.lexeme, view.definitions, view.toggles, view.page)
+    return message_text or localization.get(Phrases.WORD_NOT_FOUND), next_page
+
+async def refresh_message(update:  Update, context: ContextTypes.DEFAULT_TYPE, view: ViewState, new: bool = False, entry: Entry = None) -> None:
+    localization = select_localization(update, context)
+    if entry is None:
+        # Entries are shared between users through the entry cache, views only keep their key
+        with stage("fetch"):
+            entry = await wikked_api.fetch(view.entry_key)
+
+    if not entry.entry:
+        if new:
+            with stage("suggest"):
+                message_text, inline_keyboard = await build_suggestions(view.entry_key, localization)
+            with stage("send"):
+                return await update.effective_message.reply_text(message_text, reply_markup=inline_keyboard)
+        with stage("send"):
+            return await update.callback_query.edit_message_reply_markup(reply_markup=None)
+
+    message_text, inline_keyboard = await build_reply(entry, view, localization)
+    with stage("send"):
+        if new:
+            return await update.effective_message.reply_text(message_text, reply_markup=inline_keyboard, parse_mode=ParseMode.HTML)
+        else:
+            return await update.callback_query.edit_message_text(message_text, reply_markup=inline_keyboard, parse_mode=ParseMode.HTML)
+
+async def build_reply(entry: Entry, view: ViewState, localization: Localization) -> tuple[str, InlineKeyboardMarkup]:
+    entry_ref = await remember_entry_ref(view.entry_key)
+    with stage("render"):
+        message_text, next_page = build_message_text(entry, view, localization)
+    with stage("keyboard"):
+        inline_keyboard = InlineKeyboard.generate_details_buttons(view, entry, localization, callback_codec, entry_ref, next_page)
+    return message_text, inline_keyboard
+
+async def remember_entry_ref(entry_key: str) -> str:
+    entry_ref = callback_codec.entry_ref(entry_key)
+    if callback_codec.is_hashed_ref(entry_ref):
+        await entry_cache.remember_ref(entry_ref, entry_key)
+    return entry_ref
+
+async def build_suggestions(word: str, localization: Localization) -> tuple[str, InlineKeyboardMarkup]:
+    message_text = localization.get(Phrases.WORD_NOT_FOUND)
+    words = suggestion_index.suggest(word, prefix_index.popularity.get)
+    if not words:
+        return message_text, None
+    entry_refs = [await remember_entry_ref(suggested) for suggested in words]
+    message_text += "\n\n" + localization.get(Phrases.DID_YOU_MEAN)
+    return message_text, InlineKeyboard.generate_suggestion_buttons(words, callback_codec, entry_refs)
+
+def remember_headword(word: str) -> None:
+    prefix_index.record(word)
+    suggestion_index.add(word)
+    popularity.record(word)
+
+async def close_markup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.callback_query.edit_message_reply_markup(reply_markup=None)
+
+@timed_handler("random_command")
+async def random_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    with stage("fetch"):
+        entry = await random_pool.take()
+    if not entry.entry:
+        return
+    await provide_word_information(entry.entry, entry, update, context)
+
+@timed_handler("callback_dispatcher")
+async def callback_dispatcher(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    early_answer = asyncio.create_task(answer_late(query))
+    upstream_failed = False
+    try:
+        await dispatch_press(update, context)
+    except UpstreamError:
+        # error_handler answers the query with the notice instead
+        upstream_failed = True
+        raise
+    finally:
+        # Whatever else fails, the press is answered and the button's spinner stops
+        early_answer.cancel()
+        if not upstream_failed:
+            if query.id in answered_early:
+                answered_early.discard(query.id)
+            else:
+                await answer_query(query)
+
+async def dispatch_press(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    # Buttons carry the view they lead to, so nothing is read from user_data here
+    payload = callback_codec.decode(query.data)
+
+    if payload is None or payload.action == Action.CLOSE:
+        # Forged, corrupted or pre-upgrade keyboards are closed as well
+        await close_markup(update, context)
+    elif payload.action in (Action.VIEW, Action.OPEN):
+        view = payload.view
+        if callback_codec.is_hashed_ref(payload.entry_ref):
+            view.entry_key = await entry_cache.resolve_ref(payload.entry_ref)
+        if view.entry_key is None:
+            await close_markup(update, context)
+        elif payload.action == Action.OPEN:
+            # A word of a batch reply: the list stays as it is, the entry comes as a reply to it
+            close_previous_markup(update, context)
+            sent_message = await refresh_message(update, context, view, new=True)
+            context.user_data[UserData.LAST_MESSAGE_ID] = sent_message.message_id
+        else:
+            await refresh_message(update, context, view)
+
+async def answer_late(query: CallbackQuery) -> None:
+    # A press still being handled after CALLBACK_ANSWER_DELAY (a slow dictionary API) is
+    # answered right away rather than spinning until the API_DEADLINE
+    await asyncio.sleep(CALLBACK_ANSWER_DELAY)
+    answered_early.add(query.id)
+    await answer_query(query)
+
+async def answer_query(query: CallbackQuery, text: str = None) -> None:
+    try:
+        await query.answer(text)
+    except Exception as e:
+        logging.warning(f"Failed to answer a button press: {e}")
+
+@timed_handler("inline_query_handler")
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.inline_query
+    if not await inline_debouncer.settle(query.from_user.id):
+        return
+    localization = select_localization(update, context)
+    results = []
+    for word in prefix_index.search(query.query):
+        if len(word.encode("utf-8")) > 64:
+            # Result ids carry the word and are limited to 64 bytes
+            continue
+        view = ViewState(word)
+        # The button shows the entry if the chosen result isn't reported back
+        button = InlineKeyboardButton(localization.get(Phrases.MORE_DETAILS), callback_data=callback_codec.encode_view(view, await remember_entry_ref(word)))
+        results.append(InlineQueryResultArticle(
+            id=word,
+            title=word,
+            input_message_content=InputTextMessageContent(f"<b>{html.escape(word)}</b>", parse_mode=ParseMode.HTML),
+            reply_markup=InlineKeyboardMarkup([[button]]),
+        ))
+    with stage("send"):
+        await query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False)
+
+@timed_handler("chosen_inline_result_handler")
+async def chosen_inline_result_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Needs inline feedback enabled in @BotFather; the sent placeholder is replaced by the entry
+    result = update.chosen_inline_result
+    if result.inline_message_id is None:
+        return
+    with stage("fetch"):
+        entry = await wikked_api.fetch(result.result_id)
+    if not entry.entry:
+        return
+    remember_headword(result.result_id)
+    message_text, inline_keyboard = await build_reply(entry, ViewState(result.result_id), select_localization(update, context))
+    with stage("send"):
+        await context.bot.edit_message_text(message_text, inline_message_id=result.inline_message_id, reply_markup=inline_keyboard, parse_mode=ParseMode.HTML)
+
+async def build_word_indexes() -> None:
+    # Runs in the background once the bot is up: building takes seconds per million
+    # headwords, and until the indexes are swapped in they know the words looked up since
+    try:
+        words = set(await asyncio.to_thread(entry_cache.known_words))
+        if isinstance(wikked_api, LocalWikkedAPI):
+            words.update(await asyncio.to_thread(lambda: list(wikked_api.store.headwords())))
+        prefix_index.install(await asyncio.to_thread(PrefixIndex.sort_words, words))
+        suggestion_index.install(*await asyncio.to_thread(suggestion_index.index_words, words))
+    except Exception as e:
+        logging.error(f"Failed to build the word indexes: {e}")
+        return
+    logging.info(f"Word indexes built with {len(prefix_index)} headwords")
+
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not isinstance(context.error, UpstreamError):
+        logging.error("Unhandled error while processing an update", exc_info=context.error)
+        return
+    logging.warning(f"Dictionary API unavailable: {context.error}")
+    if not isinstance(update, Update) or update.effective_user is None:
+        return
+    text = select_localization(update, context).get(Phrases.DICTIONARY_UNAVAILABLE)
+    try:
+        if update.callback_query is not None and update.callback_query.id in answered_early:
+            # The spinner was already stopped, so the notice can't come with the answer
+            answered_early.discard(update.callback_query.id)
+            await update.effective_message.reply_text(text)
+        elif update.callback_query is not None:
+            await update.callback_query.answer(text)
+        elif update.message is not None:
+            await update.message.reply_text(text)
+    except Exception as e:
+        logging.warning(f"Failed to report the unavailable dictionary: {e}")
+
+def get_localized_commands(localization: Localization) -> list:
+    return [
+        BotCommand("random", localization.get(Phrases.COMMAND_RANDOM)),
+        BotCommand("lang_en", localization.get(Phrases.COMMAND_LANG_EN)),
+        BotCommand("lang_ru", localization.get(Phrases.COMMAND_LANG_RU)),
+        BotCommand("help", localization.get(Phrases.COMMAND_HELP)),
+    ]
+
+async def post_init(application: Application) -> None:
+    bot = application.bot
+    for locale in Localization.locales:
+        localization = Localization(locale)
+        commands = get_localized_commands(localization)
+        await bot.set_my_commands(commands=commands, language_code=locale)
+    random_pool.start()
+    refresh_ahead.start()
+    global word_indexes_task
+    word_indexes_task = asyncio.create_task(build_word_indexes(), name="build-word-indexes")
+
+async def post_shutdown(application: Application) -> None:
+    if word_indexes_task is not None:
+        word_indexes_task.cancel()
+        await asyncio.gather(word_indexes_task, return_exceptions=True)
+    await background_tasks.shutdown()
+    await random_pool.stop()
+    await refresh_ahead.stop()
+    await wikked_api.close()
+    logging.info(f"Handler timings: {timings_summary()}")
+    logging.info(f"Background tasks: {background_tasks.stats}")
+    logging.info(f"Entry cache stats: {entry_cache.stats}, hit ratio {entry_cache.hit_ratio():.2%}")
+    logging.info(f"Send scheduler stats: {send_scheduler.stats}, mean wait {send_scheduler.mean_wait_time():.3f}s")
+    logging.info(f"Random pool stats: {random_pool.stats}")
+    logging.info(f"Refresh-ahead stats: {refresh_ahead.stats}")
+    logging.info(f"Update processor stats: {update_processor.stats}")
+    logging.info(f"Coalesced lookups: {wikked_api.flights.stats}, saved {wikked_api.flights.saved_calls} upstream calls")
+    entry_cache.close()
+
+def add_handlers(application: Application) -> None:
+    application.add_handler(CommandHandler("start", commands.start_command))
+    application.add_handler(CommandHandler("help", commands.help_command))
+    application.add_handler(CommandHandler("cancel", commands.cancel_command))
+    application.add_handler(CommandHandler("lang_en", commands.lang_en_command))
+    application.add_handler(CommandHandler("lang_ru", commands.lang_ru_command))
+    application.add_handler(CommandHandler("random", random_command))
+
+    application.add_handler(CallbackQueryHandler(callback_dispatcher))
+    # Not blocking, so debounced keystrokes don't hold up other updates
+    application.add_handler(InlineQueryHandler(inline_query_handler, block=False))
+    application.add_handler(ChosenInlineResultHandler(chosen_inline_result_handler))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, plain_message_handler), group=1)
+    application.add_error_handler(error_handler)
+
+def main() -> None:
+    Localization.validate_localizations()
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper(), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        raise ValueError("Bot token not found. Please set TELEGRAM_BOT_TOKEN in your environment variables.")
+
+    PORT = int(os.environ.get("PORT", 8000))
+    HEROKU_APP_NAME = os.getenv("HEROKU_APP_NAME", "your-heroku-app-name")
+    WEBHOOK_URL = f"https://{HEROKU_APP_NAME}.herokuapp.com/{token}"
+    debug = os.getenv("DEBUG", False)
+    if not token: raise ValueError("Bot token not found. Please set TELEGRAM_BOT_TOKEN.")
+
+    persistence = SharedPersistence(
+        SQLiteStateBackend(os.getenv("STATE_DB_PATH", "bot_state.sqlite3")),
+        update_interval=float(os.getenv("PERSISTENCE_UPDATE_INTERVAL", 2)),
+    )
+    REGISTRY.gauge("user_data_writes", "user_data rows written, and ones merged onto another process's write", lambda: {(name,): value for name, value in persistence.stats.items()}, ("event",))
+    application = (
+        ApplicationBuilder()
+        .token(token)
+        .persistence(persistence)
+        .rate_limiter(send_scheduler)
+        .concurrent_updates(update_processor)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    add_handlers(application)
+
+    if debug:
+        print("Running in polling mode")
+        application.run_polling()
+    else:
+        print(f"Webhook URL: {WEBHOOK_URL}")
+        # Serves /metrics on the same port as the webhook, to requests bearing METRICS_TOKEN,
+        # or on METRICS_PORT when that is set
+        run_webhook(
+            application,
+            listen="0.0.0.0",
+            port=PORT,
+            url_path=token,
+            webhook_url=WEBHOOK_URL,
+            secret_token=os.getenv("WEBHOOK_SECRET") or None,
+            drop_pending_updates=os.getenv("WEBHOOK_DROP_PENDING_UPDATES", "false").lower() == "true",
+            bootstrap_retries=int(os.getenv("WEBHOOK_BOOTSTRAP_RETRIES", 0)),
+            metrics_token=os.getenv("METRICS_TOKEN") or None,
+            metrics_listen=os.getenv("METRICS_LISTEN", "127.0.0.1"),
+            metrics_port=int(os.getenv("METRICS_PORT") or 0) or None,
+        )
+
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
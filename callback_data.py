@@ -0,0 +1,84 @@
+import base64
+import hashlib
+import hmac
+import os
+from typing import Optional
+from dotenv import load_dotenv
+from view_state import ViewState
+
+# Stateless callback_data: every button carries the view it leads to, signed so it
+# can't be forged, within Telegram's 64-byte limit. Any bot process can handle the
+# press from the payload and the shared entry cache alone.
+#
+# Layout: <signature><action><lexeme>|<definitions>|<toggles>|<page>|<entry ref>
+# Entry keys that don't fit are replaced by "#" and a hash, resolved through the entry cache.
+
+CALLBACK_DATA_LIMIT = 64
+SIGNATURE_LENGTH = 8
+MAX_RAW_KEY_BYTES = 40
+REF_PREFIX = "#"
+
+class Action:
+    VIEW = "v"
+    OPEN = "o"  # Like VIEW, but in a new message instead of the pressed one
+    CLOSE = "c"
+    NOOP = "n"
+
+class CallbackPayload:
+    __slots__ = ("action", "view", "entry_ref")
+
+    def __init__(self, action: str, view: ViewState = None, entry_ref: str = ""):
+        self.action = action
+        self.view = view
+        self.entry_ref = entry_ref
+
+class CallbackCodec:
+    def __init__(self, secret: bytes):
+        self.secret = secret
+
+    @classmethod
+    def from_env(cls) -> 'CallbackCodec':
+        load_dotenv()
+        secret = os.getenv("CALLBACK_SECRET") or os.getenv("TELEGRAM_BOT_TOKEN") or ""
+        return cls(hashlib.sha256(secret.encode("utf-8")).digest())
+
+    @staticmethod
+    def entry_ref(entry_key: str) -> str:
+        if len(entry_key.encode("utf-8")) <= MAX_RAW_KEY_BYTES and not entry_key.startswith(REF_PREFIX):
+            return entry_key
+        digest = hashlib.blake2b(entry_key.encode("utf-8"), digest_size=9).digest()
+        return REF_PREFIX + base64.urlsafe_b64encode(digest).decode("ascii")
+
+    @staticmethod
+    def is_hashed_ref(entry_ref: str) -> bool:
+        return entry_ref.startswith(REF_PREFIX)
+
+    def sign(self, body: str) -> str:
+        digest = hmac.new(self.secret, body.encode("utf-8"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:6]).decode("ascii")
+
+    def encode_view(self, view: ViewState, entry_ref: str, action: str = Action.VIEW) -> str:
+        body = f"{action}{view.lexeme}|{view.definitions}|{view.toggles}|{view.page}|{entry_ref}"
+        data = self.sign(body) + body
+        if len(data.encode("utf-8")) > CALLBACK_DATA_LIMIT:
+            raise ValueError(f"callback_data for '{entry_ref}' exceeds {CALLBACK_DATA_LIMIT} bytes")
+        return data
+
+    def encode_action(self, action: str) -> str:
+        return self.sign(action) + action
+
+    def decode(self, data: str) -> Optional[CallbackPayload]:
+        # Returns None for forged, corrupted or outdated callback_data
+        signature, body = data[:SIGNATURE_LENGTH], data[SIGNATURE_LENGTH:]
+        # Compared as bytes: compare_digest refuses str with non-ASCII characters
+        if not body or not hmac.compare_digest(signature.encode("utf-8"), self.sign(body).encode("ascii")):
+            return None
+        action = body[0]
+        if action not in (Action.VIEW, Action.OPEN):
+            return CallbackPayload(action)
+        try:
+            lexeme, definitions, toggles, page, entry_ref = body[1:].split("|", 4)
+            view = ViewState(entry_ref, int(lexeme), int(definitions), int(toggles), int(page))
+        except ValueError:
+            return None
+        return CallbackPayload(action, view, entry_ref)
@@ -6,25 +6,31 @@ from telegram.ext import (
 from localization import select_localization
 from localization_keys import Phrases
 from enums import UserData
+from timings import timed_handler
 
+@timed_handler("start_command")
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     localization = select_localization(update, context)
     text = localization.get(Phrases.START_MESSAGE)
     await update.message.reply_text(text)
 
+@timed_handler("help_command")
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     localization = select_localization(update, context)
     text = localization.get(Phrases.HELP_MESSAGE)
     await update.message.reply_text(text)
 
+@timed_handler("cancel_command")
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     localization = select_localization(update, context)
     await update.message.reply_text(localization.get(Phrases.CANCEL_MESSAGE))
     return ConversationHandler.END
 
+@timed_handler("lang_en_command")
 async def lang_en_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await set_language_specific(update, context, 'en')
 
+@timed_handler("lang_ru_command")
 async def lang_ru_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await set_language_specific(update, context, 'ru')
 
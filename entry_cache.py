@@ -0,0 +1,269 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+from Entry import Entry
+from timings import stage
+
+# Two-tier cache of looked up entries keyed by the normalized requested word:
+# a bounded in-process LRU with TTL in front of a persistent SQLite store.
+# "Not found" results are cached too, with their own shorter TTL. Expired entries stay
+# on disk for a while longer, so they can be served while the dictionary API fails.
+# References to keys too long for callback_data are kept until no reply or button
+# press has used them for ENTRY_CACHE_REF_TTL.
+
+def normalize_key(word: str) -> str:
+    # Entries are case-sensitive, so only whitespace and unicode composition are normalized
+    return unicodedata.normalize("NFC", word.strip())
+
+class EntryCache:
+    def __init__(
+        self,
+        path: str = None,
+        max_size: int = None,
+        ttl: float = None,
+        disk_ttl: float = None,
+        negative_ttl: float = None,
+        stale_ttl: float = None,
+        ref_ttl: float = None,
+    ):
+        self.max_size = max_size or int(os.getenv("ENTRY_CACHE_SIZE", 2048))
+        self.ttl = ttl or float(os.getenv("ENTRY_CACHE_TTL", 6 * 3600))
+        self.disk_ttl = disk_ttl or float(os.getenv("ENTRY_CACHE_DISK_TTL", 14 * 24 * 3600))
+        self.negative_ttl = negative_ttl or float(os.getenv("ENTRY_CACHE_NEGATIVE_TTL", 15 * 60))
+        # How long past its expiry a found entry may still be served stale
+        self.stale_ttl = stale_ttl or float(os.getenv("ENTRY_CACHE_STALE_TTL", 30 * 24 * 3600))
+        self.ref_ttl = ref_ttl or float(os.getenv("ENTRY_CACHE_REF_TTL", 90 * 24 * 3600))
+        self.memory: OrderedDict[str, tuple[float, Entry]] = OrderedDict()
+        # Short references for keys too long to be embedded into callback_data
+        # ref -> (key, when its stored last use was written)
+        self.refs: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "warmed": 0,
+        }
+
+        self.path = path
+        self._connection: sqlite3.Connection = None
+        self._closed = False
+        self._db_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+
+    @property
+    def _db(self) -> Optional[sqlite3.Connection]:
+        # The store is opened on first use, so constructing the cache touches no files
+        if self._connection is None and self.path and not self._closed:
+            with self._open_lock:
+                if self._connection is None:
+                    self._open()
+        return self._connection
+
+    def _open(self) -> None:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, payload TEXT, expires_at REAL NOT NULL)"
+        )
+        db.execute("CREATE TABLE IF NOT EXISTS entry_refs (ref TEXT PRIMARY KEY, key TEXT NOT NULL, last_used REAL NOT NULL)")
+        if "last_used" not in {row[1] for row in db.execute("PRAGMA table_info(entry_refs)")}:
+            # Tables from before refs expired; their refs count as used now
+            db.execute("ALTER TABLE entry_refs ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            db.execute("UPDATE entry_refs SET last_used = ?", (time.time(),))
+        db.commit()
+        self._connection = db
+        self.purge_expired()
+
+    async def get(self, word: str) -> Optional[Entry]:
+        # Returns the cached Entry (an empty Entry for a cached miss) or None when not cached
+        key = normalize_key(word)
+        entry = self._get_memory(key)
+        if entry is None and self._db is not None:
+            row = await asyncio.to_thread(self._read_disk, key)
+            entry = self._promote(key, row) if row else None
+            if entry is not None:
+                self.stats["disk_hits"] += 1
+        if entry is None:
+            self.stats["misses"] += 1
+        elif not entry.entry:
+            self.stats["negative_hits"] += 1
+        return entry
+
+    async def get_stale(self, word: str) -> Optional[Entry]:
+        # A found entry regardless of its expiry, for when it can't be refreshed
+        key = normalize_key(word)
+        item = self.memory.get(key)
+        if item is not None and item[1].entry:
+            return item[1]
+        if self._db is None:
+            return None
+        row = await asyncio.to_thread(self._read_disk, key)
+        if not row or not row[0] or row[1] + self.stale_ttl < time.time():
+            return None
+        with stage("parse"):
+            return Entry.from_json(json.loads(row[0]))
+
+    async def warm(self, word: str) -> Optional[float]:
+        # Seconds until the found entry for the word expires (negative once it has), None
+        # when none is cached. A copy missing from memory or about to leave it is reloaded
+        # from disk, so the next lookup is a memory hit.
+        key = normalize_key(word)
+        item = self.memory.get(key)
+        if self._db is None:
+            if item is None or not item[1].entry:
+                return None
+            return item[0] - time.monotonic()
+        row = await asyncio.to_thread(self._read_disk, key)
+        if not row or not row[0]:
+            return None
+        remaining = row[1] - time.time()
+        if remaining > 0 and (item is None or item[0] - time.monotonic() < self.ttl * 0.1):
+            self._promote(key, row)
+            self.stats["warmed"] += 1
+        return remaining
+
+    async def put(self, word: str, entry_json: Optional[dict], entry: Entry) -> None:
+        key = normalize_key(word)
+        found = bool(entry.entry)
+        self._put_memory(key, entry, self.ttl if found else self.negative_ttl)
+        if self._db is not None:
+            payload = json.dumps(entry_json, ensure_ascii=False) if found else None
+            expires_at = time.time() + (self.disk_ttl if found else self.negative_ttl)
+            await asyncio.to_thread(self._put_disk, key, payload, expires_at)
+
+    async def remember_ref(self, ref: str, word: str) -> None:
+        now = time.time()
+        cached = self.refs.get(ref)
+        if cached is not None:
+            self.refs.move_to_end(ref)
+            # The stored last use only has to be roughly current
+            if now - cached[1] < self.ref_ttl * 0.1:
+                return
+        self.refs[ref] = (word, now)
+        while len(self.refs) > self.max_size:
+            self.refs.popitem(last=False)
+        if self._db is not None:
+            await asyncio.to_thread(self._put_ref, ref, word, now)
+
+    async def resolve_ref(self, ref: str) -> Optional[str]:
+        cached = self.refs.get(ref)
+        if cached is not None:
+            word = cached[0]
+        elif self._db is not None:
+            row = await asyncio.to_thread(self._read_ref, ref)
+            if row is None:
+                return None
+            word = row[0]
+        else:
+            return None
+        # A pressed button keeps its reference alive
+        await self.remember_ref(ref, word)
+        return word
+
+    def _get_memory(self, key: str) -> Optional[Entry]:
+        item = self.memory.get(key)
+        if item is None:
+            return None
+        expires_at, entry = item
+        if expires_at < time.monotonic():
+            del self.memory[key]
+            self.stats["expirations"] += 1
+            return None
+        self.memory.move_to_end(key)
+        self.stats["memory_hits"] += 1
+        return entry
+
+    def _put_memory(self, key: str, entry: Entry, ttl: float) -> None:
+        self.memory[key] = (time.monotonic() + ttl, entry)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _read_disk(self, key: str) -> Optional[tuple]:
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT payload, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+
+    def _promote(self, key: str, row: tuple) -> Optional[Entry]:
+        payload, expires_at = row
+        remaining = expires_at - time.time()
+        if remaining <= 0:
+            self.stats["expirations"] += 1
+            return None
+        with stage("parse"):
+            entry = Entry.from_json(json.loads(payload)) if payload else Entry()
+        self._put_memory(key, entry, min(remaining, self.ttl if payload else self.negative_ttl))
+        return entry
+
+    def _put_disk(self, key: str, payload: Optional[str], expires_at: float) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, payload, expires_at) VALUES (?, ?, ?)",
+                (key, payload, expires_at),
+            )
+            self._db.commit()
+
+    def _read_ref(self, ref: str) -> Optional[tuple]:
+        with self._db_lock:
+            return self._db.execute("SELECT key FROM entry_refs WHERE ref = ?", (ref,)).fetchone()
+
+    def _put_ref(self, ref: str, word: str, last_used: float) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT INTO entry_refs (ref, key, last_used) VALUES (?, ?, ?) "
+                "ON CONFLICT(ref) DO UPDATE SET last_used = excluded.last_used",
+                (ref, word, last_used),
+            )
+            self._db.commit()
+
+    def known_words(self) -> list[str]:
+        # Words cached with an entry, for the inline prefix index
+        words = {key for key, (_, entry) in self.memory.items() if entry.entry}
+        if self._db is not None:
+            with self._db_lock:
+                rows = self._db.execute(
+                    "SELECT key FROM entries WHERE payload IS NOT NULL AND expires_at >= ?", (time.time(),)
+                ).fetchall()
+            words.update(row[0] for row in rows)
+        return list(words)
+
+    def purge_expired(self) -> None:
+        if self._db is None:
+            return
+        with self._db_lock:
+            deleted = self._db.execute(
+                "DELETE FROM entries WHERE expires_at < ? AND (payload IS NULL OR expires_at < ?)",
+                (time.time(), time.time() - self.stale_ttl),
+            ).rowcount
+            deleted_refs = self._db.execute(
+                "DELETE FROM entry_refs WHERE last_used < ?", (time.time() - self.ref_ttl,)
+            ).rowcount
+            self._db.commit()
+        if deleted or deleted_refs:
+            logging.info(f"Purged {deleted} expired entries and {deleted_refs} unused refs from {self.path}")
+
+    def hit_ratio(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def close(self) -> None:
+        self._closed = True
+        if self._connection is not None:
+            with self._db_lock:
+                self._connection.close()
+            self._connection = None
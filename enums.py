@@ -1,8 +1,11 @@
-from enum import Enum
+from enum import Enum, IntFlag
 
 class UserData(str, Enum):
-    ENTRY = "entry"
-    USED_BUTTONS = "used_buttons"
     LOCALE = "locale"
     LAST_MESSAGE_ID = "last_message_id"
-    DEFINITIONS_REQUESTED = "definitions_requested"
\ No newline at end of file
+
+class Toggle(IntFlag):
+    EXAMPLES = 1
+    SYNONYMS = 2
+    ANTONYMS = 4
+    COLLOCATIONS = 8
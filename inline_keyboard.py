@@ -1,8 +1,14 @@
+import os
+from collections import OrderedDict
 from enum import Enum, auto
+from functools import lru_cache
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from localization import Localization
 from localization_keys import Phrases
-from enums import UserData
+from enums import Toggle
+from Entry import Entry
+from view_state import ViewState
+from callback_data import Action, CallbackCodec
 
 class LexemeButton(str):
     def __new__(cls, lexeme_number: int):
@@ -26,6 +32,9 @@ class Button(str, Enum):
     BACK = auto()
     CLOSE = auto()
 
+    PREVIOUS_PAGE = auto()
+    NEXT_PAGE = auto()
+
     @staticmethod
     def lexemes(lexeme_numbers: int) -> list[LexemeButton]:
         return [LexemeButton(i) for i in range(1, lexeme_numbers + 1)]
@@ -34,106 +43,192 @@ class Button(str, Enum):
     def is_lexeme(button: str) -> bool:
         return button.startswith("lexeme")
 
+    @staticmethod
+    def lexeme_number(button: str) -> int:
+        return int(button.split('-')[1])
+
+TOGGLE_BUTTONS = {
+    Button.EXAMPLES: Toggle.EXAMPLES,
+    Button.SYNONYMS: Toggle.SYNONYMS,
+    Button.ANTONYMS: Toggle.ANTONYMS,
+    Button.COLLOCATIONS: Toggle.COLLOCATIONS,
+}
+
+# Layouts depend only on a handful of properties of the view and the lexeme, so they
+# are computed once per combination; finished markups are memoized per locale, entry
+# and view, so a repeated state doesn't build any buttons at all.
+KEYBOARD_CACHE_SIZE = int(os.getenv("KEYBOARD_CACHE_SIZE", 4096))
+label_tables: dict[str, dict[str, str]] = {}
+markup_cache: OrderedDict[tuple, InlineKeyboardMarkup] = OrderedDict()
+
+def button_label(button: str, localization: Localization) -> str:
+    if button in Phrases.__members__:
+        return localization.get(Phrases[button])
+    elif Button.is_lexeme(button):
+        return f"{Button.lexeme_number(button)}"
+    return button.replace("_", " ").title()
+
+def label_table(localization: Localization) -> dict[str, str]:
+    table = label_tables.get(localization.locale)
+    if table is None:
+        table = label_tables[localization.locale] = {button: button_label(button, localization) for button in Button}
+    return table
+
+@lru_cache(maxsize=1024)
+def details_layout(lexeme_amount: int, lexeme_chosen: bool, toggles: int, fields_present: int,
+                   sense_amount: int, fewest_definitions: bool, all_definitions: bool,
+                   previous_page: bool = False, next_page: bool = False) -> tuple[tuple[str, ...], ...]:
+    button_structure = []
+    if not lexeme_chosen and not toggles and lexeme_amount > 1:
+        # Layer 1
+        # Buttons for choosing a specific lexeme
+        lexeme_buttons = Button.lexemes(lexeme_amount)
+        for i in range(0, len(lexeme_buttons), 5):
+            button_structure.append(lexeme_buttons[i:i + 5])
+
+        button_structure.append([Button.CLOSE])
+
+    # If single lexeme
+    elif lexeme_chosen or lexeme_amount == 1:
+        # Layer 2
+        sense_amount_buttons = []
+        if sense_amount > 1:
+            if not fewest_definitions:
+                sense_amount_buttons.append(Button.LESS_DEFINITIONS)
+            else:
+                sense_amount_buttons.append(Button.DEFINITIONS_BORDER)
+            if not all_definitions:
+                sense_amount_buttons.append(Button.MORE_DEFINITIONS)
+            else:
+                sense_amount_buttons.append(Button.DEFINITIONS_BORDER)
+        antonyms_synonyms_row = []
+        if fields_present & Toggle.ANTONYMS:
+            antonyms_synonyms_row.append(Button.ANTONYMS)
+        if fields_present & Toggle.SYNONYMS:
+            antonyms_synonyms_row.append(Button.SYNONYMS)
+
+        examples_collocations_row = []
+        if fields_present & Toggle.EXAMPLES:
+            examples_collocations_row.append(Button.EXAMPLES)
+        if fields_present & Toggle.COLLOCATIONS:
+            examples_collocations_row.append(Button.COLLOCATIONS)
+
+        back_close_row = []
+        if lexeme_amount > 1:
+            back_close_row.append(Button.BACK)
+        back_close_row.append(Button.CLOSE)
+
+        button_structure = [
+            antonyms_synonyms_row,
+            examples_collocations_row,
+            sense_amount_buttons,
+            back_close_row,
+        ]
+
+    # Paging comes first: on a long message it is what the reader needs next
+    page_row = []
+    if previous_page:
+        page_row.append(Button.PREVIOUS_PAGE)
+    if next_page:
+        page_row.append(Button.NEXT_PAGE)
+    if page_row:
+        button_structure.insert(0, page_row)
+        if len(button_structure) == 1:
+            button_structure.append([Button.CLOSE])
+
+    used_buttons = {button for button, flag in TOGGLE_BUTTONS.items() if toggles & flag}
+    unused_buttons = []
+    for row in button_structure:
+        filtered_row = tuple(button for button in row if button not in used_buttons)
+        if filtered_row:
+            unused_buttons.append(filtered_row)
+
+    # If only the close button is left, remove the entire row
+    if len(unused_buttons) == 1 and len(unused_buttons[0]) == 1:
+        unused_buttons = []
+    return tuple(unused_buttons)
+
 class InlineKeyboard:
     @staticmethod
-    def generate(button_table: list[list], localization: Localization) -> InlineKeyboardMarkup:
+    def generate(button_table: list[list], localization: Localization, callback_data: dict = None) -> InlineKeyboardMarkup:
+        callback_data = callback_data or {}
+        labels = label_table(localization)
         keyboard_buttons = []
         for button_list in button_table:
             row = []
             for button in button_list:
-                if button in Phrases:
-                    phrase_key = Phrases[button]
-                    b_text = localization.get(phrase_key)
-                elif Button.is_lexeme(button):
-                    b_text = f"{button.split('-')[1]}"
-                else:
-                    b_text = button.replace("_", " ").title()
-                row.append(InlineKeyboardButton(b_text, callback_data=button))
+                b_text = labels.get(button) or button_label(button, localization)
+                row.append(InlineKeyboardButton(b_text, callback_data=callback_data.get(button, button)))
             keyboard_buttons.append(row)
         return InlineKeyboardMarkup(keyboard_buttons)
 
     @staticmethod
-    def generate_details_buttons(user_data, localization: Localization, lexeme_amount: int) -> InlineKeyboardMarkup:
-        used_buttons = user_data.get(UserData.USED_BUTTONS, [])
-        # Remove Button.DEFINITIONS_BORDER if it's there
-        if Button.DEFINITIONS_BORDER in used_buttons:
-            used_buttons.remove(Button.DEFINITIONS_BORDER)
-        
-        button_structure = []
-        if not used_buttons and lexeme_amount > 1:
-            # Layer 1
-            # Buttons for choosing a specific lexeme
-            # print("Layer 1")
-            if lexeme_amount > 1:
-                lexeme_buttons = Button.lexemes(lexeme_amount)
-                for i in range(0, len(lexeme_buttons), 5):
-                    button_structure.append(lexeme_buttons[i:i + 5])
-
-            button_structure.append([Button.CLOSE])
-
-        # If single lexeme
-        elif is_lexeme_chosen(used_buttons) or lexeme_amount == 1:
-            # Layer 2
-            # print("Layer 2")
-            chosen_lexeme = get_lexeme_chosen_id(used_buttons) if is_lexeme_chosen(used_buttons) else 0
-            definitions_required = user_data.get(UserData.DEFINITIONS_REQUESTED, 1)
-            entry = user_data.get(UserData.ENTRY)
-            lexeme = entry.get_lexeme_by_index(chosen_lexeme)
-            fields_present = lexeme.has_fields(definitions_required)
+    def generate_details_buttons(view: ViewState, entry: Entry, localization: Localization, codec: CallbackCodec, entry_ref: str,
+                                 next_page: bool = False) -> InlineKeyboardMarkup:
+        lexeme_amount = entry.lexeme_amount()
+        if view.lexeme or lexeme_amount == 1:
+            lexeme = entry.get_lexeme_by_index(view.lexeme - 1 if view.lexeme else 0)
+            fields_present = lexeme.field_mask(view.definitions)
             sense_amount = len(lexeme.senses)
-            sense_amount_buttons = []
-            if sense_amount > 1:
-                if definitions_required != 1:
-                    sense_amount_buttons.append(Button.LESS_DEFINITIONS)
-                else:
-                    sense_amount_buttons.append(Button.DEFINITIONS_BORDER)
-                if definitions_required != sense_amount:
-                    sense_amount_buttons.append(Button.MORE_DEFINITIONS)
-                else:
-                    sense_amount_buttons.append(Button.DEFINITIONS_BORDER)
-            antonyms_synonyms_row = []
-            if fields_present.get("antonyms"):
-                antonyms_synonyms_row.append(Button.ANTONYMS)
-            if fields_present.get("synonyms"):
-                antonyms_synonyms_row.append(Button.SYNONYMS)
-
-            examples_collocations_row = []
-            if fields_present.get("examples"):
-                examples_collocations_row.append(Button.EXAMPLES)
-            if fields_present.get("collocations"):
-                examples_collocations_row.append(Button.COLLOCATIONS)
-
-            back_close_row = []
-            if lexeme_amount > 1:
-                back_close_row.append(Button.BACK)
-            back_close_row.append(Button.CLOSE)
-
-            button_structure = [
-                antonyms_synonyms_row,
-                examples_collocations_row,
-                sense_amount_buttons if sense_amount > 1 else [],
-                back_close_row,
-            ]
         else:
-            # print("FALLBACK")
-            button_structure = []
+            fields_present = sense_amount = 0
+        layout = details_layout(
+            lexeme_amount, bool(view.lexeme), view.toggles, fields_present & 0xF,
+            sense_amount, view.definitions == 1, view.definitions == sense_amount,
+            view.page > 0, next_page,
+        )
+
+        key = (localization.locale, entry_ref, view.lexeme, view.definitions, view.toggles, view.page, layout)
+        markup = markup_cache.get(key)
+        if markup is not None:
+            markup_cache.move_to_end(key)
+            return markup
+
+        # Every button carries the signed view it leads to
+        callback_data = {}
+        for row in layout:
+            for button in row:
+                target = button_target(button, view)
+                if isinstance(target, ViewState):
+                    callback_data[button] = codec.encode_view(target, entry_ref)
+                else:
+                    callback_data[button] = codec.encode_action(target)
+        markup = markup_cache[key] = InlineKeyboard.generate(layout, localization, callback_data)
+        if len(markup_cache) > KEYBOARD_CACHE_SIZE:
+            markup_cache.popitem(last=False)
+        return markup
 
-        unused_buttons = []
-        for row in button_structure:
-            filtered_row = [button for button in row if button not in used_buttons]
-            if filtered_row:
-                unused_buttons.append(filtered_row)
-
-        # If only the close button is left, remove the entire row
-        if len(unused_buttons) == 1 and len(unused_buttons[0]) == 1:
-            unused_buttons = []
-        return InlineKeyboard.generate(unused_buttons, localization)
-
-def is_lexeme_chosen(used_buttons) -> bool:
-    return any(Button.is_lexeme(button) for button in used_buttons)
-
-def get_lexeme_chosen_id(used_buttons) -> int:
-    for button in used_buttons:
-        if Button.is_lexeme(button):
-            return int(button.split('-')[1]) - 1
-    return None
\ No newline at end of file
+    @staticmethod
+    def generate_suggestion_buttons(words: list[str], codec: CallbackCodec, entry_refs: list[str]) -> InlineKeyboardMarkup:
+        # One button per suggested word, each opening that word's entry
+        rows = [[InlineKeyboardButton(word, callback_data=codec.encode_view(ViewState(word), entry_ref))]
+                for word, entry_ref in zip(words, entry_refs)]
+        return InlineKeyboardMarkup(rows)
+
+    @staticmethod
+    def generate_batch_buttons(words: list[str], codec: CallbackCodec, entry_refs: list[str]) -> InlineKeyboardMarkup:
+        # One button per found word, three to a row, each opening the entry in a new message
+        buttons = [InlineKeyboardButton(word, callback_data=codec.encode_view(ViewState(word), entry_ref, Action.OPEN))
+                   for word, entry_ref in zip(words, entry_refs)]
+        return InlineKeyboardMarkup([buttons[i:i + 3] for i in range(0, len(buttons), 3)])
+
+def button_target(button: str, view: ViewState):
+    # The view a button leads to, or the action it triggers
+    # Anything that changes what is shown starts over at the first page
+    if Button.is_lexeme(button):
+        return view.replace(lexeme=Button.lexeme_number(button), page=0)
+    if button in TOGGLE_BUTTONS:
+        return view.with_toggle(TOGGLE_BUTTONS[button])
+    if button == Button.MORE_DEFINITIONS:
+        return view.replace(definitions=view.definitions + 1, page=0)
+    if button == Button.LESS_DEFINITIONS:
+        return view.replace(definitions=max(view.definitions - 1, 1), page=0)
+    if button == Button.PREVIOUS_PAGE:
+        return view.replace(page=max(view.page - 1, 0))
+    if button == Button.NEXT_PAGE:
+        return view.replace(page=view.page + 1)
+    if button == Button.BACK:
+        return view.reset()
+    if button == Button.CLOSE:
+        return Action.CLOSE
+    return Action.NOOP
@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+from typing import Optional
+from resilience import UpstreamError
+from rate import TokenBucket
+
+# The RapidAPI keys upstream requests are spread across. Each key has its own host, a
+# token bucket for the plan's request rate and the quota counters RapidAPI reports in
+# the x-ratelimit-requests-* headers of every response. A request takes the key with
+# the largest share of its quota left among those with a token; a key answering 429
+# is benched with a growing backoff while the others carry on. Requests queue in
+# priority order, so interactive lookups go before background work (refresh-ahead,
+# /random refill), and background work also leaves the last share of every quota to
+# users. Quota counters are saved to API_KEY_STATE_PATH, under a hash of the key, so
+# a restart doesn't have to rediscover an exhausted quota the hard way.
+# RAPIDAPI_KEYS is a comma-separated list of key or key@host; without it the single
+# RAPIDAPI_KEY is used with API_BASE_URL as its host.
+
+class RequestPriority:
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+QUOTA_HEADERS = (
+    ("x-ratelimit-requests-limit", "x-ratelimit-requests-remaining", "x-ratelimit-requests-reset"),
+    ("x-ratelimit-limit", "x-ratelimit-remaining", "x-ratelimit-reset"),
+)
+
+def header_int(headers, name: str) -> Optional[int]:
+    try:
+        return int(float(headers.get(name, "")))
+    except ValueError:
+        return None
+
+class ApiKey:
+    def __init__(self, key: str, host: str, rate: float, burst: float):
+        self.key = key
+        self.host = host
+        # Identifies the key in logs, metrics and the state file without revealing it
+        self.id = hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+        self.headers = {"x-rapidapi-key": key, "x-rapidapi-host": host}
+        self.bucket = TokenBucket(rate, burst)
+        self.quota_limit: Optional[int] = None
+        self.quota_remaining: Optional[int] = None
+        self.quota_reset_at = 0.0  # wall clock, so it survives a restart
+        self.throttled = 0  # consecutive 429s
+        self.stats = {"requests": 0, "throttled": 0}
+
+    def url(self, scheme: str, path: str) -> str:
+        return f"{scheme}://{self.host}{path}"
+
+    def quota_share(self, now: float) -> float:
+        # Share of the quota left, 1.0 while unknown or after the reset
+        if self.quota_remaining is None or not self.quota_limit or now >= self.quota_reset_at:
+            return 1.0
+        return max(0, self.quota_remaining) / self.quota_limit
+
+    def exhausted(self, now: float) -> bool:
+        return self.quota_remaining is not None and self.quota_remaining <= 0 and now < self.quota_reset_at
+
+class KeyPool:
+    def __init__(self, keys: list[ApiKey], state_path: str = None, background_reserve: float = None,
+                 backoff: float = None, backoff_max: float = None):
+        if not keys:
+            raise ValueError("The key pool needs at least one key")
+        self.keys = keys
+        self.state_path = state_path if state_path is not None else os.getenv("API_KEY_STATE_PATH", "api_keys.json")
+        # Share of every quota background requests leave to interactive ones
+        self.background_reserve = background_reserve if background_reserve is not None else float(os.getenv("API_KEY_BACKGROUND_RESERVE", 0.1))
+        self.backoff = backoff or float(os.getenv("API_KEY_BACKOFF", 1.0))
+        self.backoff_max = backoff_max or float(os.getenv("API_KEY_BACKOFF_MAX", 60.0))
+        self.save_interval = 30.0
+        self.saved_at = 0.0
+        self.dirty = False
+        self.queue: list[tuple[int, int]] = []
+        self.tickets = itertools.count()
+        self.changed = asyncio.Event()
+        self.stats = {"waited": 0, "exhausted": 0}
+        # The saved state is read on the first acquire, so constructing a pool touches no files
+        self.loaded = False
+
+    @classmethod
+    def from_env(cls, default_host: str) -> "KeyPool":
+        # Each key's plan rate; effectively unlimited until configured
+        rate = float(os.getenv("API_KEY_RATE", 1000))
+        burst = float(os.getenv("API_KEY_BURST", rate))
+        specs = [spec.strip() for spec in os.getenv("RAPIDAPI_KEYS", "").split(",") if spec.strip()]
+        if not specs:
+            specs = [os.getenv("RAPIDAPI_KEY", "")]
+        keys = []
+        for spec in specs:
+            key, _, host = spec.partition("@")
+            keys.append(ApiKey(key, host or default_host, rate, burst))
+        return cls(keys)
+
+    async def acquire(self, priority: int = RequestPriority.INTERACTIVE) -> ApiKey:
+        # Waits for its turn and a key with a token; raises UpstreamError when every
+        # quota this priority may use is spent
+        if not self.loaded:
+            self.load()
+        ticket = (priority, next(self.tickets))
+        heapq.heappush(self.queue, ticket)
+        waited = False
+        try:
+            while True:
+                wait = None
+                if self.queue[0] == ticket:
+                    key, wait = self._pick(priority)
+                    if key is not None:
+                        key.bucket.take()
+                        key.stats["requests"] += 1
+                        if key.quota_remaining is not None:
+                            key.quota_remaining -= 1
+                        return key
+                if not waited:
+                    waited = True
+                    self.stats["waited"] += 1
+                changed = self.changed
+                try:
+                    await asyncio.wait_for(changed.wait(), wait)
+                except TimeoutError:
+                    pass
+        finally:
+            self.queue.remove(ticket)
+            heapq.heapify(self.queue)
+            self._notify()
+
+    def _pick(self, priority: int) -> tuple[Optional[ApiKey], Optional[float]]:
+        # The key to use now, or how long until one has a token
+        now, wall = time.monotonic(), time.time()
+        usable = [
+            key for key in self.keys
+            if not key.exhausted(wall)
+            and (priority == RequestPriority.INTERACTIVE or key.quota_share(wall) > self.background_reserve)
+        ]
+        if not usable:
+            self.stats["exhausted"] += 1
+            raise UpstreamError("Every API key is out of quota", retryable=False, throttled=True)
+        waits = [key.bucket.wait_time(now) for key in usable]
+        ready = [key for key, wait in zip(usable, waits) if wait == 0]
+        if not ready:
+            return None, min(waits)
+        return max(ready, key=lambda key: (key.quota_share(wall), key.bucket.tokens)), None
+
+    def _notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def record(self, key: ApiKey, status: int, headers) -> None:
+        # Takes the quota counters from a response
+        if status != 429:
+            key.throttled = 0
+        for limit_name, remaining_name, reset_name in QUOTA_HEADERS:
+            remaining = header_int(headers, remaining_name)
+            if remaining is None:
+                continue
+            now = time.time()
+            # Requests sent after this one are already counted locally, until the reset
+            if key.quota_remaining is not None and now < key.quota_reset_at:
+                remaining = min(remaining, key.quota_remaining)
+            key.quota_remaining = remaining
+            key.quota_limit = header_int(headers, limit_name) or key.quota_limit
+            reset = header_int(headers, reset_name)
+            if reset is not None:
+                key.quota_reset_at = now + reset
+            self.dirty = True
+            break
+        if self.dirty and time.monotonic() - self.saved_at >= self.save_interval:
+            self.save()
+
+    def throttle(self, key: ApiKey, retry_after: float = None) -> None:
+        # Benches a key that answered 429; the other keys carry on. Requests that were
+        # already in flight when it was benched don't lengthen the bench.
+        key.stats["throttled"] += 1
+        now = time.monotonic()
+        if now < key.bucket.blocked_until:
+            return
+        delay = min(self.backoff_max, self.backoff * 2 ** key.throttled)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        key.throttled += 1
+        key.bucket.block(now + delay)
+        # No burst right after the bench either
+        key.bucket.tokens = 0
+        logging.info(f"API key {key.id} throttled, benched for {delay:.1f}s")
+        self._notify()
+
+    def quota_remaining(self) -> dict[tuple[str], int]:
+        return {(key.id,): key.quota_remaining for key in self.keys if key.quota_remaining is not None}
+
+    def events(self) -> dict[tuple[str, str], int]:
+        return {(key.id, name): value for key in self.keys for name, value in key.stats.items()}
+
+    def save(self) -> None:
+        # An unused pool has nothing to add to the saved state, and must not overwrite it
+        if not self.state_path or not self.loaded:
+            return
+        state = {
+            key.id: {"limit": key.quota_limit, "remaining": key.quota_remaining, "reset_at": key.quota_reset_at}
+            for key in self.keys if key.quota_remaining is not None
+        }
+        temporary = f"{self.state_path}.tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(state, file)
+            os.replace(temporary, self.state_path)
+        except OSError as e:
+            logging.warning(f"Failed to save the API key state: {e}")
+            return
+        self.saved_at = time.monotonic()
+        self.dirty = False
+
+    def load(self) -> None:
+        self.loaded = True
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable API key state {self.state_path}: {e}")
+            return
+        now = time.time()
+        for key in self.keys:
+            saved = state.get(key.id)
+            # Counters from before the last reset say nothing any more
+            if saved and saved.get("reset_at", 0) > now:
+                key.quota_limit = saved.get("limit")
+                key.quota_remaining = saved.get("remaining")
+                key.quota_reset_at = saved["reset_at"]
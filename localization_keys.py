@@ -21,6 +21,8 @@ class Phrases(Enum):
     RHYMES = auto()
     BACK = auto()
     CLOSE = auto()
+    PREVIOUS_PAGE = auto()
+    NEXT_PAGE = auto()
 
     # Command replies
     LANGUAGE_CHANGED = auto()
@@ -33,6 +35,11 @@ class Phrases(Enum):
 
     # Errors
     WORD_NOT_FOUND = auto()
+    DID_YOU_MEAN = auto()
+    DICTIONARY_UNAVAILABLE = auto()
+    BATCH_NOT_FOUND = auto()
+    BATCH_UNAVAILABLE = auto()
+    BATCH_TRUNCATED = auto()
     NO_DEFINITIONS_FOUND = auto()
 
     UNKNOWN_ACTION = auto()
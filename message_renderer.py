@@ -0,0 +1,271 @@
+import itertools
+import os
+import re
+import weakref
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional, TypeVar
+from enums import Toggle
+from Entry import Entry, Sense
+
+# HTML rendering of entries. Every sense is split into fragments (definition line,
+# examples, synonyms, antonyms, collocations) once per Entry and indentation level,
+# and rendered pages are memoized per (chosen lexeme, definitions, toggles, page), so a
+# button press only assembles pieces that were already built.
+#
+# A message is split into blocks (a lexeme summary, a sense or a subsense,
+# with the etymology header and trailing blank lines glued to their neighbours) and
+# fills pages of up to RENDER_PAGE_BUDGET characters with whole blocks. A block too big
+# for a page on its own (a sense with hundreds of examples or synonyms) is cut at line
+# ends, and only a single line longer than a page is cut mid-line, its open tags closed
+# and reopened, so no page goes over the budget. The block plan is built by walking the
+# entry without rendering anything; a page only renders its own blocks and, the first
+# time, those of the pages before it to find where it starts. Page starts (a block and
+# a piece of it) are remembered per view, so boundaries stay put and paging back is free.
+
+SUBSENSE_MAX_DEPTH = 5  # Adjustable max recursion depth
+INDENT_BASE = "       "
+MESSAGES_PER_ENTRY = 64
+# Telegram allows 4096 characters after parsing; HTML markup only makes the text longer
+RENDER_PAGE_BUDGET = int(os.getenv("RENDER_PAGE_BUDGET", 4000))
+
+roman_numerals = {
+    1: "I",
+    2: "II",
+    3: "III",
+    4: "IV",
+    5: "V",
+    6: "VI",
+    7: "VII",
+    8: "VIII",
+    9: "IX",
+    10: "X",
+}
+
+T = TypeVar("T")
+
+HTML_TOKEN = re.compile(r"<[^>]*>|&#?\w+;|[^<&\s]+\s*|\s+|[<&]")
+TAG_NAME = re.compile(r"<(\w+)")
+
+def with_last(items: Iterator[T]) -> Iterator[tuple[T, bool]]:
+    # Each item with whether it is the last one
+    iterator = iter(items)
+    try:
+        previous = next(iterator)
+    except StopIteration:
+        return
+    for item in iterator:
+        yield previous, False
+        previous = item
+    yield previous, True
+
+def split_line(line: str, room: int) -> list[str]:
+    # A line cut into pieces of at most room characters, preferably between words; the
+    # tags open at a cut are closed at the end of the piece and reopened in the next one
+    pieces, current, opened = [], "", []
+
+    def closing() -> str:
+        return "".join(f"</{TAG_NAME.match(tag).group(1)}>" for tag in reversed(opened))
+
+    for token in HTML_TOKEN.findall(line):
+        atoms = [token] if token[0] in "<&" or len(token) < room // 2 else list(token)
+        for atom in atoms:
+            reopened = "".join(opened)
+            if len(current) > len(reopened) and len(current) + len(atom) + len(closing()) > room:
+                pieces.append(current + closing())
+                current = reopened
+            current += atom
+            if atom.startswith("</"):
+                if opened:
+                    opened.pop()
+            elif TAG_NAME.match(atom) and not atom.endswith("/>"):
+                opened.append(atom)
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_block(text: str, room: int) -> list[str]:
+    # A block's text as pieces that each fit a page: whole lines where possible
+    if len(text) <= room:
+        return [text]
+    pieces, current = [], ""
+    for line in text.splitlines(keepends=True):
+        for part in split_line(line, room) if len(line) > room else (line,):
+            if current and len(current) + len(part) > room:
+                pieces.append(current)
+                current = ""
+            current += part
+    if current:
+        pieces.append(current)
+    return pieces
+
+def definition_with_labels(sense: Sense) -> str:
+    return f"({', '.join(sense.labels)}) {sense.definition}" if sense.labels else sense.definition
+
+class SenseFragments:
+    __slots__ = ("head", "fields", "subsense_prefix")
+
+    def __init__(self, sense: Sense, level: int):
+        indent = INDENT_BASE * level + INDENT_BASE
+        self.head = definition_with_labels(sense) + "\n"
+        self.fields = (
+            (Toggle.EXAMPLES, "".join(f"{indent}<i>{example}</i>\n" for example in sense.examples)),
+            (Toggle.SYNONYMS, f"{indent}<i><b>≈</b> {', '.join(sense.synonyms)}</i>\n" if sense.synonyms else ""),
+            (Toggle.ANTONYMS, f"{indent}<i><b>≠</b> {', '.join(sense.antonyms)}</i>\n" if sense.antonyms else ""),
+            (Toggle.COLLOCATIONS, f"{indent}<i>Collocations: {', '.join(sense.collocations)}</i>\n" if sense.collocations else ""),
+        )
+        self.subsense_prefix = indent
+
+class EntryRenderCache:
+    def __init__(self, entry: Entry):
+        self.entry = weakref.proxy(entry)
+        self.fragments: dict[tuple[int, int], SenseFragments] = {}
+        self.senses: dict[tuple[int, int, int], str] = {}
+        # Block and piece every page starts at, per (chosen lexeme, definitions, toggles, budget)
+        self.page_starts: dict[tuple, list[tuple[int, int]]] = {}
+        self.pages: OrderedDict[tuple, tuple[str, int, bool]] = OrderedDict()
+
+    def sense_fragments(self, sense: Sense, level: int) -> SenseFragments:
+        key = (id(sense), level)
+        fragments = self.fragments.get(key)
+        if fragments is None:
+            fragments = self.fragments[key] = SenseFragments(sense, level)
+        return fragments
+
+    def render_sense(self, sense: Sense, level: int, toggles: int) -> str:
+        # A sense without its subsenses, which sense_blocks renders as blocks of their own
+        key = (id(sense), level, toggles)
+        rendered = self.senses.get(key)
+        if rendered is not None:
+            return rendered
+
+        fragments = self.sense_fragments(sense, level)
+        parts = [fragments.head]
+        parts.extend(text for flag, text in fragments.fields if toggles & flag and text)
+        rendered = self.senses[key] = "".join(parts)
+        return rendered
+
+    def header(self) -> str:
+        entry = self.entry
+        redirect = f"Redirected from <b>{entry.redirected_from}</b>\n\n" if entry.redirected_from else ""
+        return f"{redirect}\"{entry.etymologies[0].lexemes[0].lemma}\":\n\n"
+
+    def sense_blocks(self, sense: Sense, level: int, toggles: int, lead: str) -> Iterator[Callable[[], str]]:
+        # A sense and each of its subsenses, numbered and indented, as separate blocks
+        yield lambda: lead + self.render_sense(sense, level, toggles)
+        if level < SUBSENSE_MAX_DEPTH:
+            prefix = self.sense_fragments(sense, level).subsense_prefix
+            for idx, subsense in enumerate(sense.subsenses, start=1):
+                yield from self.sense_blocks(subsense, level + 1, toggles, f"{prefix}<b>{idx}.</b> ")
+
+    def blocks(self, chosen_lexeme_id: int, definitions_requested: int, toggles: int) -> Iterator[Callable[[], str]]:
+        # The blocks of the message after the header, in order. Each block is held back until the next one is known, so trailing newlines can be glued to it.
+        def glued(block: Callable[[], str], prefix: str = "", suffix: str = "") -> Callable[[], str]:
+            return lambda: prefix + block() + suffix
+
+        entry = self.entry
+        pending = None
+        lexeme_number = 0
+        single_lexeme = entry.lexeme_amount() == 1
+        for etymology_idx, etymology in enumerate(entry.etymologies, start=1):
+            etymology_header = f"<b><u>Etymology {roman_numerals.get(etymology_idx, etymology_idx)}</u></b>\n" if not chosen_lexeme_id and len(entry.etymologies) > 1 else ""
+            if chosen_lexeme_id:
+                etymology_header += f"<b>{entry.get_lexeme_by_index(chosen_lexeme_id - 1).part_of_speech.title()}</b>\n"
+
+            for lexeme in etymology.lexemes:
+                lexeme_number += 1
+                if chosen_lexeme_id and lexeme_number != chosen_lexeme_id:
+                    continue
+                if not chosen_lexeme_id and not single_lexeme:
+                    first_sense = lexeme.senses[0]
+                    summary = f"<b>{lexeme_number}. </b><b>{lexeme.part_of_speech.title()}</b>\n{definition_with_labels(first_sense)}\n"
+                    if first_sense.definition:
+                        lexeme_blocks = [lambda summary=summary: summary]
+                    else:
+                        subsense = first_sense.subsenses[0]
+                        lexeme_blocks = [lambda summary=summary, subsense=subsense: summary + self.render_sense(subsense, 0, toggles) + "\n"]
+                else:
+                    lexeme_blocks = (
+                        glued(block, suffix="\n") if last else block
+                        for sense_number, sense in enumerate(lexeme.senses[:definitions_requested], start=1)
+                        for block, last in with_last(self.sense_blocks(sense, 0, toggles, f"<b>{sense_number}.</b> "))
+                    )
+                empty = True
+                for block in lexeme_blocks:
+                    if pending is not None:
+                        yield pending
+                    pending = glued(block, prefix=etymology_header)
+                    etymology_header = ""
+                    empty = False
+                if empty:
+                    if pending is not None:
+                        yield pending
+                    pending = glued(lambda: "", prefix=etymology_header)
+                    etymology_header = ""
+                pending = glued(pending, suffix="\n")
+        if pending is not None:
+            yield pending
+
+    def page(self, chosen_lexeme_id: int, definitions_requested: int, toggles: int, page: int, budget: int) -> tuple[str, int, bool]:
+        # The text of a page, its number (clamped to the last page) and whether more follow
+        view_key = (chosen_lexeme_id, definitions_requested, toggles, budget)
+        key = (*view_key, page)
+        cached = self.pages.get(key)
+        if cached is not None:
+            self.pages.move_to_end(key)
+            return cached
+
+        header = self.header()
+        # Every page starts with the header, the rest of the budget goes to blocks
+        room = budget - len(header)
+        starts = self.page_starts.get(view_key)
+        if starts is None:
+            starts = self.page_starts[view_key] = [(0, 0)]
+            if len(self.page_starts) > MESSAGES_PER_ENTRY:
+                del self.page_starts[next(iter(self.page_starts))]
+        number = min(page, len(starts) - 1)
+        while True:
+            # Walking the blocks up to the page start builds closures but renders nothing
+            block, piece = starts[number]
+            blocks = itertools.islice(self.blocks(chosen_lexeme_id, definitions_requested, toggles), block, None)
+            texts, next_start = self.fill_page(blocks, room, piece)
+            has_next = next_start is not None
+            if has_next and len(starts) == number + 1:
+                starts.append((block + next_start[0], next_start[1]))
+            if number == page or not has_next:
+                break
+            # Pages before the requested one are only walked to find where it starts
+            number += 1
+
+        result = self.pages[key] = (header + "".join(texts), number, has_next)
+        if len(self.pages) > MESSAGES_PER_ENTRY:
+            self.pages.popitem(last=False)
+        return result
+
+    @staticmethod
+    def fill_page(blocks: Iterator[Callable[[], str]], room: int, skip: int = 0) -> tuple[list[str], Optional[tuple[int, int]]]:
+        # Renders blocks while they fit, cutting one that can't fit a page into pieces; the
+        # first skip pieces of the first block belong to earlier pages. Returns the texts
+        # and, if anything is left, where the next page starts: (blocks used, piece)
+        texts, size = [], 0
+        for index, block in enumerate(blocks):
+            pieces = split_block(block(), room)
+            for number in range(skip if index == 0 else 0, len(pieces)):
+                text = pieces[number]
+                if texts and size + len(text) > room:
+                    return texts, (index, number)
+                texts.append(text)
+                size += len(text)
+        return texts, None
+
+render_caches: "weakref.WeakKeyDictionary[Entry, EntryRenderCache]" = weakref.WeakKeyDictionary()
+
+def get_render_cache(entry: Entry) -> EntryRenderCache:
+    cache = render_caches.get(entry)
+    if cache is None:
+        cache = render_caches[entry] = EntryRenderCache(entry)
+    return cache
+
+def render_entry_page(entry: Entry, chosen_lexeme_id: int, definitions_requested: int, toggles: int,
+                      page: int = 0, budget: int = None) -> tuple[str, int, bool]:
+    # One page of the message within the character budget: text, page number, whether more follow
+    return get_render_cache(entry).page(chosen_lexeme_id or 0, definitions_requested, toggles, page, budget or RENDER_PAGE_BUDGET)
@@ -0,0 +1,137 @@
+import bisect
+import math
+from typing import Callable, Iterable
+
+# Minimal in-process metrics in the Prometheus text format: counters, histograms and
+# gauges read at scrape time. Modules declare their metrics on the shared REGISTRY,
+# the webhook server serves REGISTRY.render() at /metrics. Observing is a dict lookup
+# for the labels, a bisect over the bucket bounds and two additions, so it stays
+# around a microsecond and needs no locks on the event loop.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def format_labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}"
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[], float | dict[tuple, float]], labels: tuple[str, ...] = ()):
+        # collect returns the value, or {label values: value} for a labelled gauge
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.collect = collect
+
+    def samples(self) -> Iterable[str]:
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            yield f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}"
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        self.children: dict[tuple, HistogramChild] = {}
+
+    def labels(self, *labels) -> HistogramChild:
+        child = self.children.get(labels)
+        if child is None:
+            child = self.children[labels] = HistogramChild(self.buckets)
+        return child
+
+    def observe(self, value: float, *labels) -> None:
+        self.labels(*labels).observe(value)
+
+    def samples(self) -> Iterable[str]:
+        names = self.label_names + ("le",)
+        for labels, child in self.children.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), child.counts):
+                cumulative += count
+                yield f"{self.name}_bucket{format_labels(names, labels + (format_value(bound),))} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.label_names, labels)} {format_value(child.sum)}"
+            yield f"{self.name}_count{format_labels(self.label_names, labels)} {child.count}"
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Counter | Gauge | Histogram] = {}
+
+    def register(self, metric):
+        # Registering a name twice returns the existing metric, so modules can be reloaded
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, collect: Callable, labels: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, collect, labels))
+
+    def histogram(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
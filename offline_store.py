@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import mmap
+import os
+import random
+import struct
+import tempfile
+import time
+import zlib
+from collections import OrderedDict
+from typing import Iterator, Optional
+from Entry import Entry
+from entry_cache import normalize_key
+from variant_resolver import invert_first_case
+from timings import stage
+from wikked_api import WikkedAPI
+from key_pool import RequestPriority
+
+# Offline copy of the dictionary. A JSONL dump in the schema Entry.from_json reads is
+# imported into a store directory with three files:
+#   entries.bin  zlib-compressed entry JSONs, one after another
+#   index.bin    fixed-size records sorted by key: key offset and length, entry offset
+#                and length, kind
+#   keys.bin     the UTF-8 keys the index records point into
+# Every entry is indexed under its headword, under the word it was redirected from
+# (if the dump has "redirected_from") and under its case-inverted headword, so "May"
+# and "may" both hit without a second lookup. When a key has several records, the
+# headword wins over a redirect, and a redirect over a case variant. The importer streams
+# the dump and sorts the index externally in bounded chunks, so memory doesn't grow
+# with the dump. Reads go through mmap, a lookup is a binary search over index.bin.
+
+INDEX_RECORD = struct.Struct("<QIQIB")
+RUN_RECORD_HEADER = struct.Struct("<IBQI")
+
+KIND_HEADWORD = 0
+KIND_REDIRECT = 1
+KIND_VARIANT = 2
+
+ENTRIES_FILE = "entries.bin"
+INDEX_FILE = "index.bin"
+KEYS_FILE = "keys.bin"
+
+def index_keys(entry_json: dict) -> list[tuple[bytes, int]]:
+    headword = normalize_key(entry_json["entry"])
+    keys = [(headword.encode("utf-8"), KIND_HEADWORD)]
+    redirected_from = entry_json.get("redirected_from")
+    if redirected_from:
+        keys.append((normalize_key(redirected_from).encode("utf-8"), KIND_REDIRECT))
+    variant = invert_first_case(headword)
+    if variant != headword:
+        keys.append((variant.encode("utf-8"), KIND_VARIANT))
+    return keys
+
+def write_run(records: list[tuple[bytes, int, int, int]], directory: str) -> str:
+    records.sort()
+    fd, path = tempfile.mkstemp(prefix="index-run-", dir=directory)
+    with os.fdopen(fd, "wb") as file:
+        for key, kind, offset, length in records:
+            file.write(RUN_RECORD_HEADER.pack(len(key), kind, offset, length))
+            file.write(key)
+    return path
+
+def read_run(path: str) -> Iterator[tuple[bytes, int, int, int]]:
+    with open(path, "rb", buffering=1 << 20) as file:
+        while header := file.read(RUN_RECORD_HEADER.size):
+            key_length, kind, offset, length = RUN_RECORD_HEADER.unpack(header)
+            yield file.read(key_length), kind, offset, length
+
+def import_jsonl(dump_path: str, store_path: str, chunk_size: int = 500_000, compression: int = 1) -> dict[str, float]:
+    # Returns import statistics: entries, skipped lines, index keys and seconds taken
+    os.makedirs(store_path, exist_ok=True)
+    start = time.perf_counter()
+    entries = skipped = 0
+    records: list[tuple[bytes, int, int, int]] = []
+    runs: list[str] = []
+    with open(dump_path, "r", encoding="utf-8") as dump, open(os.path.join(store_path, ENTRIES_FILE), "wb") as data:
+        offset = 0
+        for line in dump:
+            try:
+                entry_json = json.loads(line)
+                keys = index_keys(entry_json)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                skipped += 1
+                continue
+            if not entry_json.get("etymologies"):
+                skipped += 1
+                continue
+            if "redirected_from" in entry_json:
+                # Whether an entry is shown as redirected depends on the key it was found by
+                del entry_json["redirected_from"]
+                line = json.dumps(entry_json, ensure_ascii=False, separators=(",", ":"))
+            payload = zlib.compress(line.strip().encode("utf-8"), compression)
+            data.write(payload)
+            records.extend((key, kind, offset, len(payload)) for key, kind in keys)
+            offset += len(payload)
+            entries += 1
+            if len(records) >= chunk_size:
+                runs.append(write_run(records, store_path))
+                records = []
+        if records:
+            runs.append(write_run(records, store_path))
+
+    keys_written = 0
+    with open(os.path.join(store_path, INDEX_FILE), "wb") as index, open(os.path.join(store_path, KEYS_FILE), "wb") as keys_file:
+        key_offset = 0
+        previous = None
+        for key, kind, data_offset, length in heapq.merge(*(read_run(run) for run in runs)):
+            if key == previous:
+                # Sorted by kind within a key, so the first record is the preferred one
+                continue
+            previous = key
+            index.write(INDEX_RECORD.pack(key_offset, len(key), data_offset, length, kind))
+            keys_file.write(key)
+            key_offset += len(key)
+            keys_written += 1
+    for run in runs:
+        os.remove(run)
+    return {"entries": entries, "skipped": skipped, "keys": keys_written, "seconds": time.perf_counter() - start}
+
+def map_file(path: str) -> Optional[mmap.mmap]:
+    # mmap refuses empty files, an empty store simply has nothing mapped
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+class DictionaryStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = map_file(os.path.join(path, ENTRIES_FILE))
+        self.index = map_file(os.path.join(path, INDEX_FILE))
+        self.keys = map_file(os.path.join(path, KEYS_FILE))
+        self.size = len(self.index) // INDEX_RECORD.size if self.index is not None else 0
+
+    def _record(self, position: int) -> tuple[int, int, int, int, int]:
+        return INDEX_RECORD.unpack_from(self.index, position * INDEX_RECORD.size)
+
+    def _key(self, record: tuple) -> bytes:
+        return self.keys[record[0]:record[0] + record[1]]
+
+    def find(self, word: str) -> Optional[tuple[int, int, int]]:
+        # (entry offset, entry length, kind) of the word, or None
+        key = normalize_key(word).encode("utf-8")
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            record = self._record(middle)
+            middle_key = self._key(record)
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return record[2], record[3], record[4]
+        return None
+
+    def load_json(self, offset: int, length: int) -> dict:
+        return json.loads(zlib.decompress(self.entries[offset:offset + length]))
+
+    def get_json(self, word: str) -> Optional[dict]:
+        found = self.find(word)
+        if found is None:
+            return None
+        offset, length, kind = found
+        entry_json = self.load_json(offset, length)
+        if kind == KIND_REDIRECT:
+            entry_json["redirected_from"] = normalize_key(word)
+        return entry_json
+
+    def headwords(self) -> Iterator[str]:
+        # In index order, which is the code point order of the keys
+        for position in range(self.size):
+            record = self._record(position)
+            if record[4] == KIND_HEADWORD:
+                yield self._key(record).decode("utf-8")
+
+    def random_json(self, attempts: int = 16) -> Optional[dict]:
+        for _ in range(attempts if self.size else 0):
+            record = self._record(random.randrange(self.size))
+            if record[4] == KIND_HEADWORD:
+                return self.load_json(record[2], record[3])
+        return None
+
+    def close(self) -> None:
+        for mapped in (self.entries, self.index, self.keys):
+            if mapped is not None:
+                mapped.close()
+
+class LocalWikkedAPI:
+    # Same interface as WikkedAPI: entries come from the offline store and only words
+    # it doesn't have are fetched from the remote API. Parsed entries are kept in an
+    # LRU, so repeated views of an entry reuse the same Entry and its render cache.
+    # The index search, decompression and parsing run in a worker thread, off the loop.
+    def __init__(self, store: DictionaryStore, remote: WikkedAPI, cache_size: int = None):
+        self.store = store
+        self.remote = remote
+        self.cache_size = cache_size or int(os.getenv("OFFLINE_STORE_CACHE_SIZE", 2048))
+        self.parsed: OrderedDict[str, Entry] = OrderedDict()
+        self.stats = {"local_hits": 0, "remote_fallbacks": 0}
+
+    @property
+    def flights(self):
+        return self.remote.flights
+
+    @property
+    def cache(self):
+        return self.remote.cache
+
+    async def fetch(self, requested_entry: str, priority: int = RequestPriority.INTERACTIVE) -> Entry:
+        requested_entry = normalize_key(requested_entry)
+        entry = self.parsed.get(requested_entry)
+        if entry is not None:
+            self.parsed.move_to_end(requested_entry)
+            self.stats["local_hits"] += 1
+            return entry
+
+        with stage("parse"):
+            entry = await asyncio.to_thread(self._load, self.store.get_json, requested_entry)
+        if entry is None:
+            self.stats["remote_fallbacks"] += 1
+            return await self.remote.fetch(requested_entry, priority)
+
+        self.stats["local_hits"] += 1
+        self.remember(requested_entry, entry)
+        return entry
+
+    async def fetch_random(self, priority: int = RequestPriority.INTERACTIVE) -> Entry:
+        with stage("parse"):
+            entry = await asyncio.to_thread(self._load, self.store.random_json)
+        if entry is None:
+            return await self.remote.fetch_random(priority)
+        self.remember(normalize_key(entry.entry), entry)
+        return entry
+
+    @staticmethod
+    def _load(get_json, *args) -> Optional[Entry]:
+        entry_json = get_json(*args)
+        return Entry.from_json(entry_json) if entry_json is not None else None
+
+    def remember(self, key: str, entry: Entry) -> None:
+        self.parsed[key] = entry
+        self.parsed.move_to_end(key)
+        if len(self.parsed) > self.cache_size:
+            self.parsed.popitem(last=False)
+
+    async def close(self) -> None:
+        await self.remote.close()
+        self.store.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a JSONL dictionary dump into an offline store")
+    parser.add_argument("dump")
+    parser.add_argument("store")
+    parser.add_argument("--chunk-size", type=int, default=500_000, help="index records sorted in memory at once")
+    parser.add_argument("--compression", type=int, default=1, help="zlib level; 1 imports about twice as fast as 6")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    result = import_jsonl(args.dump, args.store, args.chunk_size, args.compression)
+    print(f"Imported {result['entries']} entries ({result['skipped']} skipped), {result['keys']} index keys "
+          f"in {result['seconds']:.1f}s ({result['entries'] / max(result['seconds'], 1e-9):.0f} entries/s)")
+
+if __name__ == "__main__":
+    main()
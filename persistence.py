@@ -0,0 +1,235 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional
+from telegram.ext import BasePersistence, PersistenceInput
+
+# user_data persistence shared by every bot process. Storage is pluggable through
+# StateBackend; SQLiteStateBackend is the local implementation. Each user row carries
+# a version, so before an update is handled a process reloads that user's data only
+# if another process wrote a newer version. Writes are buffered and flushed in one
+# transaction per persistence cycle instead of one write per update. A write only
+# lands on the version it was based on; if another process wrote in between, the
+# keys this process changed are applied onto the stored data and written again, so
+# concurrent changes to different keys (a LOCALE set through one process, a
+# LAST_MESSAGE_ID through another) both survive.
+
+MERGE_ATTEMPTS = 5
+
+def encode_user_data(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False)
+
+def decode_user_data(payload: str) -> dict:
+    return json.loads(payload)
+
+def changed_keys(base: dict, data: dict) -> tuple[dict, set]:
+    # The keys data sets to a different value than base, and the keys it removed
+    changed = {key: value for key, value in data.items() if key not in base or base[key] != value}
+    return changed, base.keys() - data.keys()
+
+def apply_changes(stored: dict, changed: dict, removed: set) -> dict:
+    merged = {key: value for key, value in stored.items() if key not in removed}
+    merged.update(changed)
+    return merged
+
+class StateBackend:
+    def load(self, user_id: int) -> Optional[tuple[int, str]]:
+        # Returns (version, payload) of the user, or None if nothing is stored
+        raise NotImplementedError
+
+    def save_many(self, payloads: dict[int, tuple[int, str]]) -> tuple[dict[int, int], dict[int, Optional[tuple[int, str]]]]:
+        # Takes (version the payload is based on, payload) per user, 0 for a new user, and
+        # stores in one transaction those still based on the stored version. Returns the
+        # new version of each stored user and what is stored now for each conflicting one.
+        raise NotImplementedError
+
+    def delete(self, user_id: int) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+class SQLiteStateBackend(StateBackend):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # WAL lets several processes on the host read while one of them writes
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS user_data ("
+            "user_id INTEGER PRIMARY KEY, payload TEXT NOT NULL, "
+            "version INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def load(self, user_id: int) -> Optional[tuple[int, str]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT version, payload FROM user_data WHERE user_id = ?", (user_id,)
+            ).fetchone()
+
+    def save_many(self, payloads: dict[int, tuple[int, str]]) -> tuple[dict[int, int], dict[int, Optional[tuple[int, str]]]]:
+        versions, conflicts = {}, {}
+        now = time.time()
+        with self._lock, self._db:
+            for user_id, (base_version, payload) in payloads.items():
+                if base_version:
+                    row = self._db.execute(
+                        "UPDATE user_data SET payload = ?, version = version + 1, updated_at = ? "
+                        "WHERE user_id = ? AND version = ? RETURNING version",
+                        (payload, now, user_id, base_version),
+                    ).fetchone()
+                else:
+                    row = self._db.execute(
+                        "INSERT INTO user_data (user_id, payload, version, updated_at) VALUES (?, ?, 1, ?) "
+                        "ON CONFLICT(user_id) DO NOTHING RETURNING version",
+                        (user_id, payload, now),
+                    ).fetchone()
+                if row is not None:
+                    versions[user_id] = row[0]
+                else:
+                    conflicts[user_id] = self._db.execute(
+                        "SELECT version, payload FROM user_data WHERE user_id = ?", (user_id,)
+                    ).fetchone()
+        return versions, conflicts
+
+    def delete(self, user_id: int) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+class SharedPersistence(BasePersistence):
+    def __init__(self, backend: StateBackend, update_interval: float = 2):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.backend = backend
+        # Version of the stored data each user's live user_data reflects
+        self.versions: dict[int, int] = {}
+        # (version, payload) last read or written per user, the base of the next write
+        self.stored: dict[int, tuple[int, str]] = {}
+        self.pending: dict[int, str] = {}
+        self.stats = {"written": 0, "merged": 0}
+        self._flush_task: asyncio.Task = None
+
+    async def get_user_data(self) -> dict[int, dict]:
+        # Users are loaded lazily by refresh_user_data when they send an update
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self.pending:
+            # Local changes that are not flushed yet are the newest ones; the flush
+            # merges them onto whatever another process wrote meanwhile
+            return
+        row = await asyncio.to_thread(self.backend.load, user_id)
+        if row is None:
+            return
+        version, payload = row
+        if version > self.versions.get(user_id, 0):
+            user_data.clear()
+            user_data.update(decode_user_data(payload))
+            self.versions[user_id] = version
+            self.stored[user_id] = (version, payload)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self.pending[user_id] = encode_user_data(data)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_pending())
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self.pending.pop(user_id, None)
+        self.versions.pop(user_id, None)
+        self.stored.pop(user_id, None)
+        await asyncio.to_thread(self.backend.delete, user_id)
+
+    async def _flush_pending(self) -> None:
+        # Yield once so every user updated in this persistence cycle lands in the same batch
+        await asyncio.sleep(0)
+        while self.pending:
+            batch, self.pending = self.pending, {}
+            try:
+                await self._write(batch)
+            except Exception as e:
+                logging.error(f"Failed to persist user data for {len(batch)} users: {e}")
+                for user_id, payload in batch.items():
+                    self.pending.setdefault(user_id, payload)
+                return
+
+    async def _write(self, batch: dict[int, str]) -> None:
+        writes = {user_id: (self.stored.get(user_id, (0, None))[0], payload) for user_id, payload in batch.items()}
+        changes = {}
+        for _ in range(MERGE_ATTEMPTS):
+            saved, conflicts = await asyncio.to_thread(self.backend.save_many, writes)
+            for user_id, version in saved.items():
+                self.stored[user_id] = (version, writes[user_id][1])
+                if user_id not in changes:
+                    # The live user_data is exactly what was written
+                    self.versions[user_id] = version
+            self.stats["written"] += len(saved)
+            if not conflicts:
+                return
+            # Another process wrote first: this process's changes go on top of its data.
+            # The live user_data is left behind, so the next update reloads the merge.
+            writes = {}
+            for user_id, row in conflicts.items():
+                if user_id not in changes:
+                    base = self.stored.get(user_id)
+                    changes[user_id] = changed_keys(decode_user_data(base[1]) if base else {}, decode_user_data(batch[user_id]))
+                version, payload = row or (0, "{}")
+                if not any(changes[user_id]):
+                    # Nothing of ours to add, the stored data stands
+                    self.stored[user_id] = (version, payload)
+                    continue
+                writes[user_id] = (version, encode_user_data(apply_changes(decode_user_data(payload), *changes[user_id])))
+            self.stats["merged"] += len(writes)
+            if not writes:
+                return
+        raise RuntimeError(f"user data of {len(writes)} users kept changing during {MERGE_ATTEMPTS} attempts")
+
+    async def flush(self) -> None:
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._flush_pending()
+        self.backend.close()
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
@@ -0,0 +1,91 @@
+import heapq
+import json
+import logging
+import os
+import sys
+import time
+from array import array
+from typing import Optional
+
+# Which words are hot right now. Every lookup is counted in a count-min sketch, a
+# fixed-size table that overestimates but never underestimates a count; words whose
+# estimate beats the current top are kept in a small top-K dict. Every half-life all
+# counts are halved, so yesterday's hits fade. The top can be saved to and restored
+# from a JSON snapshot, so a restart doesn't start cold.
+
+class PopularityTracker:
+    def __init__(self, top_size: int = None, width: int = None, depth: int = 4, half_life: float = None):
+        self.top_size = top_size or int(os.getenv("POPULARITY_TOP_SIZE", 1000))
+        self.width = width or int(os.getenv("POPULARITY_SKETCH_WIDTH", 1 << 16))
+        self.depth = depth
+        self.half_life = half_life or float(os.getenv("POPULARITY_HALF_LIFE", 6 * 3600))
+        self.rows = [array("I", bytes(4 * self.width)) for _ in range(depth)]
+        self.top: dict[str, int] = {}
+        self.floor = 0
+        self.decayed_at = time.monotonic()
+
+    def _cells(self, word: str) -> list[int]:
+        # Double hashing: one hash gives every row its own cell
+        hashed = hash(word)
+        first, step = hashed & 0xFFFFFFFF, (hashed >> 32) | 1
+        return [(first + row * step) % self.width for row in range(self.depth)]
+
+    def record(self, word: str, count: int = 1) -> int:
+        # Counts the word and returns its estimated count
+        self._decay_if_due()
+        estimate = None
+        for row, cell in zip(self.rows, self._cells(word)):
+            row[cell] = value = min(row[cell] + count, 0xFFFFFFFF)
+            estimate = value if estimate is None else min(estimate, value)
+        if word in self.top or len(self.top) < self.top_size or estimate > self.floor:
+            self.top[word] = estimate
+            if len(self.top) > self.top_size * 1.25:
+                self._trim()
+        return estimate
+
+    def estimate(self, word: str) -> int:
+        return min(row[cell] for row, cell in zip(self.rows, self._cells(word)))
+
+    def hottest(self, n: int = None) -> list[str]:
+        return heapq.nlargest(n or self.top_size, self.top, key=self.top.__getitem__)
+
+    def _trim(self) -> None:
+        kept = self.hottest(self.top_size)
+        self.top = {word: self.top[word] for word in kept}
+        self.floor = self.top[kept[-1]] if kept else 0
+
+    def _decay_if_due(self) -> None:
+        halvings = int((time.monotonic() - self.decayed_at) // self.half_life)
+        if halvings <= 0:
+            return
+        self.decayed_at += halvings * self.half_life
+        shift = min(halvings, 32)
+        # Each row is shifted as one big integer, with the bits that slid into the next
+        # cell masked off, instead of halving depth * width cells one by one on the event loop
+        mask = int.from_bytes((0xFFFFFFFF >> shift).to_bytes(4, sys.byteorder) * self.width, sys.byteorder)
+        for index, row in enumerate(self.rows):
+            decayed = int.from_bytes(row.tobytes(), sys.byteorder) >> shift & mask
+            self.rows[index] = array("I", decayed.to_bytes(4 * self.width, sys.byteorder))
+        self.top = {word: count >> shift for word, count in self.top.items() if count >> shift}
+        self.floor >>= shift
+
+    def save(self, path: str) -> None:
+        # Written aside and moved into place, so a crash never leaves half a snapshot
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({word: self.top[word] for word in self.hottest()}, file, ensure_ascii=False)
+        os.replace(temporary, path)
+
+    def load(self, path: str) -> Optional[list[str]]:
+        # Restores the counts of a snapshot; returns its words, hottest first
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                counts = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable popularity snapshot {path}: {e}")
+            return None
+        for word, count in counts.items():
+            self.record(word, int(count))
+        return sorted(counts, key=counts.__getitem__, reverse=True)
@@ -0,0 +1,142 @@
+import asyncio
+import bisect
+import heapq
+import os
+import sys
+from typing import Iterable
+
+# Headwords known to the bot, for inline autocomplete. The words are kept in one
+# list sorted case-insensitively, a prefix is a binary search plus a short walk. Words
+# that have been looked up are also kept in a much smaller sorted list with their
+# lookup counts; those are ranked first, the rest of the range fills up what's left
+# in alphabetical order, so the exact word comes before its longer continuations.
+# New words are collected aside and merged into the sorted list on the next search.
+# The full list can be sorted in a worker thread (sort_words) and swapped in on the
+# event loop (install) while the index keeps serving the words it already has.
+
+def fold(word: str) -> str:
+    return word.casefold()
+
+def sort_key(word: str) -> tuple[str, str]:
+    # "may" and "May" sit next to each other, in a stable order
+    return fold(word), word
+
+class PrefixIndex:
+    def __init__(self, max_results: int = None, scan_limit: int = None, hot_size: int = None):
+        self.max_results = max_results or int(os.getenv("INLINE_MAX_RESULTS", 20))
+        # How many words of the range are looked at for a short prefix like "a"
+        self.scan_limit = scan_limit or int(os.getenv("INLINE_SCAN_LIMIT", 200))
+        self.hot_size = hot_size or int(os.getenv("INLINE_HOT_SIZE", 10000))
+        self.words: list[str] = []
+        self.pending: set[str] = set()
+        self.hot: list[str] = []
+        self.popularity: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        self._merge()
+        return len(self.words)
+
+    def build(self, words: Iterable[str]) -> None:
+        self.install(self.sort_words(words))
+
+    @staticmethod
+    def sort_words(words: Iterable[str]) -> list[str]:
+        # Two plain sorts are much faster than one with tuple keys; the second is
+        # stable, so equal folds stay in code point order. Touches no index state.
+        words = sorted(set(words))
+        words.sort(key=fold)
+        return words
+
+    def install(self, words: list[str]) -> None:
+        # Takes a list from sort_words; words added before stay, popularity counts are kept
+        added = [*self.words, *self.pending]
+        self.words, self.pending = words, set()
+        for word in added:
+            self.add(word)
+
+    def add(self, word: str) -> None:
+        if word and not self._contains(word):
+            self.pending.add(word)
+
+    def record(self, word: str) -> None:
+        # A successful lookup of the word
+        self.add(word)
+        count = self.popularity.get(word, 0)
+        self.popularity[word] = count + 1
+        if not count:
+            bisect.insort(self.hot, word, key=sort_key)
+            if len(self.hot) > self.hot_size * 1.1:
+                self._trim_hot()
+
+    def search(self, prefix: str, limit: int = None) -> list[str]:
+        self._merge()
+        limit = limit or self.max_results
+        folded = fold(prefix.strip())
+        results = heapq.nsmallest(
+            limit,
+            self._range(self.hot, folded, len(self.hot)),
+            key=lambda word: (-self.popularity[word], len(word), sort_key(word)),
+        )
+        if len(results) < limit:
+            chosen = set(results)
+            for word in self._range(self.words, folded, self.scan_limit):
+                if word not in chosen:
+                    results.append(word)
+                    if len(results) == limit:
+                        break
+        return results
+
+    def memory_bytes(self) -> int:
+        # Lists plus the strings they hold; strings shared between the lists are counted once
+        strings = {id(word): sys.getsizeof(word) for word in (*self.words, *self.pending, *self.hot)}
+        return (sys.getsizeof(self.words) + sys.getsizeof(self.pending) + sys.getsizeof(self.hot)
+                + sys.getsizeof(self.popularity) + sum(strings.values()))
+
+    def _range(self, words: list[str], folded: str, limit: int) -> Iterable[str]:
+        position = bisect.bisect_left(words, folded, key=fold)
+        for word in words[position:position + limit]:
+            if not fold(word).startswith(folded):
+                return
+            yield word
+
+    def _contains(self, word: str) -> bool:
+        if word in self.pending:
+            return True
+        key = sort_key(word)
+        position = bisect.bisect_left(self.words, key, key=sort_key)
+        return position < len(self.words) and self.words[position] == word
+
+    def _merge(self) -> None:
+        if not self.pending:
+            return
+        if len(self.pending) < 64:
+            for word in self.pending:
+                bisect.insort(self.words, word, key=sort_key)
+        else:
+            self.words = list(heapq.merge(self.words, sorted(self.pending, key=sort_key), key=sort_key))
+        self.pending = set()
+
+    def _trim_hot(self) -> None:
+        keep = heapq.nlargest(self.hot_size, self.hot, key=self.popularity.__getitem__)
+        for word in set(self.hot).difference(keep):
+            del self.popularity[word]
+        self.hot = sorted(keep, key=sort_key)
+
+class Debouncer:
+    # Telegram sends an inline query per keystroke and only shows the answer to the
+    # latest one. A query is answered once its user has stopped typing for the delay;
+    # the ones a newer query from the same user replaced in the meantime are dropped.
+    def __init__(self, delay: float = None):
+        self.delay = float(os.getenv("INLINE_DEBOUNCE", 0.3)) if delay is None else delay
+        self.latest: dict[int, object] = {}
+        self.stats = {"settled": 0, "superseded": 0}
+
+    async def settle(self, user_id: int) -> bool:
+        token = self.latest[user_id] = object()
+        await asyncio.sleep(self.delay)
+        if self.latest.get(user_id) is not token:
+            self.stats["superseded"] += 1
+            return False
+        del self.latest[user_id]
+        self.stats["settled"] += 1
+        return True
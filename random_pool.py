@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+from Entry import Entry
+from key_pool import RequestPriority
+
+# Random entries fetched ahead of time, so /random is answered from memory. A
+# background worker tops the pool up to the high watermark whenever it falls below the
+# low one, in concurrent batches, at no more than the configured fetches per second.
+# The pool starts empty and is first filled after the first /random, so a bot
+# nobody asks for random entries spends no quota on them. When the pool is empty
+# (on that first request, or under a burst of /random) the caller fetches directly
+# instead of waiting for the worker. Refill fetches are background work and
+# queue behind users' own lookups for an API key.
+
+class RandomPool:
+    def __init__(self, fetch_random: Callable[..., Awaitable[Entry]], size: int = None, low_watermark: int = None,
+                 batch: int = None, refill_rate: float = None):
+        self.fetch_random = fetch_random
+        self.size = size or int(os.getenv("RANDOM_POOL_SIZE", 10))
+        self.low_watermark = low_watermark or int(os.getenv("RANDOM_POOL_LOW", self.size // 2))
+        self.batch = batch or int(os.getenv("RANDOM_POOL_BATCH", 5))
+        self.refill_rate = refill_rate or float(os.getenv("RANDOM_POOL_REFILL_RATE", 2.0))
+        self.entries: deque[Entry] = deque(maxlen=self.size)
+        self.low = asyncio.Event()
+        self.worker: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "fallbacks": 0, "fetched": 0, "failed": 0}
+
+    def start(self) -> None:
+        if self.worker is None:
+            self.worker = asyncio.create_task(self._refill_loop(), name="random-pool-refill")
+
+    async def stop(self) -> None:
+        if self.worker is not None:
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+            self.worker = None
+
+    async def take(self) -> Entry:
+        if self.entries:
+            self.stats["hits"] += 1
+            entry = self.entries.popleft()
+        else:
+            self.stats["fallbacks"] += 1
+            entry = None
+        if len(self.entries) < self.low_watermark:
+            self.low.set()
+        return entry if entry is not None else await self.fetch_random()
+
+    async def _refill_loop(self) -> None:
+        while True:
+            await self.low.wait()
+            while len(self.entries) < self.size:
+                batch = min(self.batch, self.size - len(self.entries))
+                start = time.monotonic()
+                results = await asyncio.gather(*(self.fetch_random(RequestPriority.BACKGROUND) for _ in range(batch)), return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        self.stats["failed"] += 1
+                    elif result.entry:
+                        self.stats["fetched"] += 1
+                        self.entries.append(result)
+                if all(isinstance(result, Exception) for result in results):
+                    logging.warning(f"Random pool refill failed: {results[0]}")
+                # Spaces the batches out to the refill rate, failed ones included
+                await asyncio.sleep(max(0.0, batch / self.refill_rate - (time.monotonic() - start)))
+            self.low.clear()
@@ -0,0 +1,37 @@
+import time
+
+# Token bucket shared by the rate limits: Bot API calls per chat and overall, requests
+# per RapidAPI key, and the refresh-ahead budget. Holds up to capacity tokens refilled
+# at rate per second; a block (a 429's Retry-After) withholds tokens until it passes.
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        # Seconds until a token can be taken
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def block(self, until: float) -> None:
+        self.blocked_until = max(self.blocked_until, until)
+
+    def is_idle(self, now: float) -> bool:
+        self.refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable
+from Entry import Entry
+from entry_cache import EntryCache
+from popularity import PopularityTracker
+from rate import TokenBucket
+
+# Keeps hot words from ever missing the cache. Every interval the hottest words are
+# checked: a copy about to leave memory is reloaded from disk (free), and an entry
+# about to expire on disk, or already expired, is fetched again from upstream before
+# anybody asks for it. Upstream refreshes come out of a per-minute budget, hottest
+# words first; what doesn't fit waits for the next round. At startup the top of the
+# last popularity snapshot is warmed the same way, and the snapshot is saved every
+# round and at shutdown.
+
+class RefreshAhead:
+    def __init__(self, tracker: PopularityTracker, cache: EntryCache, refresh: Callable[[str], Awaitable[Entry]],
+                 snapshot_path: str = None, interval: float = None, window: float = None, top_n: int = None,
+                 budget_per_minute: float = None, concurrency: int = 4):
+        self.tracker = tracker
+        self.cache = cache
+        self.refresh = refresh
+        self.snapshot_path = snapshot_path if snapshot_path is not None else os.getenv("POPULARITY_SNAPSHOT_PATH", "popularity.json")
+        self.interval = interval or float(os.getenv("REFRESH_AHEAD_INTERVAL", 60))
+        # Entries expiring on disk within this many seconds are refreshed
+        self.window = window or float(os.getenv("REFRESH_AHEAD_WINDOW", 3600))
+        self.top_n = top_n or int(os.getenv("REFRESH_AHEAD_TOP", 200))
+        budget = budget_per_minute or float(os.getenv("REFRESH_AHEAD_BUDGET", 30))
+        self.budget = TokenBucket(budget / 60, budget)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.worker: asyncio.Task = None
+        self.stats = {"checked": 0, "refreshed": 0, "failed": 0, "over_budget": 0}
+
+    def start(self) -> None:
+        if self.worker is None:
+            self.worker = asyncio.create_task(self._loop(), name="refresh-ahead")
+
+    async def stop(self) -> None:
+        if self.worker is not None:
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+            self.worker = None
+        self.save_snapshot()
+
+    async def _loop(self) -> None:
+        words = self.tracker.load(self.snapshot_path) if self.snapshot_path else None
+        if words:
+            await self.refresh_due(words[:self.top_n])
+            logging.info(f"Warmed {len(words[:self.top_n])} words from {self.snapshot_path}: {self.stats}")
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh_due(self.tracker.hottest(self.top_n))
+                self.save_snapshot()
+            except Exception as e:
+                logging.warning(f"Refresh-ahead round failed: {e}")
+
+    async def refresh_due(self, words: list[str]) -> None:
+        # words hottest first
+        due = []
+        for word in words:
+            self.stats["checked"] += 1
+            remaining = await self.cache.warm(word)
+            if remaining is not None and remaining < self.window:
+                due.append(word)
+
+        tasks = []
+        for index, word in enumerate(due):
+            if self.budget.wait_time(time.monotonic()) > 0:
+                self.stats["over_budget"] += len(due) - index
+                break
+            self.budget.take()
+            tasks.append(self._refresh(word))
+        await asyncio.gather(*tasks)
+
+    async def _refresh(self, word: str) -> None:
+        async with self.semaphore:
+            try:
+                await self.refresh(word)
+                self.stats["refreshed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logging.warning(f"Refreshing '{word}' failed: {e}")
+
+    def save_snapshot(self) -> None:
+        if not self.snapshot_path or not self.tracker.top:
+            return
+        try:
+            self.tracker.save(self.snapshot_path)
+        except OSError as e:
+            logging.warning(f"Failed to save the popularity snapshot: {e}")
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Optional
+
+# Building blocks WikkedAPI puts around every upstream request: errors that tell
+# retryable failures from final ones, full-jitter backoff, a rolling latency window
+# whose p95 decides when a hedged duplicate request is sent, and a circuit breaker
+# that fails fast while the dictionary API keeps failing.
+
+class UpstreamError(Exception):
+    # The dictionary API failed; unlike a "not found" this says nothing about the word.
+    # A throttled request hit a key's limit, which says nothing about upstream's health.
+    def __init__(self, message: str, retryable: bool = True, retry_after: float = None, throttled: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.throttled = throttled
+
+class CircuitOpenError(UpstreamError):
+    def __init__(self, retry_in: float):
+        super().__init__(f"Circuit open, next probe in {retry_in:.1f}s", retryable=False)
+
+class Backoff:
+    def __init__(self, base: float = None, cap: float = None):
+        self.base = base or float(os.getenv("API_RETRY_BACKOFF", 0.2))
+        self.cap = cap or float(os.getenv("API_RETRY_BACKOFF_MAX", 2.0))
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        # Full jitter, so clients that failed together don't retry together
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.cap))
+        return delay
+
+class LatencyWindow:
+    def __init__(self, size: int = 256, min_samples: int = 20):
+        self.samples: deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        # None until there are enough samples to say anything
+        if len(self.samples) < self.min_samples:
+            return None
+        values = sorted(self.samples)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = None, reset_timeout: float = None):
+        self.failure_threshold = failure_threshold or int(os.getenv("API_BREAKER_FAILURES", 5))
+        self.reset_timeout = reset_timeout or float(os.getenv("API_BREAKER_RESET", 30))
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.probe_settled: asyncio.Event = None
+        self.stats = {"opened": 0, "rejected": 0}
+
+    async def before_request(self) -> None:
+        # Raises CircuitOpenError unless the request may go out
+        while True:
+            if self.state == self.OPEN:
+                retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+                if retry_in > 0:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(retry_in)
+                self.state = self.HALF_OPEN
+            if self.state != self.HALF_OPEN:
+                return
+            if not self.probing:
+                # One probe decides whether upstream is back, the others wait for it
+                self.probing = True
+                self.probe_settled = asyncio.Event()
+                return
+            await self.probe_settled.wait()
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self.settle_probe()
+
+    def abandon(self) -> None:
+        # A request that was cancelled tells nothing either way; a waiter takes over the probe
+        self.settle_probe()
+
+    def settle_probe(self) -> None:
+        if self.probing:
+            self.probing = False
+            self.probe_settled.set()
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.settle_probe()
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.stats["opened"] += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
@@ -0,0 +1,261 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Coroutine, Optional, Union
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from metrics import REGISTRY
+from rate import TokenBucket
+
+# Outbound scheduler for Bot API calls, plugged in as the application's rate limiter.
+# Calls addressed to a chat wait for a token from the global bucket and from their
+# chat's bucket (private chats and groups have different limits). Replies and edits
+# are let through before cosmetic calls (chat actions, and removing an old keyboard,
+# which its call site marks with rate_limit_args=Priority.COSMETIC).
+# Cosmetic calls that repeat one already queued share its result, and ones that went
+# stale while queued are dropped: a typing action once the reply itself is queued,
+# anything older than COSMETIC_MAX_AGE, or the oldest ones beyond COSMETIC_MAX_QUEUE.
+# A RetryAfter from Telegram blocks the chat for the given time; replies and edits are
+# retried, cosmetic calls are dropped. Calls without a chat, like answerCallbackQuery,
+# pass through.
+
+class Priority:
+    INTERACTIVE = 0
+    COSMETIC = 1
+
+PRIORITY_NAMES = {Priority.INTERACTIVE: "interactive", Priority.COSMETIC: "cosmetic"}
+
+JSONResult = Union[bool, dict, list]
+
+SEND_WAIT_SECONDS = REGISTRY.histogram("telegram_send_wait_seconds", "Time a Bot API call waited in the send queue", ("priority",))
+
+class SendJob:
+    __slots__ = ("priority", "chat_id", "endpoint", "merge_key", "enqueued", "granted", "result", "dropped")
+
+    def __init__(self, priority: int, chat_id: Union[int, str], endpoint: str, merge_key: Optional[tuple]):
+        loop = asyncio.get_running_loop()
+        self.priority = priority
+        self.chat_id = chat_id
+        self.endpoint = endpoint
+        self.merge_key = merge_key
+        self.enqueued = time.monotonic()
+        self.granted = loop.create_future()  # Resolves to True when the call may run, False if dropped
+        self.result = loop.create_future()  # Shared with merged duplicates
+        self.dropped = False
+
+class SendScheduler(BaseRateLimiter[int]):
+    def __init__(
+        self,
+        global_rate: float = None,
+        chat_rate: float = None,
+        chat_burst: float = None,
+        group_rate: float = None,
+        group_burst: float = None,
+        cosmetic_max_queue: int = None,
+        cosmetic_max_age: float = None,
+        max_retries: int = None,
+    ):
+        global_rate = global_rate or float(os.getenv("SEND_GLOBAL_RATE", 30))
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate or float(os.getenv("SEND_CHAT_RATE", 1))
+        self.chat_burst = chat_burst or float(os.getenv("SEND_CHAT_BURST", 3))
+        self.group_rate = group_rate or float(os.getenv("SEND_GROUP_RATE", 20 / 60))
+        self.group_burst = group_burst or float(os.getenv("SEND_GROUP_BURST", 3))
+        self.cosmetic_max_queue = cosmetic_max_queue or int(os.getenv("COSMETIC_MAX_QUEUE", 200))
+        self.cosmetic_max_age = cosmetic_max_age or float(os.getenv("COSMETIC_MAX_AGE", 5))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("SEND_MAX_RETRIES", 2))
+
+        self.chat_buckets: dict[Union[int, str], TokenBucket] = {}
+        self.queues = {Priority.INTERACTIVE: deque(), Priority.COSMETIC: deque()}
+        self.cosmetic_index: dict[tuple, SendJob] = {}
+        self._timer: asyncio.TimerHandle = None
+        self.stats = {
+            "sent": 0,
+            "merged": 0,
+            "dropped": 0,
+            "retry_after": 0,
+            "waited": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for queue in self.queues.values():
+            while queue:
+                self._drop(queue.popleft())
+
+    def queue_depth(self) -> dict[int, int]:
+        return {priority: len(queue) for priority, queue in self.queues.items()}
+
+    def mean_wait_time(self) -> float:
+        return self.stats["wait_time_total"] / self.stats["waited"] if self.stats["waited"] else 0.0
+
+    @staticmethod
+    def classify(endpoint: str, data: dict) -> int:
+        # Edits default to interactive: a Close press also removes a keyboard, and
+        # ExtBot leaves reply_markup=None out of data, so the payload can't tell them
+        # apart. Removing an old message's keyboard passes Priority.COSMETIC instead.
+        if endpoint == "sendChatAction":
+            return Priority.COSMETIC
+        return Priority.INTERACTIVE
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, JSONResult]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> JSONResult:
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+        with contextlib.suppress(ValueError, TypeError):
+            chat_id = int(chat_id)
+
+        # rate_limit_args lets a call site set its priority explicitly
+        priority = rate_limit_args if rate_limit_args is not None else self.classify(endpoint, data)
+        merge_key = None
+        if priority == Priority.COSMETIC:
+            merge_key = (endpoint, chat_id, data.get("message_id"), data.get("action"))
+            queued = self.cosmetic_index.get(merge_key)
+            if queued is not None:
+                self.stats["merged"] += 1
+                return await asyncio.shield(queued.result)
+
+        for attempt in range(self.max_retries + 1):
+            job = self._enqueue(priority, chat_id, endpoint, merge_key if attempt == 0 else None)
+            try:
+                if not await job.granted:
+                    return await job.result
+                result = await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                self.stats["retry_after"] += 1
+                retry_after = exc.retry_after.total_seconds() if hasattr(exc.retry_after, "total_seconds") else exc.retry_after
+                self._bucket(chat_id).block(time.monotonic() + retry_after)
+                if priority == Priority.COSMETIC:
+                    # Not worth waiting for, the call is dropped instead
+                    self.stats["dropped"] += 1
+                    self._settle(job, result=True)
+                    return True
+                if attempt == self.max_retries:
+                    self._settle(job, exception=exc)
+                    raise
+                logging.info(f"Flood control for chat {chat_id}, retrying {endpoint} after {retry_after}s")
+                self._settle(job, cancelled=True)
+                continue
+            except BaseException as exc:
+                self._settle(job, exception=exc)
+                raise
+            self._settle(job, result=result)
+            return result
+
+    def _enqueue(self, priority: int, chat_id: Union[int, str], endpoint: str, merge_key: Optional[tuple]) -> SendJob:
+        job = SendJob(priority, chat_id, endpoint, merge_key)
+        if merge_key is not None:
+            self.cosmetic_index[merge_key] = job
+        if priority == Priority.INTERACTIVE:
+            # A typing action still waiting behind the reply itself is pointless
+            for queued in self.queues[Priority.COSMETIC]:
+                if queued.chat_id == chat_id and queued.endpoint == "sendChatAction":
+                    self._drop(queued)
+        self.queues[priority].append(job)
+
+        cosmetic = self.queues[Priority.COSMETIC]
+        while len(cosmetic) > self.cosmetic_max_queue:
+            self._drop(cosmetic.popleft())
+        self._pump()
+        return job
+
+    def _bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 1024:
+                now = time.monotonic()
+                self.chat_buckets = {key: value for key, value in self.chat_buckets.items() if not value.is_idle(now)}
+            # Negative ids and @usernames are groups and channels
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _pump(self) -> None:
+        # Grants every queued call that has tokens, in priority order, and sets a timer
+        # for the earliest moment a blocked one could go
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        next_wake = None
+        for priority, queue in self.queues.items():
+            for job in list(queue):
+                if job.dropped or job.granted.done():
+                    queue.remove(job)
+                    continue
+                if priority == Priority.COSMETIC and now - job.enqueued > self.cosmetic_max_age:
+                    queue.remove(job)
+                    self._drop(job)
+                    continue
+                wait = max(self.global_bucket.wait_time(now), self._bucket(job.chat_id).wait_time(now))
+                if wait > 0:
+                    next_wake = wait if next_wake is None else min(next_wake, wait)
+                    continue
+                queue.remove(job)
+                self._grant(job, now)
+        if next_wake is not None:
+            self._timer = asyncio.get_running_loop().call_later(next_wake, self._pump)
+
+    def _grant(self, job: SendJob, now: float) -> None:
+        self.global_bucket.take()
+        self._bucket(job.chat_id).take()
+        waited = now - job.enqueued
+        self.stats["sent"] += 1
+        self.stats["waited"] += 1
+        self.stats["wait_time_total"] += waited
+        self.stats["wait_time_max"] = max(self.stats["wait_time_max"], waited)
+        SEND_WAIT_SECONDS.observe(waited, PRIORITY_NAMES[job.priority])
+        self._unindex(job)
+        job.granted.set_result(True)
+
+    def _drop(self, job: SendJob) -> None:
+        if job.dropped or job.granted.done():
+            return
+        job.dropped = True
+        self.stats["dropped"] += 1
+        self._unindex(job)
+        job.granted.set_result(False)
+        # Bot methods accept True from every endpoint scheduled as cosmetic
+        self._settle(job, result=True)
+
+    def _unindex(self, job: SendJob) -> None:
+        if job.merge_key is not None and self.cosmetic_index.get(job.merge_key) is job:
+            del self.cosmetic_index[job.merge_key]
+
+    def _settle(self, job: SendJob, result: JSONResult = None, exception: BaseException = None, cancelled: bool = False) -> None:
+        self._unindex(job)
+        if not job.granted.done():
+            # The caller was cancelled while its job was still queued
+            job.dropped = True
+            job.granted.cancel()
+        if job.result.done():
+            return
+        if cancelled or isinstance(exception, asyncio.CancelledError):
+            job.result.cancel()
+        elif exception is not None:
+            job.result.set_exception(exception)
+            # Retrieved here so a job without merged duplicates doesn't log it as unhandled
+            job.result.exception()
+        else:
+            job.result.set_result(result)
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+# Concurrent calls for the same key share one in-flight call and its result. Waiters
+# are shielded from each other: a cancelled waiter (e.g. a handler that timed out)
+# leaves the shared call running for the rest, and a call nobody waits for any more
+# still finishes, so its result lands in the cache. Each flight accepts a limited
+# number of waiters; callers beyond that start a new flight for the same key.
+
+T = TypeVar("T")
+
+class Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self, max_waiters: int = None):
+        self.max_waiters = max_waiters or int(os.getenv("SINGLE_FLIGHT_MAX_WAITERS", 1000))
+        self.flights: dict[Hashable, Flight] = {}
+        self.stats = {
+            "calls": 0,  # Calls that actually ran
+            "coalesced": 0,  # Callers served by a call already in flight
+            "overflows": 0,  # Flights started because the current one was full
+        }
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        flight = self.flights.get(key)
+        if flight is not None and flight.waiters < self.max_waiters:
+            self.stats["coalesced"] += 1
+        else:
+            if flight is not None:
+                self.stats["overflows"] += 1
+            flight = self._start(key, call)
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+
+    def _start(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> Flight:
+        self.stats["calls"] += 1
+        flight = self.flights[key] = Flight(asyncio.ensure_future(call()))
+        flight.task.add_done_callback(lambda task: self._land(key, flight))
+        return flight
+
+    def _land(self, key: Hashable, flight: Flight) -> None:
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        task = flight.task
+        if not task.cancelled() and task.exception() and not flight.waiters:
+            logging.warning(f"Lookup for '{key}' failed with nobody waiting: {task.exception()}")
+
+    @property
+    def saved_calls(self) -> int:
+        return self.stats["coalesced"]
+
+    def in_flight(self) -> int:
+        return len(self.flights)
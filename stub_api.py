@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+import tornado.httpserver
+import tornado.netutil
+import tornado.web
+
+# Local stand-in for the Wikked API: serves deterministic synthetic entries for
+# /entries/<word> and /random so the client can be exercised without network access.
+# Faults can be injected to exercise the client's resilience: error pages, slow
+# responses (the tail hedged requests are meant to cut), hangs and a full outage.
+# Like RapidAPI it can also enforce per-key limits: a request rate (429 with
+# Retry-After past it) and a quota per period, reported in x-ratelimit-requests-*
+# headers. Requests without a known key get a 403 once keys are configured.
+
+PROPER_NOUNS = {"May", "March", "Polish", "Turkey", "China", "August"}
+FIELDS = ("examples", "synonyms", "antonyms", "collocations")
+PARTS_OF_SPEECH = ("noun", "verb", "adjective", "adverb", "interjection")
+
+def entry_exists(word: str) -> bool:
+    if not word or word.lower().startswith("zz"):
+        return False
+    return word in PROPER_NOUNS or not word[0].isupper()
+
+def make_sense_json(rng: random.Random, word: str, depth: int) -> dict:
+    sense = {
+        "definition": f"A <i>sense</i> of {word} number {rng.randint(1, 999)}.",
+        "labels": rng.sample(["informal", "archaic", "US", "UK", "figuratively"], rng.randint(0, 2)),
+    }
+    for field in FIELDS:
+        if rng.random() < 0.5:
+            sense[field] = [f"{field[:-1]} {i} of <b>{word}</b>" for i in range(rng.randint(1, 3))]
+    if depth < 2 and rng.random() < 0.3:
+        sense["subsenses"] = [make_sense_json(rng, word, depth + 1) for _ in range(rng.randint(1, 3))]
+    return sense
+
+def make_entry_json(word: str, etymologies: int = None, lexemes: int = None, senses: int = None) -> dict:
+    rng = random.Random(hashlib.md5(word.encode("utf-8")).hexdigest())
+    return {
+        "entry": word,
+        "etymologies": [
+            {
+                "lexemes": [
+                    {
+                        "lemma": word,
+                        "part_of_speech": rng.choice(PARTS_OF_SPEECH),
+                        "senses": [make_sense_json(rng, word, 0) for _ in range(senses or rng.randint(1, 6))],
+                    }
+                    for _ in range(lexemes or rng.randint(1, 3))
+                ]
+            }
+            for _ in range(etymologies or rng.randint(1, 2))
+        ],
+    }
+
+class StubState:
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, slow_rate: float = 0.0,
+                 slow_latency: float = 1.0, hang_rate: float = 0.0, hang_seconds: float = 60.0,
+                 keys: list[str] = None, key_rate: float = 0.0, quota: int = 0, quota_period: float = 3600.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.down = False
+        self.keys = set(keys or ())
+        self.key_rate = key_rate
+        self.quota = quota
+        self.quota_period = quota_period
+        self.started = time.monotonic()
+        # key -> [tokens of its rate bucket, when they were counted, quota used in the period, period]
+        self.usage: dict[str, list] = {}
+        self.requests = 0
+        self.faults = {"errors": 0, "slow": 0, "hangs": 0, "throttled": 0, "over_quota": 0, "forbidden": 0}
+        self.words = [f"word{i}" for i in range(1000)]
+
+    def admit(self, key: str) -> tuple[str, dict]:
+        # Why a request with the key is refused, if it is, and the headers to send
+        if not self.keys:
+            return None, {}
+        if key not in self.keys:
+            return "forbidden", {}
+        now = time.monotonic()
+        period = int((now - self.started) // self.quota_period)
+        usage = self.usage.setdefault(key, [self.key_rate, now, 0, period])
+        if usage[3] != period:
+            usage[2:] = [0, period]
+        headers = {}
+        if self.quota:
+            reset = self.started + (period + 1) * self.quota_period - now
+            headers = {
+                "x-ratelimit-requests-limit": str(self.quota),
+                "x-ratelimit-requests-remaining": str(max(0, self.quota - usage[2] - 1)),
+                "x-ratelimit-requests-reset": str(int(reset)),
+            }
+            if usage[2] >= self.quota:
+                headers["x-ratelimit-requests-remaining"] = "0"
+                return "over_quota", {**headers, "Retry-After": str(int(reset) + 1)}
+        if self.key_rate:
+            tokens = min(self.key_rate, usage[0] + (now - usage[1]) * self.key_rate)
+            usage[:2] = [tokens, now]
+            if tokens < 1:
+                return "throttled", {**headers, "Retry-After": "1"}
+            usage[0] -= 1
+        usage[2] += 1
+        return None, headers
+
+    def fault(self) -> str:
+        # The fault to inject into the next response, if any
+        if self.down:
+            return "errors"
+        roll = random.random()
+        for fault, rate in (("errors", self.error_rate), ("hangs", self.hang_rate), ("slow", self.slow_rate)):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+class BaseStubHandler(tornado.web.RequestHandler):
+    def initialize(self, state: StubState):
+        self.state = state
+
+    async def respond(self, payload: dict) -> None:
+        self.state.requests += 1
+        refused, headers = self.state.admit(self.request.headers.get("x-rapidapi-key", ""))
+        for name, value in headers.items():
+            self.set_header(name, value)
+        if refused is not None:
+            self.state.faults[refused] += 1
+            self.set_status(403 if refused == "forbidden" else 429)
+            self.write({"message": "You are not subscribed to this API." if refused == "forbidden" else "Too many requests"})
+            return
+        fault = self.state.fault()
+        if fault is not None:
+            self.state.faults[fault] += 1
+        if fault == "hangs":
+            await asyncio.sleep(self.state.hang_seconds)
+        elif fault == "slow":
+            await asyncio.sleep(self.state.slow_latency)
+        elif self.state.latency:
+            await asyncio.sleep(self.state.latency)
+        if fault == "errors":
+            self.set_status(503)
+            self.write("<html><body>Service Unavailable</body></html>")
+            return
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(payload))
+
+class EntriesHandler(BaseStubHandler):
+    async def get(self, word: str):
+        await self.respond(make_entry_json(word) if entry_exists(word) else {"detail": "Not found"})
+
+class RandomHandler(BaseStubHandler):
+    async def get(self):
+        await self.respond(make_entry_json(random.choice(self.state.words)))
+
+class StatsHandler(BaseStubHandler):
+    def get(self):
+        self.write({"requests": self.state.requests, **self.state.faults})
+
+def make_app(state: StubState) -> tornado.web.Application:
+    return tornado.web.Application([
+        (r"/entries/(.+)", EntriesHandler, {"state": state}),
+        (r"/random", RandomHandler, {"state": state}),
+        (r"/stats", StatsHandler, {"state": state}),
+    ])
+
+def start_stub_in_thread(port: int = 0, latency: float = 0.0, **faults) -> tuple[StubState, int]:
+    # Runs the stub on its own event loop so blocking clients can be measured against it too
+    state = StubState(latency, **faults)
+    ready = threading.Event()
+    bound = {}
+
+    def run():
+        async def serve():
+            sockets = tornado.netutil.bind_sockets(port, address="127.0.0.1")
+            tornado.httpserver.HTTPServer(make_app(state)).add_sockets(sockets)
+            bound["port"] = sockets[0].getsockname()[1]
+            ready.set()
+            await asyncio.Event().wait()
+        asyncio.run(serve())
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return state, bound["port"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stub of the Wikked API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.1, help="Artificial response delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of responses that are 503 error pages")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of responses delayed by --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Share of requests that get no answer for a minute")
+    parser.add_argument("--keys", default="", help="Comma-separated API keys to accept; any key when empty")
+    parser.add_argument("--key-rate", type=float, default=0.0, help="Requests per second allowed per key")
+    parser.add_argument("--quota", type=int, default=0, help="Requests allowed per key per --quota-period")
+    parser.add_argument("--quota-period", type=float, default=3600.0)
+    args = parser.parse_args()
+
+    async def main():
+        state = StubState(args.latency, args.error_rate, args.slow_rate, args.slow_latency, args.hang_rate,
+                          keys=[key for key in args.keys.split(",") if key], key_rate=args.key_rate,
+                          quota=args.quota, quota_period=args.quota_period)
+        make_app(state).listen(args.port, address="127.0.0.1")
+        print(f"Stub Wikked API on http://127.0.0.1:{args.port} (latency {args.latency}s)")
+        await asyncio.Event().wait()
+    asyncio.run(main())
@@ -0,0 +1,163 @@
+import bisect
+import heapq
+import os
+from array import array
+from typing import Callable, Iterable, Iterator, Optional
+
+# "Did you mean" over known headwords, in the style of SymSpell's symmetric deletes:
+# every word is indexed under its first few characters with up to one character
+# deleted, and a query is looked up the same way. Two words sharing a key are at most
+# a deletion, insertion, substitution or adjacent transposition apart (or differ only
+# past the indexed prefix), and the few candidates are verified with a real edit
+# distance. Keys are 32-bit hashes packed with the word's id into one sorted array of
+# 64-bit integers, 8 bytes per key. Words added later go to a small overlay that is
+# merged into the array once it grows. The array can be built in a worker thread
+# (index_words) and swapped in on the event loop (install).
+
+def fold(word: str) -> str:
+    return word.casefold()
+
+def key_hash(key: str) -> int:
+    return hash(key) & 0xFFFFFFFF
+
+def within_one(a: str, b: str) -> bool:
+    # One deletion, insertion, substitution or adjacent transposition apart, in linear time
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > 1:
+        return False
+    start = 0
+    while start < len(a) and a[start] == b[start]:
+        start += 1
+    if len(a) < len(b):
+        return a[start:] == b[start + 1:]
+    if a[start + 1:] == b[start + 1:]:
+        return True
+    return (start + 1 < len(a) and a[start] == b[start + 1] and a[start + 1] == b[start]
+            and a[start + 2:] == b[start + 2:])
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    # Optimal string alignment distance, or limit + 1 as soon as it must exceed the limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+class SuggestionIndex:
+    def __init__(self, prefix_length: int = None, max_distance: int = None, max_suggestions: int = None, overlay_limit: int = 50000):
+        self.prefix_length = prefix_length or int(os.getenv("SUGGEST_PREFIX_LENGTH", 8))
+        self.max_distance = max_distance or int(os.getenv("SUGGEST_MAX_DISTANCE", 2))
+        self.max_suggestions = max_suggestions or int(os.getenv("SUGGEST_MAX_RESULTS", 5))
+        self.overlay_limit = overlay_limit
+        self.words: list[str] = []
+        self.postings = array("Q")
+        self.overlay: dict[int, list[int]] = {}
+        self.overlay_size = 0
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def delete_keys(self, word: str) -> set[str]:
+        key = fold(word)[:self.prefix_length]
+        keys = {key[:i] + key[i + 1:] for i in range(len(key))}
+        keys.add(key)
+        keys.discard("")
+        return keys
+
+    def build(self, words: Iterable[str], chunk_size: int = 200_000) -> None:
+        self.install(*self.index_words(words, chunk_size))
+
+    def index_words(self, words: Iterable[str], chunk_size: int = 200_000) -> tuple[list[str], array]:
+        # The words and their postings, sorted in chunks and merged so the temporary
+        # lists stay small. Touches no index state.
+        words = list(dict.fromkeys(words))
+        chunks = []
+        for start in range(0, len(words), chunk_size):
+            chunk = words[start:start + chunk_size]
+            chunks.append(array("Q", sorted(
+                key_hash(key) << 32 | word_id
+                for word_id, word in enumerate(chunk, start)
+                for key in self.delete_keys(word)
+            )))
+        return words, array("Q", heapq.merge(*chunks))
+
+    def install(self, words: list[str], postings: array) -> None:
+        # Takes the result of index_words; words added before stay
+        added = self.words
+        self.words, self.postings = words, postings
+        self.overlay, self.overlay_size = {}, 0
+        for word in added:
+            self.add(word)
+
+    def add(self, word: str) -> None:
+        if not word or self._contains(word):
+            return
+        word_id = len(self.words)
+        self.words.append(word)
+        for key in self.delete_keys(word):
+            self.overlay.setdefault(key_hash(key), []).append(word_id)
+            self.overlay_size += 1
+        if self.overlay_size > self.overlay_limit:
+            self._compact()
+
+    def suggest(self, word: str, popularity: Callable[[str], Optional[int]] = None, limit: int = None) -> list[str]:
+        # Known words closest to the word, nearest and then most looked up first
+        folded = fold(word.strip())
+        if not folded:
+            return []
+        # Two typos in a short word could be almost any other short word
+        max_distance = 1 if len(folded) <= 4 else self.max_distance
+        scored = []
+        for word_id in self._candidates(self.delete_keys(folded)):
+            candidate = self.words[word_id]
+            folded_candidate = fold(candidate)
+            if candidate == word or abs(len(folded_candidate) - len(folded)) > max_distance:
+                continue
+            if folded_candidate == folded:
+                distance = 0
+            elif within_one(folded, folded_candidate):
+                distance = 1
+            else:
+                # Keys are hashes, so sharing one proves nothing by itself
+                distance = edit_distance(folded, folded_candidate, max_distance)
+            if distance <= max_distance:
+                popular = (popularity(candidate) or 0) if popularity else 0
+                scored.append((distance, -popular, abs(len(candidate) - len(folded)), candidate))
+        return [candidate for *_, candidate in heapq.nsmallest(limit or self.max_suggestions, scored)]
+
+    def memory_bytes(self) -> int:
+        return self.postings.buffer_info()[1] * self.postings.itemsize + sum(8 + 4 * len(ids) for ids in self.overlay.values())
+
+    def _postings(self, hashed: int) -> Iterator[int]:
+        position = bisect.bisect_left(self.postings, hashed << 32)
+        while position < len(self.postings) and self.postings[position] >> 32 == hashed:
+            yield self.postings[position] & 0xFFFFFFFF
+            position += 1
+        yield from self.overlay.get(hashed, ())
+
+    def _candidates(self, keys: Iterable[str]) -> set[int]:
+        found = set()
+        for key in keys:
+            found.update(self._postings(key_hash(key)))
+        return found
+
+    def _contains(self, word: str) -> bool:
+        key = fold(word)[:self.prefix_length]
+        return any(self.words[word_id] == word for word_id in self._postings(key_hash(key)))
+
+    def _compact(self) -> None:
+        added = sorted(hashed << 32 | word_id for hashed, ids in self.overlay.items() for word_id in ids)
+        self.postings = array("Q", heapq.merge(self.postings, added))
+        self.overlay, self.overlay_size = {}, 0
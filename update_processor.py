@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Hashable, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Updates of different chats are processed in parallel, updates of one chat (or one
+# user, outside chats) strictly one after another in arrival order, so handlers can
+# keep read-modify-writing user_data. Waiting for its chat doesn't take one of the
+# running slots, so a user who sends ten messages at once doesn't hold up anybody
+# else. A button press identical to one still queued or running for the same message
+# (a double click) is answered and dropped: buttons carry the view they lead to, so
+# the second press would only repeat the first.
+
+class ChatLane:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_running: int = None, max_pending: int = None):
+        # The base class bounds the updates accepted at once, running or waiting for their chat
+        super().__init__(max_pending or int(os.getenv("UPDATE_MAX_PENDING", 10000)))
+        self.max_running = max_running or int(os.getenv("UPDATE_CONCURRENCY", 32))
+        self.running = asyncio.Semaphore(self.max_running)
+        self.active = 0
+        self.lanes: dict[Hashable, ChatLane] = {}
+        self.presses: set[tuple] = set()
+        self.stats = {"processed": 0, "waited_for_chat": 0, "merged_presses": 0}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @staticmethod
+    def lane_key(update: object) -> Optional[Hashable]:
+        if not isinstance(update, Update) or update.inline_query is not None:
+            # Inline queries are debounced per user and must not wait for each other
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return ("user", update.effective_user.id)
+        return None
+
+    @staticmethod
+    def press_key(update: object) -> Optional[tuple]:
+        if not isinstance(update, Update) or update.callback_query is None:
+            return None
+        query = update.callback_query
+        message = query.message.message_id if query.message else query.inline_message_id
+        return query.from_user.id, message, query.data
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        press = self.press_key(update)
+        if press is not None and press in self.presses:
+            self.stats["merged_presses"] += 1
+            coroutine.close()
+            await self.answer_merged(update)
+            return
+        if press is not None:
+            self.presses.add(press)
+        try:
+            key = self.lane_key(update)
+            if key is None:
+                await self.run(coroutine)
+                return
+            lane = self.lanes.get(key)
+            if lane is None:
+                lane = self.lanes[key] = ChatLane()
+            if lane.users:
+                self.stats["waited_for_chat"] += 1
+            lane.users += 1
+            try:
+                async with lane.lock:
+                    await self.run(coroutine)
+            finally:
+                lane.users -= 1
+                if not lane.users:
+                    del self.lanes[key]
+        finally:
+            if press is not None:
+                self.presses.discard(press)
+
+    async def run(self, coroutine: Awaitable[Any]) -> None:
+        async with self.running:
+            self.active += 1
+            try:
+                await coroutine
+            finally:
+                self.active -= 1
+        self.stats["processed"] += 1
+
+    async def answer_merged(self, update: Update) -> None:
+        # Stops the client's spinner; the first press does the actual work
+        try:
+            await update.callback_query.answer()
+        except Exception as e:
+            logging.warning(f"Failed to answer a merged button press: {e}")
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable
+from Entry import Entry
+
+# Resolves a requested word to the form that actually exists in the dictionary.
+# Variants are tried in tiers: the word as typed plus its case-inverted form first,
+# then the same pair after each normalizer. All variants of a tier are fetched at
+# once and the most preferred hit wins. Resolved forms are remembered in an alias
+# index, so "may" -> "May" costs a single lookup the next time.
+
+APOSTROPHES = str.maketrans({"‘": "'", "’": "'", "ʼ": "'", "′": "'", "`": "'"})
+TRAILING_PUNCTUATION = re.compile(r"[\s.,;:!?…\"')\]]+$")
+
+def invert_first_case(word: str) -> str:
+    return word[0].swapcase() + word[1:] if word else word
+
+def fold_width(word: str) -> str:
+    # Full-width latin letters and digits to their ASCII forms
+    return unicodedata.normalize("NFKC", word)
+
+def straighten_apostrophes(word: str) -> str:
+    return word.translate(APOSTROPHES)
+
+def strip_trailing_punctuation(word: str) -> str:
+    return TRAILING_PUNCTUATION.sub("", word)
+
+DEFAULT_NORMALIZERS = (fold_width, straighten_apostrophes, strip_trailing_punctuation)
+
+def variant_tiers(word: str, normalizers=DEFAULT_NORMALIZERS) -> list[list[str]]:
+    tiers = []
+    seen = set()
+    form = word
+    for normalizer in (None, *normalizers):
+        if normalizer is not None:
+            form = normalizer(form)
+        tier = [variant for variant in (form, invert_first_case(form)) if variant and variant not in seen]
+        seen.update(tier)
+        if tier:
+            tiers.append(tier)
+    return tiers
+
+class VariantResolver:
+    def __init__(self, fetch: Callable[[str], Awaitable[Entry]], normalizers=DEFAULT_NORMALIZERS, alias_size: int = None):
+        self.fetch = fetch
+        self.normalizers = normalizers
+        self.alias_size = alias_size or int(os.getenv("VARIANT_ALIAS_SIZE", 10000))
+        self.aliases: OrderedDict[str, str] = OrderedDict()
+        self._background: set[asyncio.Task] = set()
+
+    async def resolve(self, word: str) -> tuple[str, Entry]:
+        alias = self.aliases.get(word)
+        if alias is not None:
+            self.aliases.move_to_end(word)
+            entry = await self.fetch(alias)
+            if entry.entry:
+                return alias, entry
+            del self.aliases[word]
+
+        for tier in variant_tiers(word, self.normalizers):
+            variant, entry, settled = await self._resolve_tier(tier)
+            if entry.entry:
+                if settled:
+                    self.remember(word, variant)
+                return variant, entry
+        return word, Entry()
+
+    def remember(self, word: str, variant: str) -> None:
+        if word == variant:
+            return
+        self.aliases[word] = variant
+        self.aliases.move_to_end(word)
+        while len(self.aliases) > self.alias_size:
+            self.aliases.popitem(last=False)
+
+    async def _resolve_tier(self, tier: list[str]) -> tuple[str, Entry, bool]:
+        # A failed variant only fails the tier when no other variant of it has an entry.
+        # The hit is then served but not remembered as an alias, since the failed, more
+        # preferred variant might have existed
+        tasks = [asyncio.ensure_future(self.fetch(variant)) for variant in tier]
+        error = None
+        try:
+            for index, task in enumerate(tasks):
+                try:
+                    entry = await task
+                except Exception as e:
+                    logging.warning(f"Variant lookup failed: {e}")
+                    error = error or e
+                    continue
+                if entry.entry:
+                    # Less preferred variants are already in flight; let them finish into the cache
+                    for pending in tasks[index + 1:]:
+                        self._detach(pending)
+                    return tier[index], entry, error is None
+        except BaseException:
+            for task in tasks:
+                self._detach(task)
+            raise
+        if error is not None:
+            raise error
+        return tier[0], Entry(), True
+
+    def _detach(self, task: asyncio.Task) -> None:
+        if task.done():
+            if not task.cancelled() and task.exception():
+                logging.warning(f"Variant lookup failed: {task.exception()}")
+            return
+        self._background.add(task)
+        task.add_done_callback(self._forget)
+
+    def _forget(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception():
+            logging.warning(f"Variant lookup failed: {task.exception()}")
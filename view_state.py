@@ -0,0 +1,30 @@
+from enums import Toggle
+
+# What a message is currently showing. Entries themselves live once in the shared
+# entry cache; a view only keeps the key to get the entry back from it. Views travel
+# inside the callback_data of the buttons, so nothing has to be kept per user.
+
+class ViewState:
+    __slots__ = ("entry_key", "lexeme", "definitions", "toggles", "page")
+
+    def __init__(self, entry_key: str, lexeme: int = 0, definitions: int = 1, toggles: int = 0, page: int = 0):
+        self.entry_key = entry_key
+        self.lexeme = lexeme  # 1-based number of the chosen lexeme, 0 if none is chosen
+        self.definitions = definitions
+        self.toggles = toggles
+        self.page = page  # 0-based page of a message longer than the render budget
+
+    def replace(self, **changes) -> 'ViewState':
+        values = {slot: getattr(self, slot) for slot in self.__slots__}
+        values.update(changes)
+        return ViewState(**values)
+
+    def with_toggle(self, flag: Toggle) -> 'ViewState':
+        return self.replace(toggles=self.toggles | int(flag), page=0)
+
+    def reset(self) -> 'ViewState':
+        return ViewState(self.entry_key)
+
+    def __repr__(self):
+        return (f"ViewState(entry_key={self.entry_key!r}, lexeme={self.lexeme}, "
+                f"definitions={self.definitions}, toggles={self.toggles}, page={self.page})")
@@ -0,0 +1,126 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from http import HTTPStatus
+import tornado.web
+from tornado.httpserver import HTTPServer
+from typing import Optional
+from telegram import Update
+from telegram.error import InvalidToken, RetryAfter, TelegramError
+from telegram.ext import Application
+from metrics import REGISTRY, Registry
+
+# Webhook server used instead of Application.run_webhook, so the same port can serve
+# /metrics next to the webhook path. Updates are put on the application's update
+# queue just like PTB's own webhook handler does; the application lifecycle
+# (initialize, post_init, start, stop, post_stop, shutdown, post_shutdown) follows
+# run_webhook as well, and so do drop_pending_updates and bootstrap_retries (-1 retries
+# setting the webhook forever, 0 not at all).
+# The webhook port is public, so /metrics is only served on it to requests bearing
+# METRICS_TOKEN, and not at all without one. Given a metrics_port, /metrics is served
+# on a listener of its own instead, by default on localhost only.
+
+class TelegramWebhookHandler(tornado.web.RequestHandler):
+    SUPPORTED_METHODS = ("POST",)
+
+    def initialize(self, bot_application: Application, secret_token: str) -> None:
+        # "application" is taken by tornado for its own Application
+        self.bot_application = bot_application
+        self.secret_token = secret_token
+
+    async def post(self) -> None:
+        if self.request.headers.get("Content-Type") != "application/json":
+            raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+        if self.secret_token:
+            token = self.request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+                raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.bot_application.bot)
+        except Exception as e:
+            logging.error(f"Failed to parse an update from the webhook: {e}")
+            raise tornado.web.HTTPError(HTTPStatus.BAD_REQUEST)
+        if update:
+            await self.bot_application.update_queue.put(update)
+        self.set_status(HTTPStatus.OK)
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def initialize(self, registry: Registry, token: str = None) -> None:
+        self.registry = registry
+        self.token = token
+
+    def get(self) -> None:
+        if self.token:
+            authorization = self.request.headers.get("Authorization", "")
+            if not hmac.compare_digest(authorization.encode(), f"Bearer {self.token}".encode()):
+                raise tornado.web.HTTPError(HTTPStatus.UNAUTHORIZED)
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(self.registry.render())
+
+def make_app(application: Application, url_path: str, secret_token: str = None, registry: Registry = REGISTRY,
+             metrics_token: str = None) -> tornado.web.Application:
+    handlers = [(rf"/{url_path.strip('/')}/?", TelegramWebhookHandler, {"bot_application": application, "secret_token": secret_token})]
+    if metrics_token:
+        handlers.append((r"/metrics", MetricsHandler, {"registry": registry, "token": metrics_token}))
+    return tornado.web.Application(handlers)
+
+def make_metrics_app(registry: Registry = REGISTRY, token: str = None) -> tornado.web.Application:
+    return tornado.web.Application([(r"/metrics", MetricsHandler, {"registry": registry, "token": token})])
+
+async def set_webhook(application: Application, webhook_url: str, secret_token: Optional[str], drop_pending_updates: bool,
+                      bootstrap_retries: int) -> None:
+    retries = 0
+    while True:
+        try:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=drop_pending_updates,
+                secret_token=secret_token,
+            )
+            return
+        except TelegramError as e:
+            if isinstance(e, InvalidToken) or 0 <= bootstrap_retries <= retries:
+                raise
+            retries += 1
+            logging.warning(f"Failed to set the webhook, retrying: {e}")
+            await asyncio.sleep(e.retry_after + 0.5 if isinstance(e, RetryAfter) else 1)
+
+async def serve_webhook(application: Application, listen: str, port: int, url_path: str, webhook_url: str, secret_token: str = None,
+                        drop_pending_updates: bool = False, bootstrap_retries: int = 0, metrics_token: str = None,
+                        metrics_listen: str = "127.0.0.1", metrics_port: int = None) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    servers = [HTTPServer(make_app(application, url_path, secret_token, metrics_token=None if metrics_port else metrics_token), xheaders=True)]
+    servers[0].listen(port, address=listen)
+    if metrics_port:
+        servers.append(HTTPServer(make_metrics_app(token=metrics_token)))
+        servers[1].listen(metrics_port, address=metrics_listen)
+    try:
+        await set_webhook(application, webhook_url, secret_token, drop_pending_updates, bootstrap_retries)
+        await application.start()
+        await stop.wait()
+    finally:
+        for server in servers:
+            server.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+def run_webhook(application: Application, listen: str, port: int, url_path: str, webhook_url: str, secret_token: str = None,
+                drop_pending_updates: bool = False, bootstrap_retries: int = 0, metrics_token: str = None,
+                metrics_listen: str = "127.0.0.1", metrics_port: int = None) -> None:
+    asyncio.run(serve_webhook(application, listen, port, url_path, webhook_url, secret_token, drop_pending_updates,
+                              bootstrap_retries, metrics_token, metrics_listen, metrics_port))
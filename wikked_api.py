@@ -1,38 +1,229 @@
-import requests
-import json
+import asyncio
+import importlib.util
 import os
+import time
+import httpx
 from Entry import Entry
+from entry_cache import EntryCache, normalize_key
+from single_flight import SingleFlight
+from metrics import REGISTRY
+from timings import stage
+from resilience import Backoff, CircuitBreaker, LatencyWindow, UpstreamError
+from key_pool import KeyPool, RequestPriority
 from dotenv import load_dotenv
-from enums import UserData
+
+# HTTP/2 is only negotiated when the optional 'h2' package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+UPSTREAM_SECONDS = REGISTRY.histogram("upstream_request_seconds", "Dictionary API request time", ("endpoint",))
+
+def retry_after(response: httpx.Response) -> float:
+    try:
+        return float(response.headers.get("retry-after", ""))
+    except ValueError:
+        return None
 
 class WikkedAPI:
-    def __init__(self):
+    def __init__(self, base_url: str = None, scheme: str = None, max_concurrency: int = None, cache: EntryCache = None,
+                 keys: KeyPool = None):
         load_dotenv()
-        self.base_url = os.getenv("API_BASE_URL")
-        self.rapidapi_key = os.getenv("RAPIDAPI_KEY")
-        self.headers = {
-            "x-rapidapi-key": self.rapidapi_key,
-            "x-rapidapi-host": self.base_url
-        }
-        self.fetch_url = f"https://{self.base_url}/entries/"
-    
-    def fetch(self, requested_entry: str) -> Entry:
-        response = requests.get(self.fetch_url + requested_entry, headers=self.headers)
-        entry_json = json.loads(response.text)
+        self.base_url = base_url or os.getenv("API_BASE_URL")
+        self.scheme = scheme or os.getenv("API_SCHEME", "https")
+        # Every request picks its key, and with it the host, from the pool
+        self.keys = keys or KeyPool.from_env(self.base_url)
+        self.fetch_path = "/entries/"
+        self.random_path = "/random"
+
+        self.timeout = httpx.Timeout(
+            float(os.getenv("API_TIMEOUT", 10.0)),
+            connect=float(os.getenv("API_CONNECT_TIMEOUT", 3.0)),
+            read=float(os.getenv("API_READ_TIMEOUT", 5.0)),
+            pool=float(os.getenv("API_POOL_TIMEOUT", 2.0)),
+        )
+        # Every request is retried on timeouts, connection errors, 429 and 5xx within
+        # an overall deadline, can be hedged with a duplicate once it is slower than
+        # the recent p95, and isn't sent at all while the circuit breaker is open
+        self.deadline = float(os.getenv("API_DEADLINE", 12.0))
+        self.retries = int(os.getenv("API_RETRIES", 2))
+        self.backoff = Backoff()
+        self.hedging = os.getenv("API_HEDGE", "false").lower() == "true"
+        self.hedge_quantile = float(os.getenv("API_HEDGE_QUANTILE", 0.95))
+        self.latencies = LatencyWindow()
+        self.breaker = CircuitBreaker()
+        self.stats = {"errors": 0, "timeouts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "stale_served": 0}
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv("API_MAX_CONNECTIONS", 20)),
+            max_keepalive_connections=int(os.getenv("API_MAX_KEEPALIVE", 10)),
+            keepalive_expiry=float(os.getenv("API_KEEPALIVE_EXPIRY", 30.0)),
+        )
+        self.http2 = HTTP2_AVAILABLE and os.getenv("API_HTTP2", "true").lower() != "false"
+        self.semaphore = asyncio.Semaphore(max_concurrency or int(os.getenv("API_MAX_CONCURRENCY", 16)))
+        self._client: httpx.AsyncClient = None
+        self.cache = cache
+        # Users asking for the same word at once share one upstream call and one parsed Entry
+        self.flights = SingleFlight()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so the pool is bound to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.keys.save()
+
+    async def _get_json(self, path: str, endpoint: str, priority: int) -> dict:
+        # The response body, {} for a 404; raises UpstreamError when there is no usable answer
+        try:
+            async with asyncio.timeout(self.deadline):
+                return await self._get_with_retries(path, endpoint, priority)
+        except TimeoutError:
+            self.stats["timeouts"] += 1
+            raise UpstreamError(f"No answer from {endpoint} within {self.deadline}s") from None
+
+    async def _get_with_retries(self, path: str, endpoint: str, priority: int) -> dict:
+        attempt = 0
+        while True:
+            await self.breaker.before_request()
+            try:
+                payload = await self._get_hedged(path, endpoint, priority)
+            except UpstreamError as e:
+                if e.throttled:
+                    self.breaker.abandon()
+                else:
+                    self.breaker.record_failure()
+                self.stats["errors"] += 1
+                if not e.retryable or (attempt == self.retries and not e.throttled):
+                    raise
+                self.stats["retries"] += 1
+                # A throttled key is benched by the pool and the retry waits for another
+                # one, bounded by the deadline rather than the retry count
+                if not e.throttled:
+                    await asyncio.sleep(self.backoff.delay(attempt, e.retry_after))
+                    attempt += 1
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            else:
+                self.breaker.record_success()
+                return payload
+
+    async def _get_hedged(self, path: str, endpoint: str, priority: int) -> dict:
+        delay = self.latencies.quantile(self.hedge_quantile) if self.hedging else None
+        if delay is None:
+            return await self._get_once(path, endpoint, priority)
+        tasks = [asyncio.ensure_future(self._get_once(path, endpoint, priority))]
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.stats["hedges"] += 1
+                tasks.append(asyncio.ensure_future(self._get_once(path, endpoint, priority)))
+                pending = set(tasks)
+            error = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _get_once(self, path: str, endpoint: str, priority: int) -> dict:
+        key = await self.keys.acquire(priority)
+        async with self.semaphore:
+            start = time.perf_counter()
+            try:
+                response = await self.client.get(key.url(self.scheme, path), headers=key.headers)
+            except httpx.TimeoutException as e:
+                self.stats["timeouts"] += 1
+                raise UpstreamError(f"{endpoint} timed out: {e!r}") from e
+            except httpx.TransportError as e:
+                raise UpstreamError(f"{endpoint} request failed: {e!r}") from e
+            seconds = time.perf_counter() - start
+            UPSTREAM_SECONDS.observe(seconds, endpoint)
+
+        self.keys.record(key, response.status_code, response.headers)
+        if response.status_code == 404:
+            return {}
+        if response.status_code == 429:
+            self.keys.throttle(key, retry_after(response))
+            raise UpstreamError(f"{endpoint} answered 429 for key {key.id}", throttled=True)
+        if response.status_code >= 500:
+            raise UpstreamError(f"{endpoint} answered {response.status_code}", retry_after=retry_after(response))
+        if response.status_code != 200:
+            # Bad key, plan or request: trying again won't help
+            raise UpstreamError(f"{endpoint} answered {response.status_code}", retryable=False)
+        try:
+            payload = response.json()
+        except ValueError as e:
+            raise UpstreamError(f"{endpoint} answered with invalid JSON") from e
+        if not isinstance(payload, dict):
+            raise UpstreamError(f"{endpoint} answered with unexpected JSON")
+        self.latencies.add(seconds)
+        return payload
+
+    async def fetch(self, requested_entry: str, priority: int = RequestPriority.INTERACTIVE) -> Entry:
+        requested_entry = normalize_key(requested_entry)
+        if self.cache is not None:
+            cached = await self.cache.get(requested_entry)
+            if cached is not None:
+                return cached
+        try:
+            return await self.flights.do(requested_entry, lambda: self._fetch_uncached(requested_entry, priority))
+        except UpstreamError:
+            # An outdated entry beats an error while upstream is failing
+            stale = await self.cache.get_stale(requested_entry) if self.cache is not None else None
+            if stale is None:
+                raise
+            self.stats["stale_served"] += 1
+            return stale
+
+    async def refresh(self, requested_entry: str, priority: int = RequestPriority.BACKGROUND) -> Entry:
+        # Fetched from upstream even when cached, replacing the cached entry
+        requested_entry = normalize_key(requested_entry)
+        return await self.flights.do(requested_entry, lambda: self._fetch_uncached(requested_entry, priority))
+
+    async def _fetch_uncached(self, requested_entry: str, priority: int) -> Entry:
+        entry_json = await self._get_json(self.fetch_path + requested_entry, "entries", priority)
         if "entry" not in entry_json or "etymologies" not in entry_json:
-            return Entry()
-        entry = Entry.from_json(entry_json)
+            entry_json, entry = None, Entry()
+        else:
+            with stage("parse"):
+                entry = Entry.from_json(entry_json)
+
+        if self.cache is not None:
+            await self.cache.put(requested_entry, entry_json, entry)
         return entry
 
-    def fetch_random(self) -> Entry:
-        response = requests.get(f"https://{self.base_url}/random", headers=self.headers)
-        random_entry_json = json.loads(response.text)
+    async def fetch_random(self, priority: int = RequestPriority.INTERACTIVE) -> Entry:
+        random_entry_json = await self._get_json(self.random_path, "random", priority)
         if "entry" not in random_entry_json or "etymologies" not in random_entry_json:
             return Entry()
-        random_entry = Entry.from_json(random_entry_json)
+        with stage("parse"):
+            random_entry = Entry.from_json(random_entry_json)
+        if self.cache is not None and not random_entry.redirected_from:
+            # Seeds the shared cache so views can get the entry back by its headword
+            await self.cache.put(random_entry.entry, random_entry_json, random_entry)
         return random_entry
 
 if __name__ == "__main__":
-    wikked_api = WikkedAPI()
-    example = wikked_api.fetch("apple")
-    print(example)
\ No newline at end of file
+    async def main():
+        wikked_api = WikkedAPI()
+        example = await wikked_api.fetch("apple")
+        print(example)
+        await wikked_api.close()
+    asyncio.run(main())